@@ -0,0 +1,106 @@
+import com.android.apksig.ApkSigner;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Paths;
+import java.security.KeyFactory;
+import java.security.PrivateKey;
+import java.security.cert.Certificate;
+import java.security.cert.CertificateFactory;
+import java.security.cert.X509Certificate;
+import java.security.spec.PKCS8EncodedKeySpec;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * 常驻签名进程，由 apksign.py 通过 stdin/stdout 驱动：
+ *   java -cp apksigner.jar SignServer.java
+ *
+ * 请求（一行，制表符分隔）:
+ *   SIGN  输入APK  输出APK  pk8私钥  x509证书  v1签名名称  最低SDK
+ *   QUIT
+ * 响应:
+ *   OK    耗时毫秒
+ *   ERR   错误信息
+ *
+ * 密钥和证书只在第一次使用时解析，之后的请求直接复用。
+ */
+public class SignServer {
+    private static final Map<String, ApkSigner.SignerConfig> SIGNERS = new HashMap<>();
+
+    private static ApkSigner.SignerConfig loadSigner(String keyPath, String certPath, String name)
+            throws Exception {
+        String cacheKey = keyPath + "\n" + certPath + "\n" + name;
+        ApkSigner.SignerConfig signer = SIGNERS.get(cacheKey);
+        if (signer != null) {
+            return signer;
+        }
+
+        byte[] keyBytes = Files.readAllBytes(Paths.get(keyPath));
+        PrivateKey key = null;
+        for (String algorithm : new String[] {"RSA", "EC", "DSA"}) {
+            try {
+                key = KeyFactory.getInstance(algorithm).generatePrivate(new PKCS8EncodedKeySpec(keyBytes));
+                break;
+            } catch (Exception ignored) {
+                // 尝试下一种算法
+            }
+        }
+        if (key == null) {
+            throw new IllegalArgumentException("unsupported private key: " + keyPath);
+        }
+
+        List<X509Certificate> certs = new ArrayList<>();
+        try (InputStream in = new FileInputStream(certPath)) {
+            for (Certificate cert : CertificateFactory.getInstance("X.509").generateCertificates(in)) {
+                certs.add((X509Certificate) cert);
+            }
+        }
+
+        signer = new ApkSigner.SignerConfig.Builder(name, key, certs).build();
+        SIGNERS.put(cacheKey, signer);
+        return signer;
+    }
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintStream out = new PrintStream(System.out, true, "UTF-8");
+        out.println("READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t");
+            if (parts[0].equals("QUIT")) {
+                break;
+            }
+            long start = System.nanoTime();
+            try {
+                if (!parts[0].equals("SIGN") || parts.length != 7) {
+                    throw new IllegalArgumentException("bad request: " + line);
+                }
+                ApkSigner.SignerConfig signer = loadSigner(parts[3], parts[4], parts[5]);
+                new ApkSigner.Builder(Collections.singletonList(signer))
+                        .setInputApk(new File(parts[1]))
+                        .setOutputApk(new File(parts[2]))
+                        .setV1SigningEnabled(true)
+                        .setV2SigningEnabled(true)
+                        .setV3SigningEnabled(false)
+                        .setMinSdkVersion(Integer.parseInt(parts[6]))
+                        .build()
+                        .sign();
+                out.println("OK\t" + (System.nanoTime() - start) / 1000000);
+            } catch (Throwable e) {
+                out.println("ERR\t" + String.valueOf(e).replace('\n', ' ').replace('\r', ' '));
+            }
+        }
+    }
+}
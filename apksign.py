@@ -0,0 +1,432 @@
+import atexit
+import base64
+import hashlib
+import itertools
+import os
+import struct
+import subprocess
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+STDERR_LINES = 50  # 签名进程出错时附带的 stderr 行数
+
+
+class SigningWorker:
+    """
+    常驻 JVM 签名进程：首次签名时启动，进程退出时关闭
+    同一进程内的多次签名共用一个 JVM 和已解析的密钥
+    """
+
+    def __init__(self, apksigner_path, server_source):
+        self.apksigner_path = apksigner_path
+        self.server_source = server_source
+        self.process = None
+        self.latencies = []
+        self.stderr_lines = deque(maxlen=STDERR_LINES)
+        self.stderr_thread = None
+
+    def _drain_stderr(self, process, lines):
+        # JVM 的警告和 GC 日志写满管道会阻塞签名进程，持续读出并只保留最后几行
+        for line in process.stderr:
+            lines.append(line.rstrip())
+
+    def _stderr_tail(self):
+        """等待 stderr 读完（进程已退出时），返回最后几行"""
+        if self.stderr_thread is not None:
+            self.stderr_thread.join(timeout=1)
+        return "\n".join(self.stderr_lines)
+
+    def start(self):
+        """启动签名进程并等待其就绪"""
+        # 单文件源码启动需要 JDK 11+
+        self.process = subprocess.Popen(
+            ["java", "-cp", self.apksigner_path, self.server_source],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace", bufsize=1,
+        )
+        self.stderr_lines = deque(maxlen=STDERR_LINES)
+        self.stderr_thread = threading.Thread(target=self._drain_stderr, args=(self.process, self.stderr_lines),
+                                              daemon=True)
+        self.stderr_thread.start()
+        line = self.process.stdout.readline().strip()
+        if line != "READY":
+            self.close()
+            error = self._stderr_tail()
+            raise RuntimeError(f"签名进程启动失败: {error.strip() or line}")
+
+    def sign(self, input_apk, output_apk, key_path, cert_path, signer_name, min_sdk):
+        """
+        签名一个 APK，返回 (是否成功, 错误信息, 总耗时毫秒, JVM 内耗时毫秒)
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        start = time.perf_counter()
+        request = "\t".join(["SIGN", input_apk, output_apk, key_path, cert_path,
+                             signer_name, str(min_sdk)])
+        self.process.stdin.write(request + "\n")
+        self.process.stdin.flush()
+        response = self.process.stdout.readline().rstrip("\n")
+        elapsed = (time.perf_counter() - start) * 1000
+        if not response:
+            self.close()
+            error = self._stderr_tail()
+            return False, "签名进程意外退出" + (f":\n{error}" if error else ""), elapsed, 0
+        status, _, detail = response.partition("\t")
+        if status != "OK":
+            return False, detail, elapsed, 0
+        self.latencies.append(elapsed)
+        return True, "", elapsed, int(detail)
+
+    def close(self):
+        """关闭签名进程"""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write("QUIT\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+
+_worker = None
+_worker_failed = False
+
+
+def get_worker(apksigner_path, server_source):
+    """
+    返回当前进程的常驻签名进程，第一次调用时启动
+    无法启动时（例如只有 JRE）返回 None，调用方应退回到逐个 java -jar 签名
+    """
+    global _worker, _worker_failed
+    if _worker is not None:
+        return _worker
+    if _worker_failed:
+        return None
+    worker = SigningWorker(apksigner_path, server_source)
+    try:
+        worker.start()
+    except Exception as e:
+        print(f"警告: 无法启动常驻签名进程，将使用 java -jar 逐个签名 ({e})")
+        _worker_failed = True
+        return None
+    _worker = worker
+    atexit.register(worker.close)
+    return worker
+
+
+# ---------------------------------------------------------------------------
+# 进程内 v1 + v2 签名（纯 Python，无需 Java）
+# ---------------------------------------------------------------------------
+
+CHUNK_SIZE = 1024 * 1024  # v2 签名按 1MB 分块计算摘要
+SIGNATURE_ALGORITHM_RSA_PKCS1_SHA256 = 0x0103
+APK_SIGNATURE_SCHEME_V2_ID = 0x7109871A
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+CREATED_BY = "1.0 (Android)"
+
+# DER 编码的常量
+SHA256_ALGORITHM = bytes.fromhex("300d06096086480165030402010500")
+RSA_ALGORITHM = bytes.fromhex("300d06092a864886f70d0101010500")
+SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+OID_SIGNED_DATA = bytes.fromhex("06092a864886f70d010702")
+OID_DATA = bytes.fromhex("06092a864886f70d010701")
+
+
+def _der_read(data, pos):
+    """读取一个 DER TLV，返回 (tag, 内容起始, 结束位置)"""
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[pos:pos + size], "big")
+        pos += size
+    return tag, pos, pos + length
+
+
+def _der_children(data, start, end):
+    """列出一个 DER 结构的所有子元素 (tag, TLV起始, 内容起始, 结束)"""
+    children = []
+    pos = start
+    while pos < end:
+        tag, content, next_pos = _der_read(data, pos)
+        children.append((tag, pos, content, next_pos))
+        pos = next_pos
+    return children
+
+
+def _der(tag, content):
+    """编码一个 DER TLV"""
+    size = len(content)
+    if size < 0x80:
+        header = bytes([tag, size])
+    else:
+        length = size.to_bytes((size.bit_length() + 7) // 8, "big")
+        header = bytes([tag, 0x80 | len(length)]) + length
+    return header + content
+
+
+def _lp(data):
+    """APK 签名块中使用的 uint32 长度前缀"""
+    return struct.pack("<I", len(data)) + data
+
+
+class SigningKey:
+    """从 .pk8 私钥和 .x509.pem 证书加载的 RSA 签名密钥"""
+
+    def __init__(self, pk8_path, cert_path):
+        with open(pk8_path, "rb") as f:
+            pk8 = f.read()
+        # PrivateKeyInfo ::= SEQUENCE { version, algorithm, privateKey OCTET STRING }
+        _, start, end = _der_read(pk8, 0)
+        _, algorithm, _, _ = _der_children(pk8, start, end)[1]
+        if pk8[algorithm:algorithm + len(RSA_ALGORITHM)] != RSA_ALGORITHM:
+            raise ValueError(f"{pk8_path} 不是 RSA 私钥，进程内签名只支持 RSA")
+        _, _, key_start, key_end = _der_children(pk8, start, end)[2]
+        _, start, end = _der_read(pk8, key_start)
+        numbers = [int.from_bytes(pk8[content:child_end], "big")
+                   for _, _, content, child_end in _der_children(pk8, start, end)]
+        _, self.n, self.e, self.d, self.p, self.q, self.dp, self.dq, self.qinv = numbers[:9]
+        self.size = (self.n.bit_length() + 7) // 8
+
+        with open(cert_path, "r", encoding="ascii") as f:
+            pem = f.read()
+        body = pem.split("-----BEGIN CERTIFICATE-----")[1].split("-----END CERTIFICATE-----")[0]
+        self.cert = base64.b64decode("".join(body.split()))
+        # TBSCertificate ::= SEQUENCE { [0] version, serial, signature, issuer, validity, subject, spki, ... }
+        _, start, end = _der_read(self.cert, 0)
+        _, _, tbs_start, tbs_end = _der_children(self.cert, start, end)[0]
+        fields = _der_children(self.cert, tbs_start, tbs_end)
+        if fields[0][0] == 0xA0:
+            fields = fields[1:]
+        self.serial = self.cert[fields[0][1]:fields[0][3]]
+        self.issuer = self.cert[fields[2][1]:fields[2][3]]
+        self.public_key = self.cert[fields[5][1]:fields[5][3]]
+
+    def sign(self, data):
+        """RSASSA-PKCS1-v1_5 + SHA-256 签名"""
+        digest_info = SHA256_DIGEST_INFO + hashlib.sha256(data).digest()
+        padded = b"\x00\x01" + b"\xff" * (self.size - len(digest_info) - 3) + b"\x00" + digest_info
+        m = int.from_bytes(padded, "big")
+        # 中国剩余定理加速
+        s1 = pow(m, self.dp, self.p)
+        s2 = pow(m, self.dq, self.q)
+        s = s2 + self.q * ((self.qinv * (s1 - s2)) % self.p)
+        return s.to_bytes(self.size, "big")
+
+
+def _chunk_digest(chunk):
+    return hashlib.sha256(b"\xa5" + struct.pack("<I", len(chunk)) + chunk).digest()
+
+
+class ChunkDigester:
+    """
+    边写边计算 v2 分块摘要：每满 1MB 就交给线程池计算（hashlib 会释放 GIL）
+    """
+
+    def __init__(self, executor, max_pending=16):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.buffer = bytearray()
+        self.futures = []
+        self.resolved = 0
+
+    def update(self, data):
+        self.buffer += data
+        while len(self.buffer) >= CHUNK_SIZE:
+            chunk = bytes(self.buffer[:CHUNK_SIZE])
+            del self.buffer[:CHUNK_SIZE]
+            self.futures.append(self.executor.submit(_chunk_digest, chunk))
+            # 限制排队的分块数量，避免写入快于摘要时占用过多内存
+            while len(self.futures) - self.resolved > self.max_pending:
+                self.futures[self.resolved].result()
+                self.resolved += 1
+
+    def checkpoint(self):
+        """只记录分块数和未满一块的数据长度，数据本身在恢复时从输出文件读回"""
+        return len(self.futures), len(self.buffer)
+
+    def restore(self, state, read_back):
+        """回到检查点：read_back(size) 返回检查点之前最后 size 字节的数据"""
+        chunks, buffered = state
+        del self.futures[chunks:]
+        self.resolved = min(self.resolved, chunks)
+        self.buffer = bytearray(read_back(buffered))
+
+    def finish(self):
+        """返回所有分块摘要"""
+        digests = [future.result() for future in self.futures]
+        if self.buffer:
+            digests.append(_chunk_digest(bytes(self.buffer)))
+        return digests
+
+
+def _section_digests(data):
+    return [_chunk_digest(data[pos:pos + CHUNK_SIZE]) for pos in range(0, len(data), CHUNK_SIZE)]
+
+
+def v1_signer_basename(name):
+    """与 apksigner 相同的 v1 签名文件名规则：大写、非法字符替换为 _、最多 8 个字符"""
+    safe = "".join(c if c.isascii() and (c.isalnum() or c in "-_") else "_" for c in name.upper())
+    return safe[:8]
+
+
+def is_signature_entry(name):
+    """是否为旧的 JAR 签名文件（重新签名时需要移除）"""
+    if not name.startswith("META-INF/") or "/" in name[len("META-INF/"):]:
+        return False
+    base = name[len("META-INF/"):].upper()
+    return (base == "MANIFEST.MF" or base.startswith("SIG-")
+            or base.endswith((".SF", ".RSA", ".DSA", ".EC")))
+
+
+def _manifest_attribute(name, value):
+    """写出一个清单属性，按 JAR 规范每行最多 72 字节，续行以空格开头"""
+    data = f"{name}: {value}".encode("utf-8")
+    lines = [data[:72]]
+    for pos in range(72, len(data), 71):
+        lines.append(b" " + data[pos:pos + 71])
+    return b"".join(line + b"\r\n" for line in lines)
+
+
+class _EntryDigest:
+    """对写出的压缩数据边解压边计算 SHA-256（v1 MANIFEST.MF 使用）"""
+
+    def __init__(self, method):
+        self.hash = hashlib.sha256()
+        self.inflater = zlib.decompressobj(-15) if method == 8 else None
+        if method not in (0, 8):
+            raise ValueError(f"不支持的压缩方式 {method}")
+
+    def update(self, data):
+        self.hash.update(self.inflater.decompress(data) if self.inflater else data)
+
+    def digest(self):
+        if self.inflater:
+            self.hash.update(self.inflater.flush())
+        return self.hash.digest()
+
+
+class InProcessSigner:
+    """
+    v1 + v2 签名会话，由 apkzip.ApkWriter 在写出过程中驱动：
+    - 写出的每个条目边解压边计算摘要，用于 MANIFEST.MF
+    - 条目区的字节同时送入 ChunkDigester，写完即得到 v2 分块摘要
+    - 关闭时追加 v1 签名文件，并在中央目录前插入 APK 签名块
+    """
+
+    def __init__(self, key, signer_name, jobs=None):
+        self.key = key
+        self.basename = v1_signer_basename(signer_name)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self.digester = ChunkDigester(self.executor)
+        self.entry_digests = {}
+        self.finished = False
+
+    def skip_entry(self, name):
+        """旧签名文件不再复制到输出中"""
+        return is_signature_entry(name)
+
+    def entry_digest(self, name, method):
+        """开始计算一个条目的摘要，不需要写入清单的条目返回 None"""
+        if name.endswith("/") or is_signature_entry(name):
+            return None
+        return _EntryDigest(method)
+
+    def add_entry_digest(self, name, digest):
+        self.entry_digests[name] = digest
+
+    def checkpoint(self):
+        """保存条目摘要和分块摘要的状态（见 ApkWriter.checkpoint）"""
+        return len(self.entry_digests), self.digester.checkpoint()
+
+    def restore(self, state, read_back):
+        digest_count, digester_state = state
+        # 条目摘要按写出顺序加入，保留前 digest_count 个即可
+        self.entry_digests = dict(itertools.islice(self.entry_digests.items(), digest_count))
+        if self.finished:
+            # 检查点之前的分块摘要都已算完，旧线程池关闭不影响这些结果
+            self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+            self.digester.executor = self.executor
+            self.finished = False
+        self.digester.restore(digester_state, read_back)
+
+    def v1_files(self):
+        """生成 MANIFEST.MF、.SF 和 .RSA 文件内容"""
+        manifest = (_manifest_attribute("Manifest-Version", "1.0")
+                    + _manifest_attribute("Created-By", CREATED_BY) + b"\r\n")
+        sections = []
+        for name in sorted(self.entry_digests):
+            section = (_manifest_attribute("Name", name)
+                       + _manifest_attribute("SHA-256-Digest",
+                                             base64.b64encode(self.entry_digests[name]).decode())
+                       + b"\r\n")
+            sections.append((name, section))
+            manifest += section
+
+        signature_file = (
+            _manifest_attribute("Signature-Version", "1.0")
+            + _manifest_attribute("Created-By", CREATED_BY)
+            + _manifest_attribute("SHA-256-Digest-Manifest",
+                                  base64.b64encode(hashlib.sha256(manifest).digest()).decode())
+            + _manifest_attribute("X-Android-APK-Signed", "2")
+            + b"\r\n"
+        )
+        for name, section in sections:
+            signature_file += (_manifest_attribute("Name", name)
+                               + _manifest_attribute("SHA-256-Digest",
+                                                     base64.b64encode(hashlib.sha256(section).digest()).decode())
+                               + b"\r\n")
+
+        # PKCS#7 SignedData，分离式签名 .SF 文件
+        signer_info = _der(0x30, b"".join([
+            _der(0x02, b"\x01"),
+            _der(0x30, self.key.issuer + self.key.serial),
+            SHA256_ALGORITHM,
+            RSA_ALGORITHM,
+            _der(0x04, self.key.sign(signature_file)),
+        ]))
+        signed_data = _der(0x30, b"".join([
+            _der(0x02, b"\x01"),
+            _der(0x31, SHA256_ALGORITHM),
+            _der(0x30, OID_DATA),
+            _der(0xA0, self.key.cert),
+            _der(0x31, signer_info),
+        ]))
+        signature_block = _der(0x30, OID_SIGNED_DATA + _der(0xA0, signed_data))
+
+        return [
+            ("META-INF/MANIFEST.MF", manifest),
+            (f"META-INF/{self.basename}.SF", signature_file),
+            (f"META-INF/{self.basename}.RSA", signature_block),
+        ]
+
+    def signing_block(self, central_directory, end_record):
+        """根据条目区、中央目录和 EOCD 的分块摘要生成 v2 签名块"""
+        chunks = self.digester.finish()
+        chunks += _section_digests(central_directory)
+        chunks += _section_digests(end_record)
+        self.executor.shutdown()
+        self.finished = True
+        content_digest = hashlib.sha256(
+            b"\x5a" + struct.pack("<I", len(chunks)) + b"".join(chunks)).digest()
+
+        algorithm = struct.pack("<I", SIGNATURE_ALGORITHM_RSA_PKCS1_SHA256)
+        signed_data = (_lp(_lp(algorithm + _lp(content_digest)))
+                       + _lp(_lp(self.key.cert))
+                       + _lp(b""))
+        signer = (_lp(signed_data)
+                  + _lp(_lp(algorithm + _lp(self.key.sign(signed_data))))
+                  + _lp(self.key.public_key))
+        value = _lp(_lp(signer))
+        pair = struct.pack("<QI", len(value) + 4, APK_SIGNATURE_SCHEME_V2_ID) + value
+        block_size = len(pair) + 8 + len(APK_SIG_BLOCK_MAGIC)
+        return (struct.pack("<Q", block_size) + pair
+                + struct.pack("<Q", block_size) + APK_SIG_BLOCK_MAGIC)
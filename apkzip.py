@@ -0,0 +1,516 @@
+import array
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# zip 结构定义
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+COPY_BUFFER_SIZE = 1024 * 1024
+MAX_ZIP_OFFSET = 0xFFFFFFFF
+
+# 对齐参数（与 zipalign -p 4 一致，.so 按 16KB 页对齐）
+DEFAULT_ALIGNMENT = 4
+LIBRARY_ALIGNMENT = 16384
+ALIGNMENT_EXTRA_ID = 0xD935
+ALIGNMENT_EXTRA = struct.Struct("<HHH")
+
+
+# 中央目录索引的字段及 array 类型码（I 在常见平台上都是 4 字节）
+INDEX_FIELDS = (
+    ("record", "I"),  # 中央目录记录在原始数据中的偏移
+    ("name_length", "H"),
+    ("flag", "H"),
+    ("method", "H"),
+    ("crc", "I"),
+    ("compress_size", "I"),
+    ("file_size", "I"),
+    ("header_offset", "I"),
+    ("order", "I"),  # 按名称排序的条目序号，用于查找和前缀查询
+)
+INDEX_MAGIC = b"FZI1"
+INDEX_HEADER = struct.Struct("<4sLQ")  # 标识, 条目数, 中央目录大小
+
+_mapped_files = {}  # 绝对路径 -> ((大小, 修改时间), 映射)
+
+
+class ZipEntry:
+    """中央目录中的一个条目"""
+
+    __slots__ = (
+        "name", "raw_name", "made_by", "version", "flag", "method",
+        "dos_time", "dos_date", "crc", "compress_size", "file_size",
+        "extra", "comment", "internal_attr", "external_attr", "header_offset",
+    )
+
+    def __init__(self, **fields):
+        for key in self.__slots__:
+            setattr(self, key, fields.get(key))
+
+
+def _find_end_record(fp):
+    """定位 EOCD 记录，返回 (偏移, 记录字段)"""
+    fp.seek(0, os.SEEK_END)
+    file_size = fp.tell()
+    search_size = min(file_size, END_RECORD.size + 0xFFFF)
+    fp.seek(file_size - search_size)
+    data = fp.read(search_size)
+    pos = data.rfind(END_SIGNATURE)
+    while pos >= 0:
+        if pos + END_RECORD.size <= len(data):
+            record = END_RECORD.unpack_from(data, pos)
+            if pos + END_RECORD.size + record[7] <= len(data):
+                return file_size - search_size + pos, record
+        pos = data.rfind(END_SIGNATURE, 0, pos)
+    raise ValueError("找不到 zip 中央目录结束记录，文件可能不是有效的 APK")
+
+
+def map_readonly(path):
+    """
+    以只读方式内存映射文件（底包），同一进程中多次调用返回同一个映射，文件变化后重新映射
+    返回的对象支持 read/seek/tell，可以直接传给 ZipIndex.parse、copy_entry 等函数
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    mapped = _mapped_files.get(key)
+    if mapped is not None and mapped[0] == (stat.st_size, stat.st_mtime_ns) and not mapped[1].closed:
+        return mapped[1]
+    with open(path, "rb") as f:
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _mapped_files[key] = ((stat.st_size, stat.st_mtime_ns), view)
+    return view
+
+
+def unmap(path):
+    """关闭文件的映射（Windows 上映射中的文件不能被替换）"""
+    mapped = _mapped_files.pop(os.path.abspath(path), None)
+    if mapped is not None:
+        mapped[1].close()
+
+
+class ZipIndex:
+    """
+    紧凑的中央目录索引：条目的偏移、大小、crc 等保存在 array 中，名称直接引用中央目录原始数据，
+    不为每个条目创建对象，需要时再按序号生成 ZipEntry
+    可以保存到文件，加载时直接内存映射，不再解析中央目录
+    """
+
+    def __init__(self, cd, columns):
+        self.cd = cd
+        self.columns = columns
+        (self.record, self.name_length, self.flag, self.method, self.crc, self.compress_size,
+         self.file_size, self.header_offset, self.order) = (columns[name] for name, _ in INDEX_FIELDS)
+
+    @classmethod
+    def parse(cls, fp):
+        """从 APK 的中央目录建立索引"""
+        _, record = _find_end_record(fp)
+        _, _, _, _, count, cd_size, cd_offset, _ = record
+        if cd_offset == MAX_ZIP_OFFSET or count == 0xFFFF:
+            raise ValueError("不支持 ZIP64 格式的 APK")
+
+        fp.seek(cd_offset)
+        cd = fp.read(cd_size)
+        columns = {name: array.array(code) for name, code in INDEX_FIELDS}
+        records, name_lengths, flags, methods, crcs, compress_sizes, file_sizes, header_offsets, _ = \
+            columns.values()
+        pos = 0
+        for _ in range(count):
+            fields = CENTRAL_HEADER.unpack_from(cd, pos)
+            if fields[0] != CENTRAL_SIGNATURE:
+                raise ValueError(f"中央目录损坏 (偏移 {cd_offset + pos})")
+            records.append(pos)
+            flags.append(fields[3])
+            methods.append(fields[4])
+            crcs.append(fields[7])
+            compress_sizes.append(fields[8])
+            file_sizes.append(fields[9])
+            name_lengths.append(fields[10])
+            header_offsets.append(fields[16])
+            pos += CENTRAL_HEADER.size + fields[10] + fields[11] + fields[12]
+        if pos > len(cd):
+            raise ValueError("中央目录不完整")
+        index = cls(cd, columns)
+        index.order.extend(sorted(range(count), key=index.raw_name))
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """内存映射保存的索引文件，格式不符时抛出 ValueError"""
+        with open(path, "rb") as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, count, cd_size = INDEX_HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} 不是中央目录索引")
+        columns = {}
+        pos = INDEX_HEADER.size
+        for name, code in INDEX_FIELDS:
+            size = array.array(code).itemsize * count
+            columns[name] = view[pos:pos + size].cast(code)
+            pos += size
+        if pos + cd_size != len(view):
+            raise ValueError(f"{path} 不完整")
+        return cls(view[pos:], columns)
+
+    def save(self, path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(self), len(self.cd)))
+            for name, _ in INDEX_FIELDS:
+                f.write(self.columns[name])
+            f.write(self.cd)
+        os.replace(temp_path, path)
+
+    def __reduce__(self):
+        # 内存映射的索引不能直接序列化（传给批量构建的子进程），复制成 bytes 和 array
+        columns = {name: array.array(code, self.columns[name]) for name, code in INDEX_FIELDS}
+        return ZipIndex, (bytes(self.cd), columns)
+
+    def __len__(self):
+        return len(self.record)
+
+    def __iter__(self):
+        return (self.entry(i) for i in range(len(self)))
+
+    def raw_name(self, i):
+        start = self.record[i] + CENTRAL_HEADER.size
+        return bytes(self.cd[start:start + self.name_length[i]])
+
+    def name(self, i):
+        return self.raw_name(i).decode("utf-8" if self.flag[i] & FLAG_UTF8 else "cp437")
+
+    def names(self):
+        return [self.name(i) for i in range(len(self))]
+
+    def entry(self, i):
+        """按序号生成完整的 ZipEntry"""
+        (_, made_by, version, flag, method, dos_time, dos_date, crc,
+         compress_size, file_size, name_len, extra_len, comment_len,
+         _, internal_attr, external_attr, header_offset) = CENTRAL_HEADER.unpack_from(self.cd, self.record[i])
+        pos = self.record[i] + CENTRAL_HEADER.size + name_len
+        return ZipEntry(
+            name=self.name(i), raw_name=self.raw_name(i), made_by=made_by, version=version,
+            flag=flag, method=method, dos_time=dos_time, dos_date=dos_date,
+            crc=crc, compress_size=compress_size, file_size=file_size,
+            extra=bytes(self.cd[pos:pos + extra_len]),
+            comment=bytes(self.cd[pos + extra_len:pos + extra_len + comment_len]),
+            internal_attr=internal_attr, external_attr=external_attr, header_offset=header_offset,
+        )
+
+    def _lower_bound(self, raw):
+        """返回第一个名称不小于 raw 的排序位置"""
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw_name(self.order[mid]) < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        """按名称查找条目序号，不存在时返回 None"""
+        raw = name.encode("utf-8")
+        pos = self._lower_bound(raw)
+        if pos < len(self.order) and self.raw_name(self.order[pos]) == raw:
+            return self.order[pos]
+        return None
+
+    def has_prefix(self, prefix):
+        """是否存在以 prefix 开头的条目（目录是否存在）"""
+        raw = prefix.encode("utf-8")
+        pos = self._lower_bound(raw)
+        return pos < len(self.order) and self.raw_name(self.order[pos]).startswith(raw)
+
+    def data_offset(self, fp, i):
+        """根据本地文件头计算条目数据的起始偏移"""
+        fp.seek(self.header_offset[i])
+        fields = LOCAL_HEADER.unpack(fp.read(LOCAL_HEADER.size))
+        if fields[0] != LOCAL_SIGNATURE:
+            raise ValueError(f"{self.name(i)} 的本地文件头损坏")
+        return self.header_offset[i] + LOCAL_HEADER.size + fields[9] + fields[10]
+
+    def read_data(self, fp, i):
+        """读取并解压一个条目的数据"""
+        fp.seek(self.data_offset(fp, i))
+        raw = fp.read(self.compress_size[i])
+        if self.method[i] == ZIP_STORED:
+            return raw
+        if self.method[i] == ZIP_DEFLATED:
+            return zlib.decompress(raw, -15)
+        raise ValueError(f"{self.name(i)} 使用了不支持的压缩方式 {self.method[i]}")
+
+    def misaligned(self, fp):
+        """检查存储模式条目的数据对齐，返回未对齐的条目名列表"""
+        misaligned = []
+        for i in range(len(self)):
+            if self.method[i] != ZIP_STORED:
+                continue
+            name = self.name(i)
+            if self.data_offset(fp, i) % entry_alignment(name):
+                misaligned.append(name)
+        return misaligned
+
+
+def entry_alignment(name):
+    """返回存储模式条目的数据需要对齐到的字节数"""
+    return LIBRARY_ALIGNMENT if name.endswith(".so") else DEFAULT_ALIGNMENT
+
+
+def strip_alignment_extra(extra):
+    """去掉旧的对齐填充，保留其它 extra 字段"""
+    kept = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, pos)
+        if pos + 4 + size > len(extra):
+            # 老版本 zipalign 直接用 0 填充，无法解析的部分视为填充丢弃
+            break
+        if header_id != ALIGNMENT_EXTRA_ID and header_id != 0:
+            kept.append(extra[pos:pos + 4 + size])
+        pos += 4 + size
+    return b"".join(kept)
+
+
+def alignment_extra(extra, data_start, alignment):
+    """在 extra 字段末尾追加填充，使数据从 alignment 的整数倍处开始"""
+    padding = (-(data_start + len(extra))) % alignment
+    if padding == 0:
+        return extra
+    while padding < ALIGNMENT_EXTRA.size:
+        padding += alignment
+    record = ALIGNMENT_EXTRA.pack(ALIGNMENT_EXTRA_ID, padding - 4, alignment)
+    return extra + record + b"\0" * (padding - ALIGNMENT_EXTRA.size)
+
+
+def dos_datetime(timestamp):
+    """把时间戳转换为 zip 使用的 DOS 时间和日期"""
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def dos_timestamp(dos_time, dos_date):
+    """把 DOS 时间和日期转换回时间戳（dos_datetime 的逆运算）"""
+    return time.mktime((
+        (dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+        dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2, 0, 0, -1,
+    ))
+
+
+def compress_bytes(data, method=ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION):
+    """压缩数据，返回 (压缩方式, crc, 压缩后数据)"""
+    crc = zlib.crc32(data)
+    if method == ZIP_STORED:
+        return ZIP_STORED, crc, data
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return ZIP_DEFLATED, crc, compressor.compress(data) + compressor.flush()
+
+
+class ApkWriter:
+    """
+    顺序写出 APK：可直接复制原始压缩数据，也可写入新条目，写出时即完成对齐
+    提供 signer（apksign.InProcessSigner）时边写边计算摘要，关闭时完成 v1 + v2 签名
+    """
+
+    def __init__(self, path, align=True, signer=None):
+        self.path = path
+        self.align = align
+        self.signer = signer
+        self.fp = open(path, "w+b")  # rewind() 需要读回检查点之前的数据
+        self.entries = []
+        self.names = set()
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fp.close()
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.offset += len(data)
+        if self.signer is not None:
+            self.signer.digester.update(data)
+
+    def _write_local_header(self, entry, extra=b""):
+        if entry.name in self.names:
+            raise ValueError(f"重复的 zip 条目: {entry.name}")
+        if self.offset > MAX_ZIP_OFFSET:
+            raise ValueError("输出 APK 超过 4GB，不支持 ZIP64")
+        if self.align and entry.method == ZIP_STORED:
+            data_start = self.offset + LOCAL_HEADER.size + len(entry.raw_name)
+            extra = alignment_extra(strip_alignment_extra(extra), data_start,
+                                    entry_alignment(entry.name))
+        self.names.add(entry.name)
+        entry.header_offset = self.offset
+        self._write(LOCAL_HEADER.pack(
+            LOCAL_SIGNATURE, entry.version, entry.flag, entry.method,
+            entry.dos_time, entry.dos_date, entry.crc, entry.compress_size,
+            entry.file_size, len(entry.raw_name), len(extra),
+        ))
+        self._write(entry.raw_name)
+        self._write(extra)
+        self.entries.append(entry)
+
+    def copy_entry(self, src_fp, entry):
+        """原样复制一个条目的压缩数据（不解压、不重新压缩）"""
+        if self.signer is not None and self.signer.skip_entry(entry.name):
+            return
+        digest = self.signer.entry_digest(entry.name, entry.method) if self.signer else None
+        src_fp.seek(entry.header_offset)
+        fields = LOCAL_HEADER.unpack(src_fp.read(LOCAL_HEADER.size))
+        if fields[0] != LOCAL_SIGNATURE:
+            raise ValueError(f"{entry.name} 的本地文件头损坏")
+        src_fp.seek(fields[9], os.SEEK_CUR)
+        local_extra = src_fp.read(fields[10])
+        copied = ZipEntry(**{key: getattr(entry, key) for key in ZipEntry.__slots__})
+        # 中央目录中已有准确的 crc 和大小，不再需要数据描述符
+        copied.flag = entry.flag & ~FLAG_DATA_DESCRIPTOR
+        self._write_local_header(copied, local_extra)
+        remaining = entry.compress_size
+        if isinstance(src_fp, mmap.mmap):
+            # 内存映射的底包：直接写出映射中的数据，不再读到临时缓冲区
+            start = src_fp.tell()
+            end = start + remaining
+            if end > len(src_fp):
+                raise ValueError(f"{entry.name} 的数据不完整")
+            with memoryview(src_fp) as view:
+                for pos in range(start, end, COPY_BUFFER_SIZE):
+                    with view[pos:min(pos + COPY_BUFFER_SIZE, end)] as chunk:
+                        self._write(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
+            src_fp.seek(end)
+            remaining = 0
+        while remaining:
+            chunk = src_fp.read(min(COPY_BUFFER_SIZE, remaining))
+            if not chunk:
+                raise ValueError(f"{entry.name} 的数据不完整")
+            self._write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            remaining -= len(chunk)
+        if digest is not None:
+            self.signer.add_entry_digest(entry.name, digest.digest())
+
+    def add_bytes(self, arcname, data, method=ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION,
+                  timestamp=None):
+        """压缩并写入一个新条目"""
+        method, crc, payload = compress_bytes(data, method, level)
+        self.add_compressed(arcname, method, crc, len(data), payload, timestamp)
+
+    def add_compressed(self, arcname, method, crc, file_size, payload, timestamp=None):
+        """写入一个已经压缩好的新条目"""
+        dos_time, dos_date = dos_datetime(time.time() if timestamp is None else timestamp)
+        raw_name = arcname.encode("utf-8")
+        flag = 0 if raw_name.isascii() else FLAG_UTF8
+        entry = ZipEntry(
+            name=arcname, raw_name=raw_name, made_by=20, version=20, flag=flag,
+            method=method, dos_time=dos_time, dos_date=dos_date, crc=crc,
+            compress_size=len(payload), file_size=file_size, extra=b"",
+            comment=b"", internal_attr=0, external_attr=0,
+        )
+        self._write_local_header(entry)
+        self._write(payload)
+        digest = self.signer.entry_digest(arcname, method) if self.signer else None
+        if digest is not None:
+            digest.update(payload)
+            self.signer.add_entry_digest(arcname, digest.digest())
+
+    def add_file(self, arcname, src_path, method=ZIP_DEFLATED, level=zlib.Z_DEFAULT_COMPRESSION):
+        """从磁盘文件写入一个新条目"""
+        with open(src_path, "rb") as f:
+            data = f.read()
+        self.add_bytes(arcname, data, method, level, timestamp=os.path.getmtime(src_path))
+
+    def checkpoint(self):
+        """
+        记录当前的写出状态，之后可以用 rewind() 回到这里，
+        只重新写出后面的条目（监视模式下每个条目之后都记录一个检查点）
+        检查点只保存计数，不复制已写出的数据，可以频繁创建
+        """
+        return {
+            "offset": self.offset,
+            "entries": len(self.entries),
+            "signer": self.signer,
+            "signer_state": self.signer.checkpoint() if self.signer is not None else None,
+        }
+
+    def _read_back(self, size):
+        """读回当前位置之前的 size 字节（检查点之前的数据不会再改变）"""
+        self.fp.seek(self.offset - size)
+        return self.fp.read(size)
+
+    def rewind(self, checkpoint):
+        """丢弃检查点之后写出的内容（包括 finish() 写出的中央目录）"""
+        self.fp.flush()
+        self.fp.seek(checkpoint["offset"])
+        self.fp.truncate()
+        self.offset = checkpoint["offset"]
+        del self.entries[checkpoint["entries"]:]
+        self.names = {entry.name for entry in self.entries}
+        self.signer = checkpoint["signer"]
+        if self.signer is not None:
+            self.signer.restore(checkpoint["signer_state"], self._read_back)
+        self.fp.seek(self.offset)
+
+    def close(self):
+        """写出中央目录和结束记录并关闭文件"""
+        self.finish()
+        self.fp.close()
+
+    def finish(self):
+        """写出中央目录和结束记录（签名时在中央目录前插入 APK 签名块），文件保持打开"""
+        if self.signer is not None:
+            for name, data in self.signer.v1_files():
+                self.add_bytes(name, data)
+        cd_offset = self.offset
+        if len(self.entries) > 0xFFFF or cd_offset > MAX_ZIP_OFFSET:
+            raise ValueError("输出 APK 条目过多或超过 4GB，不支持 ZIP64")
+        records = []
+        for entry in self.entries:
+            records.append(CENTRAL_HEADER.pack(
+                CENTRAL_SIGNATURE, entry.made_by, entry.version, entry.flag,
+                entry.method, entry.dos_time, entry.dos_date, entry.crc,
+                entry.compress_size, entry.file_size, len(entry.raw_name),
+                len(entry.extra), len(entry.comment), 0, entry.internal_attr,
+                entry.external_attr, entry.header_offset,
+            ))
+            records.extend((entry.raw_name, entry.extra, entry.comment))
+        central_directory = b"".join(records)
+
+        signing_block = b""
+        if self.signer is not None:
+            end_record = END_RECORD.pack(
+                END_SIGNATURE, 0, 0, len(self.entries), len(self.entries),
+                len(central_directory), cd_offset, 0,
+            )
+            signing_block = self.signer.signing_block(central_directory, end_record)
+            # 签名块和中央目录不属于条目区，不再计入分块摘要
+            self.signer = None
+            self._write(signing_block)
+        self._write(central_directory)
+        self._write(END_RECORD.pack(
+            END_SIGNATURE, 0, 0, len(self.entries), len(self.entries),
+            len(central_directory), cd_offset + len(signing_block), 0,
+        ))
+        self.fp.flush()
@@ -0,0 +1,370 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+
+import apkzip
+import fastbuild
+import install
+from buildcache import BuildCache
+
+# 默认参数
+DEFAULT_ENTRIES = 2000  # 底包条目数
+DEFAULT_ENTRY_SIZE = 32 * 1024  # 底包条目平均大小
+DEFAULT_COMPRESSIBILITY = 0.6  # 0 为完全随机数据，1 为完全可压缩数据
+DEFAULT_CLIENTS = 3
+DEFAULT_PACK_FILES = 400  # 每个客户端的文件数
+DEFAULT_SHARED = 0.85  # 各客户端之间内容相同的文件比例
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 0.15  # 中位耗时比基线慢 15% 以上视为性能回退
+DEFAULT_BASELINE = os.path.join("profile", "benchmark_baseline.json")  # 本机基线（profile 目录不提交），共享的基线用 --baseline 指定
+ARSC_SIZE = 4 * 1024 * 1024
+SO_SIZE = 8 * 1024 * 1024
+
+
+def random_payload(rng, size, compressibility):
+    """生成指定大小和可压缩程度的数据"""
+    random_size = int(size * (1 - compressibility))
+    text = b"minecraft:netease_" * (size // 18 + 1)
+    return rng.randbytes(random_size) + text[:size - random_size]
+
+
+def png_bytes(rng, width, height):
+    """生成一张带噪点的 RGBA PNG"""
+    rows = b"".join(b"\x00" + rng.randbytes(width * 2) + bytes(width * 2) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">L", len(data)) + kind + data + struct.pack(">L", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">LLBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b""))
+
+
+def manifest_json(name, pack_type):
+    """生成 Bedrock 包的 manifest.json"""
+    return json.dumps({
+        "format_version": 2,
+        "header": {"name": name, "uuid": str(uuid.uuid4()), "version": [1, 0, 0],
+                   "min_engine_version": [1, 16, 0]},
+        "modules": [{"type": pack_type, "uuid": str(uuid.uuid4()), "version": [1, 0, 0]}],
+    }, indent=4)
+
+
+def generate_base_apk(path, entries, entry_size, compressibility, seed):
+    """
+    生成结构与真实底包相近的 APK：resources.arsc、classes.dex、.so 以及
+    assets/resource_packs、assets/behavior_packs 和其它资源
+    """
+    rng = random.Random(seed)
+    with apkzip.ApkWriter(path) as writer:
+        writer.add_bytes("AndroidManifest.xml", random_payload(rng, 8192, 0.8))
+        writer.add_bytes("resources.arsc", random_payload(rng, ARSC_SIZE, compressibility), apkzip.ZIP_STORED)
+        writer.add_bytes("classes.dex", random_payload(rng, 2 * 1024 * 1024, 0.3))
+        writer.add_bytes("lib/arm64-v8a/libminecraftpe.so", rng.randbytes(SO_SIZE), apkzip.ZIP_STORED)
+        folders = ("assets/resource_packs/vanilla", "assets/behavior_packs/vanilla",
+                   "assets/resource_packs/vanilla_netease", "assets/Yant", "assets/gui", "res/drawable")
+        for i in range(entries):
+            size = max(1, int(rng.expovariate(1 / entry_size)))
+            folder = folders[i % len(folders)]
+            if i % 4 == 0:
+                # 已压缩的贴图按存储模式写入
+                writer.add_bytes(f"{folder}/textures/t{i}.png", rng.randbytes(size), apkzip.ZIP_STORED)
+            else:
+                writer.add_bytes(f"{folder}/data/f{i}.json", random_payload(rng, size, compressibility))
+
+
+def generate_client(data_dir, client, pack_files, seed, shared=0.0):
+    """
+    生成结构与真实客户端相近的 data/<客户端> 目录
+    shared 比例的文件在所有客户端中内容相同
+    """
+    client_rng = random.Random(f"{seed}:{client}")
+    client_dir = os.path.join(data_dir, client)
+    packs = [
+        (os.path.join(client_dir, "resource_packs", "vanilla_netease"), "resources"),
+        (os.path.join(client_dir, "resource_packs", f"{client}_ui"), "resources"),
+        (os.path.join(client_dir, "behavior_packs", f"{client}_behavior"), "data"),
+    ]
+    for pack_dir, pack_type in packs:
+        os.makedirs(pack_dir, exist_ok=True)
+        with open(os.path.join(pack_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            f.write(manifest_json(os.path.basename(pack_dir), pack_type))
+
+    for i in range(pack_files):
+        pack_dir, pack_type = packs[i % len(packs)]
+        name = client
+        if client_rng.random() < shared:
+            name = "shared"
+        rng = random.Random(f"{seed}:{name}:{i}")
+        kind = rng.random()
+        if pack_type == "resources" and kind < 0.5:
+            path = os.path.join(pack_dir, "textures", f"dir{i % 8}", f"t{i}.png")
+            data = png_bytes(rng, 16 * rng.randint(1, 4), 16 * rng.randint(1, 4))
+        elif pack_type == "resources" and kind < 0.6:
+            path = os.path.join(pack_dir, "texts", f"lang{i}.lang")
+            data = "\n".join(f"item.{name}.{j}.name=物品 {j}" for j in range(200)).encode("utf-8")
+        else:
+            folder = "textures" if pack_type == "resources" else "entities"
+            path = os.path.join(pack_dir, folder, f"dir{i % 8}", f"f{i}.json")
+            data = json.dumps({
+                "format_version": "1.16.0",
+                "minecraft:entity": {
+                    "description": {"identifier": f"{name}:e{i}"},
+                    "components": {f"minecraft:c{j}": {"value": rng.random()} for j in range(rng.randint(5, 60))},
+                },
+            }, indent=4).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def check(ok, stage):
+    if not ok:
+        raise RuntimeError(f"{stage} 失败")
+
+
+class Scenario:
+    """
+    一个基准场景：setup 在计时之外执行，run 返回本次处理的字节数，
+    verify 在每次计时结束后检查结果
+    """
+
+    def __init__(self, name, run, setup=None, verify=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.verify = verify
+
+
+def build_scenarios(work_dir, apk_path, data_dir, clients):
+    """
+    构建各基准场景。签名使用进程内签名引擎，对齐也在进程内完成，
+    不需要 Java 和 zipalign；PyInstaller 打包不在基准范围内
+    """
+    output_apk = os.path.join(work_dir, "out.apk")
+    cache_dir = os.path.join(work_dir, "cache")
+    extract_dir = os.path.join(work_dir, "extract")
+    unsigned_apk = os.path.join(work_dir, "unsigned.apk")
+    apk_size = os.path.getsize(apk_path)
+    client_sizes = {client: tree_size(os.path.join(data_dir, client)) for client in clients}
+
+    def resolve(index, cache, selected):
+        layout, errors = fastbuild.resolve_layout(fastbuild.load_layout(apk_path, index, cache), data_dir, selected)
+        check(not errors, "resolve_layout")
+        return layout
+
+    def stream(selected, cache):
+        index = fastbuild.load_base_index(apk_path, cache)
+        check(index is not None, "load_base_index")
+        removed_prefixes, added = fastbuild.plan_pack_entries(resolve(index, cache, selected), data_dir, selected)
+        check(fastbuild.rewrite_apk(apk_path, index, output_apk, removed_prefixes, added,
+                                    cache, fastbuild.create_signer(),
+                                    dedup=fastbuild.DEDUP_ASSETS and len(selected) > 1), "rewrite_apk")
+        check(fastbuild.verify_alignment(output_apk), "verify_alignment")
+        return apk_size + sum(client_sizes[client] for client in selected)
+
+    def legacy(selected):
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        index = fastbuild.load_base_index(apk_path)
+        check(fastbuild.extract_apk(apk_path, extract_dir, index), "extract_apk")
+        check(fastbuild.modify_packs(extract_dir, data_dir, selected, resolve(index, None, selected)), "modify_packs")
+        check(fastbuild.repack_apk(extract_dir, unsigned_apk), "repack_apk")
+        check(fastbuild.zipalign_apk(unsigned_apk, output_apk), "zipalign_apk")
+        check(fastbuild.sign_apk_with_pem_pk8(output_apk), "sign_apk_with_pem_pk8")
+        return apk_size + sum(client_sizes[client] for client in selected)
+
+    def clear_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def warm_cache():
+        stream(clients[:1], BuildCache(cache_dir, fastbuild.BUILD_CACHE_MAX_BYTES))
+
+    install_dir = os.path.join(work_dir, "minecraft")
+    resource_path = os.path.join(install_dir, "resource_packs")
+    behavior_path = os.path.join(install_dir, "behavior_packs")
+
+    def install_client(client):
+        check(install.replace_packs_folders(resource_path, behavior_path,
+                                            os.path.join(data_dir, client)), "replace_packs_folders")
+        return client_sizes[client]
+
+    def check_installed(client):
+        # 安装结果必须与客户端的文件完全一致（切换客户端时同名文件常常大小相同、修改时间相近）
+        for folder, installed_path in (("resource_packs", resource_path), ("behavior_packs", behavior_path)):
+            src_dir = os.path.join(data_dir, client, folder)
+            src_files = install.list_files(src_dir)
+            check(set(src_files) == set(install.list_files(installed_path)), f"{folder} 文件列表")
+            for rel_path in src_files:
+                with open(os.path.join(src_dir, rel_path), "rb") as src, \
+                        open(os.path.join(installed_path, rel_path), "rb") as dst:
+                    check(src.read() == dst.read(), f"{folder}/{rel_path} 内容")
+
+    def clear_install():
+        shutil.rmtree(install_dir, ignore_errors=True)
+        os.makedirs(resource_path)
+        os.makedirs(behavior_path)
+
+    def reinstall():
+        clear_install()
+        install_client(clients[0])
+
+    def alternate_install():
+        # 目标中是另一个客户端的包，模拟切换客户端
+        clear_install()
+        install_client(clients[-1])
+
+    scenarios = [
+        Scenario("single_stream_cold",
+                 lambda: stream(clients[:1], BuildCache(cache_dir, fastbuild.BUILD_CACHE_MAX_BYTES)),
+                 clear_cache),
+        Scenario("single_stream_warm",
+                 lambda: stream(clients[:1], BuildCache(cache_dir, fastbuild.BUILD_CACHE_MAX_BYTES)),
+                 warm_cache),
+        Scenario("single_legacy", lambda: legacy(clients[:1])),
+        Scenario("install_cold", lambda: install_client(clients[0]), clear_install,
+                 lambda: check_installed(clients[0])),
+        Scenario("install_unchanged", lambda: install_client(clients[0]), reinstall,
+                 lambda: check_installed(clients[0])),
+    ]
+    if len(clients) > 1:
+        scenarios[3:3] = [
+            Scenario("multi_stream", lambda: stream(clients, None)),
+            Scenario("multi_legacy", lambda: legacy(clients)),
+        ]
+        scenarios.append(Scenario("install_switch", lambda: install_client(clients[0]), alternate_install,
+                                  lambda: check_installed(clients[0])))
+    return scenarios
+
+
+def run_scenario(scenario, runs):
+    """重复执行一个场景，返回耗时和吞吐量统计"""
+    latencies = []
+    processed = 0
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if scenario.setup:
+                scenario.setup()
+            start = time.perf_counter()
+            processed = scenario.run()
+            latencies.append(time.perf_counter() - start)
+            if scenario.verify:
+                scenario.verify()
+    median = statistics.median(latencies)
+    return {
+        "runs": runs,
+        "min": min(latencies),
+        "median": median,
+        "mean": statistics.fmean(latencies),
+        "stdev": statistics.stdev(latencies) if runs > 1 else 0.0,
+        "bytes": processed,
+        "throughput_mb_s": processed / 1024 ** 2 / median if median else 0.0,
+    }
+
+
+def compare(results, baseline, threshold):
+    """与基线比较中位耗时，返回回退的场景列表"""
+    regressions = []
+    print(f"\n{'场景':<22}{'中位耗时':>10}{'基线':>10}{'变化':>10}{'吞吐量 MB/s':>14}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base:
+            change = result["median"] / base["median"] - 1
+            mark = " 回退" if change > threshold else ""
+            if mark:
+                regressions.append(name)
+            print(f"{name:<24}{result['median']:>9.3f}s{base['median']:>9.3f}s{change:>+10.1%}"
+                  f"{result['throughput_mb_s']:>14.1f}{mark}")
+        else:
+            print(f"{name:<24}{result['median']:>9.3f}s{'-':>10}{'-':>10}{result['throughput_mb_s']:>14.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fastbuild / install 基准测试（使用合成底包和客户端数据）")
+    parser.add_argument("--entries", type=int, default=DEFAULT_ENTRIES, help="底包条目数")
+    parser.add_argument("--entry-size", type=int, default=DEFAULT_ENTRY_SIZE, help="底包条目平均大小（字节）")
+    parser.add_argument("--compressibility", type=float, default=DEFAULT_COMPRESSIBILITY,
+                        help="数据可压缩程度 (0~1)")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="客户端数量")
+    parser.add_argument("--pack-files", type=int, default=DEFAULT_PACK_FILES, help="每个客户端的文件数")
+    parser.add_argument("--shared", type=float, default=DEFAULT_SHARED, help="客户端之间内容相同的文件比例 (0~1)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="每个场景的重复次数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--scenario", action="append", help="只运行指定场景（可重复）")
+    parser.add_argument("--baseline", help=f"基线文件（默认为脚本目录下的 {DEFAULT_BASELINE}，只在本机使用）")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的性能回退比例")
+    parser.add_argument("--work-dir", help="工作目录（默认使用临时目录，结束后删除）")
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in
+              ("entries", "entry_size", "compressibility", "clients", "pack_files", "shared", "seed")}
+
+    # 命令行中的基线路径相对当前目录，切换目录前先解析
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else os.path.join(script_dir, DEFAULT_BASELINE)
+    # 密钥等路径相对于脚本目录；离线运行：进程内签名，不需要 Java
+    os.chdir(script_dir)
+    fastbuild.SIGN_ENGINE = "python"
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="fastbuild_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        apk_path = os.path.join(work_dir, "base.apk")
+        data_dir = os.path.join(work_dir, "data")
+        clients = [f"client{i}" for i in range(1, args.clients + 1)]
+        fastbuild.DATA_DIR = data_dir  # 多客户端构建从合成数据目录读取
+        print("正在生成合成数据...")
+        generate_base_apk(apk_path, args.entries, args.entry_size, args.compressibility, args.seed)
+        for client in clients:
+            generate_client(data_dir, client, args.pack_files, args.seed, args.shared)
+        print(f"底包: {os.path.getsize(apk_path) / 1024 ** 2:.1f} MB，"
+              f"{len(clients)} 个客户端，共 {tree_size(data_dir) / 1024 ** 2:.1f} MB")
+
+        results = {}
+        for scenario in build_scenarios(work_dir, apk_path, data_dir, clients):
+            if args.scenario and scenario.name not in args.scenario:
+                continue
+            print(f"运行 {scenario.name} ({args.runs} 次)...")
+            results[scenario.name] = run_scenario(scenario, args.runs)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print("警告: 基线使用的参数与本次不同，比较结果仅供参考")
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "python": sys.version.split()[0], "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {baseline_path}")
+    elif regressions:
+        print(f"\n性能回退超过 {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+
+import apkzip
+
+BLOB_HEADER = struct.Struct("<4sHLL")
+BLOB_MAGIC = b"FBC1"
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    增量构建缓存：
+    - manifest.json 记录每个文件的 (大小, 修改时间, sha256)，大小和时间未变时直接复用哈希
+    - blobs/ 按内容哈希保存压缩后的条目数据
+    - 其它子目录（处理后的图片和 JSON、中央目录索引、PC 安装程序等）由使用者写入，
+      与 blobs/ 一起计入容量，按最近使用时间（修改时间）淘汰；使用者命中缓存时应调用 touch()
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(root, "blobs")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # 并行压缩时保护清单和计数
+        self.base_apk_lock = threading.Lock()  # 并行的阶段同时需要底包哈希时只计算一次
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.manifest = {"base_apk": {}, "files": {}}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def _lookup(self, table, path):
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            record = self.manifest[table].get(key)
+        if record and record[0] == stat.st_size and record[1] == stat.st_mtime_ns:
+            return record[2]
+        digest = hash_file(path)
+        with self.lock:
+            self.manifest[table][key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def file_hash(self, path):
+        """返回文件内容哈希，大小和修改时间未变时不重新计算"""
+        return self._lookup("files", path)
+
+    def base_apk_hash(self, apk_path):
+        """返回底包哈希"""
+        with self.base_apk_lock:
+            return self._lookup("base_apk", apk_path)
+
+    def touch(self, path):
+        """
+        标记缓存中的文件刚被使用：evict() 按修改时间淘汰，命中时更新修改时间，
+        经常使用的数据就不会因为创建得早而被淘汰；更新失败（如只读文件）时忽略
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _blob_path(self, key):
+        return os.path.join(self.blob_dir, key[:2], key[2:])
+
+    def compressed(self, path, method=apkzip.ZIP_DEFLATED, level=-1):
+        """
+        返回文件压缩后的 (压缩方式, crc, 原始大小, 压缩数据)
+        内容和压缩参数都相同时直接使用缓存
+        """
+        key = hashlib.sha256(f"{self.file_hash(path)}:{method}:{level}".encode()).hexdigest()
+        blob_path = self._blob_path(key)
+        try:
+            with open(blob_path, "rb") as f:
+                magic, blob_method, crc, file_size = BLOB_HEADER.unpack(f.read(BLOB_HEADER.size))
+                payload = f.read()
+            if magic == BLOB_MAGIC:
+                self.touch(blob_path)
+                with self.lock:
+                    self.hits += 1
+                return blob_method, crc, file_size, payload
+        except (OSError, struct.error):
+            pass
+
+        with open(path, "rb") as f:
+            data = f.read()
+        blob_method, crc, payload = apkzip.compress_bytes(data, method, level)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(BLOB_HEADER.pack(BLOB_MAGIC, blob_method, crc, len(data)))
+            f.write(payload)
+        os.replace(temp_path, blob_path)
+        with self.lock:
+            self.misses += 1
+        return blob_method, crc, len(data), payload
+
+    def evict(self):
+        """
+        缓存目录中所有子目录的总大小超出容量上限时，按最近使用时间淘汰旧数据
+        （根目录下的清单等小文件不参与淘汰）
+        """
+        files = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            for root, _, names in os.walk(entry.path):
+                for name in names:
+                    if name.endswith(".tmp"):
+                        continue  # 其它进程正在写入
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Windows 上正在使用（如已映射的索引）的文件无法删除
+            total -= size
+            removed += 1
+        return removed
+
+    def save(self):
+        """保存清单并执行淘汰"""
+        # 删除已不存在的文件记录，避免清单无限增长
+        files = self.manifest["files"]
+        for key in [key for key in files if not os.path.exists(key)]:
+            del files[key]
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+        return self.evict()
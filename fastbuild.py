@@ -1,22 +1,131 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
-import zipfile
 import tempfile
 import subprocess
 import sys
-from datetime import datetime
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from fnmatch import fnmatchcase
+from functools import lru_cache, partial
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import tomllib
+except ImportError:  # Python 3.10 及以下只支持 JSON 配置
+    tomllib = None
+
+import apksign
+import apkzip
+import packcheck
+import payload
+import pngopt
+from buildcache import BuildCache, hash_file
+from pipeline import Pipeline, run_tool
+from profiler import BuildProfiler
+from watcher import create_watcher, wait_for_changes
+
 # 配置
 APK_NAME = "Your Client.Apk"  # 底包文件名
+SIGN_ENGINE = "apksigner"  # apksigner: 使用 apksigner.jar 签名；python: 进程内签名，无需 Java
 APKSIGNER_PATH = "apksigner.jar"  # 需要提前下载 apksigner.jar
-ZIPALIGN_PATH = "zipalign"  # 需要 Android SDK 中的 zipalign
+SIGN_SERVER_SOURCE = "SignServer.java"  # 常驻签名进程源码（需要 JDK 11+）
+USE_SIGN_SERVER = True  # 多次签名共用一个 JVM，启动失败时退回 java -jar
+V1_SIGNER_NAME = "C=US, O=Android, CN=Android"
+MIN_SDK_VERSION = 30
 KEY_DIR = "keys"  # 密钥文件目录
 X509_CERT = os.path.join(KEY_DIR, "platform.x509.pem")  # x509证书
 PK8_KEY = os.path.join(KEY_DIR, "platform.pk8")  # pk8私钥
-BACKUP_DIR = "backups"  # 备份文件目录
+BACKUP_DIR = "backups"  # 底包快照目录（只在构建期间存在）
+BACKUP_SNAPSHOT = True  # 文件系统支持 reflink 时，构建期间为底包创建快照（共享数据块，不占用额外空间）
 DATA_DIR = "data"  # 资源目录
+OUTPUT_DIR = None  # 签名后 APK 和 PC 安装程序的输出目录，None 表示底包所在目录
 ICON_PATH = "icon.ico"  # 程序图标
+PC_STUB_DIR = "pcstub"  # 构建缓存中保存的 PC 安装程序（不含数据包），install.py、Python/PyInstaller 版本、命令行和图标不变时不再重新构建
+STREAM_REWRITE = True  # 直接流式重写底包，不再解压到临时目录
+STAGING_MODE = "auto"  # 解压模式下放入资源包的方式 auto: 硬链接 > reflink > 复制；copy: 始终复制
+BUILD_CACHE_DIR = ".buildcache"  # 增量构建缓存目录
+BUILD_CACHE_MAX_BYTES = 4 * 1024 ** 3  # 缓存容量上限，超出后淘汰最久未使用的数据
+LAYOUT_CACHE_NAME = "layouts.json"  # 按底包哈希缓存的布局探测结果（只保留当前底包的结果）
+# 自动探测失败（找不到或有多个候选位置）时手动指定底包布局，例如
+# {"resource_packs": "assets/resource_packs/", "behavior_packs": "assets/behavior_packs/", "yant": "assets/Yant/"}
+PACK_LAYOUT = None
+VALIDATE_PACKS = True  # 构建前预检资源包和行为包中的 JSON
+MAX_PRINTED_WARNINGS = 20
+PROFILE_DIR = "profile"  # 阶段统计报告 (build_profile.json) 和 Chrome trace (build_trace.json) 的输出目录
+PROFILE_STAGES = ()  # 需要 cProfile 的阶段名，如 ("rewrite_apk",)，"*" 表示全部
+
+# 压缩策略
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".ogg", ".fsb", ".mp3", ".zip", ".mcpack")  # 已压缩格式直接存储
+STORED_PATTERNS = ("resources.arsc", "*.so")  # 必须不压缩的条目
+COMPRESSION_LEVELS = [  # 按路径匹配压缩级别，先匹配先生效
+    ("*.json", 9),
+    ("*.lang", 9),
+    ("*", 6),
+]
+COMPRESS_THREADS = os.cpu_count() or 1  # 并行压缩线程数
+DEDUP_ASSETS = True  # 多客户端构建时内容相同的文件只压缩一次
+DEDUP_MEMORY_LIMIT = 256 * 1024 ** 2  # 去重时在内存中保留的压缩结果上限（字节），超出的部分之后从构建缓存读回
+OPTIMIZE_IMAGES = False  # 打包前无损优化 PNG（结果按文件哈希缓存，每张图只优化一次）
+MINIFY_JSON = True  # 打包前去掉 JSON 中的注释和空白（结果按文件哈希缓存）
+TRANSFORM_PROCESSES = None  # 优化图片和压缩 JSON 的进程数，None 表示 CPU 核心数
+BATCH_JOBS = None  # 批量构建的并行进程数，None 表示 min(客户端数, CPU 核心数)
+PIPELINE_JOBS = 3  # 同时执行的构建阶段数（如 PC 安装程序与 APK 同时构建）
+WATCH_DEBOUNCE = 0.5  # 监视模式下最后一次文件变化后再等待的秒数
+WATCH_POLL_INTERVAL = 1.0  # 不支持 inotify 时的轮询间隔（秒）
+
+# 命令行和配置文件
+INTERACTIVE = True  # 没有命令行参数时使用交互菜单；否则不再等待输入，出错时直接以退出码结束
+EXIT_OK = 0
+EXIT_BUILD_FAILED = 1  # 构建步骤失败
+EXIT_USAGE = 2  # 参数或配置文件错误
+EXIT_MISSING_INPUT = 3  # 缺少底包、客户端、工具或密钥
+EXIT_VALIDATION = 4  # 资源包预检失败
+SKIPPABLE_STAGES = ("preflight", "backup", "sign", "pc", "clean")
+CONFIG_KEYS = {  # 配置文件中的键 -> 对应的配置常量
+    "apk": "APK_NAME",
+    "data_dir": "DATA_DIR",
+    "output_dir": "OUTPUT_DIR",
+    "key_dir": "KEY_DIR",
+    "sign_engine": "SIGN_ENGINE",
+    "apksigner": "APKSIGNER_PATH",
+    "use_sign_server": "USE_SIGN_SERVER",
+    "v1_signer_name": "V1_SIGNER_NAME",
+    "min_sdk_version": "MIN_SDK_VERSION",
+    "icon": "ICON_PATH",
+    "stream_rewrite": "STREAM_REWRITE",
+    "staging_mode": "STAGING_MODE",
+    "build_cache_dir": "BUILD_CACHE_DIR",
+    "build_cache_max_bytes": "BUILD_CACHE_MAX_BYTES",
+    "pack_layout": "PACK_LAYOUT",
+    "validate_packs": "VALIDATE_PACKS",
+    "profile_dir": "PROFILE_DIR",
+    "profile_stages": "PROFILE_STAGES",
+    "stored_extensions": "STORED_EXTENSIONS",
+    "stored_patterns": "STORED_PATTERNS",
+    "compression_levels": "COMPRESSION_LEVELS",
+    "compress_threads": "COMPRESS_THREADS",
+    "dedup_assets": "DEDUP_ASSETS",
+    "dedup_memory_limit": "DEDUP_MEMORY_LIMIT",
+    "optimize_images": "OPTIMIZE_IMAGES",
+    "minify_json": "MINIFY_JSON",
+    "transform_processes": "TRANSFORM_PROCESSES",
+    "batch_jobs": "BATCH_JOBS",
+    "pipeline_jobs": "PIPELINE_JOBS",
+    "watch_debounce": "WATCH_DEBOUNCE",
+    "watch_poll_interval": "WATCH_POLL_INTERVAL",
+}
+# 路径类配置：配置文件中的相对路径相对配置文件所在目录，命令行参数相对当前目录，默认值相对脚本所在目录
+PATH_CONFIG_KEYS = ("apk", "data_dir", "output_dir", "key_dir", "apksigner", "icon", "build_cache_dir", "profile_dir")
 
 def get_available_clients():
     """
@@ -42,9 +151,11 @@ def get_available_clients():
 def display_client_menu(clients):
     """
     显示客户端选择菜单
+    返回 (选择的客户端列表, 是否为每个客户端单独构建 APK)
     """
     print("\n可用客户端列表:")
     print("0. 多客户端构建 (选择多个客户端)")
+    print("B. 批量构建 (每个客户端单独生成 APK，留空表示全部)")
     for i, client in enumerate(clients, 1):
         print(f"{i}. {client}")
     
@@ -52,7 +163,17 @@ def display_client_menu(clients):
         try:
             choice = input("\n请选择要构建的客户端 (输入序号，多选时用逗号分隔): ").strip()
             
-            if choice == "0":
+            if choice.lower() == "b":
+                # 批量构建
+                batch_choice = input("请输入要批量构建的客户端序号 (用逗号分隔，留空为全部): ").strip()
+                if not batch_choice:
+                    return list(clients), True
+                selected_indices = [int(x.strip()) for x in batch_choice.split(",") if x.strip().isdigit()]
+                selected_clients = [clients[idx-1] for idx in selected_indices if 1 <= idx <= len(clients)]
+                if selected_clients:
+                    return selected_clients, True
+                print("错误: 没有选择有效的客户端")
+            elif choice == "0":
                 # 多客户端构建
                 multi_choice = input("请输入要构建的客户端序号 (用逗号分隔，如: 1,3,4): ").strip()
                 selected_indices = [int(x.strip()) for x in multi_choice.split(",") if x.strip().isdigit()]
@@ -65,7 +186,7 @@ def display_client_menu(clients):
                         print(f"警告: 序号 {idx} 无效，已跳过")
                 
                 if selected_clients:
-                    return selected_clients
+                    return selected_clients, False
                 else:
                     print("错误: 没有选择有效的客户端")
             else:
@@ -73,7 +194,7 @@ def display_client_menu(clients):
                 if choice.isdigit():
                     idx = int(choice)
                     if 1 <= idx <= len(clients):
-                        return [clients[idx-1]]
+                        return [clients[idx-1]], False
                     else:
                         print("错误: 选择的序号超出范围")
                 else:
@@ -87,12 +208,11 @@ def clean_up():
     """清理构建和临时文件"""
     files_to_remove = [
         "build",
-        "backups",
         "dist",
-        f"{APK_NAME.replace('.Apk','')} PC Installer.spec",
-        f"{os.path.splitext(APK_NAME)[0]}_aligned.apk.idsig",
-        f"{os.path.splitext(APK_NAME)[0]}_unsigned.apk",
-        f"{os.path.splitext(APK_NAME)[0]}_aligned.apk"
+        f"{os.path.basename(APK_NAME).replace('.Apk','')} PC Installer.spec",
+        f"{os.path.splitext(os.path.basename(APK_NAME))[0]}_aligned.apk.idsig",
+        f"{os.path.splitext(os.path.basename(APK_NAME))[0]}_unsigned.apk",
+        f"{os.path.splitext(os.path.basename(APK_NAME))[0]}_aligned.apk"
     ]
     
     print("\n正在清理临时文件...")
@@ -107,89 +227,144 @@ def clean_up():
         except Exception as e:
             print(f"删除 {item} 失败: {e}")
 
-def create_backup(apk_path):
-    """创建原始APK备份"""
+def check_base_apk(apk_path, cache):
+    """
+    构建流程只读取底包，不再复制整份备份：记录底包的哈希、大小和修改时间，
+    BACKUP_SNAPSHOT 为 True 且文件系统支持 reflink 时再创建快照
+    返回记录，失败时返回 None
+    """
     try:
-        os.makedirs(BACKUP_DIR, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_name = os.path.splitext(os.path.basename(apk_path))[0]
-        backup_name = f"{base_name}_backup_{timestamp}.apk"
-        backup_path = os.path.join(BACKUP_DIR, backup_name)
-        shutil.copy2(apk_path, backup_path)
-        print(f"\n已创建备份文件: {backup_path}")
-        return backup_path
+        stat = os.stat(apk_path)
+        backup = {"path": apk_path, "hash": cache.base_apk_hash(apk_path),
+                  "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "snapshot": None}
+        print(f"\n底包哈希: {backup['hash'][:16]}（构建过程中只读取底包）")
+        if BACKUP_SNAPSHOT:
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            base_name = os.path.splitext(os.path.basename(apk_path))[0]
+            snapshot_path = os.path.join(BACKUP_DIR, f"{base_name}_snapshot.apk")
+            if reflink_file(apk_path, snapshot_path):
+                backup["snapshot"] = snapshot_path
+                print(f"已创建底包快照 (reflink): {snapshot_path}")
+            else:
+                remove_empty_dir(BACKUP_DIR)
+        return backup
     except Exception as e:
-        print(f"\n创建备份失败: {e}")
+        print(f"\n检查底包失败: {e}")
         return None
 
-def restore_backup(backup_path, original_path):
-    """从备份还原APK"""
+def verify_base_apk(backup):
+    """
+    确认构建后底包未被修改：大小和修改时间都未变时直接通过，否则重新计算哈希；
+    内容确实变化且有快照时从快照还原。最后删除快照
+    返回底包是否完好
+    """
+    apk_path = backup["path"]
+    snapshot_path = backup["snapshot"]
     try:
-        if backup_path and os.path.exists(backup_path):
-            shutil.copy2(backup_path, original_path)
-            print(f"\n已从备份还原: {original_path}")
+        stat = os.stat(apk_path) if os.path.exists(apk_path) else None
+        if stat is not None and ((stat.st_size, stat.st_mtime_ns) == (backup["size"], backup["mtime_ns"])
+                                 or hash_file(apk_path) == backup["hash"]):
+            print("底包未被修改")
             return True
+        if snapshot_path:
+            apkzip.unmap(apk_path)
+            os.replace(snapshot_path, apk_path)
+            snapshot_path = None
+            print(f"\n底包在构建过程中被修改，已从快照还原: {apk_path}")
+            return True
+        print(f"\n警告: 底包在构建过程中被修改或删除: {apk_path}")
         return False
     except Exception as e:
-        print(f"\n还原备份失败: {e}")
+        print(f"\n检查底包失败: {e}")
         return False
+    finally:
+        if snapshot_path and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        remove_empty_dir(BACKUP_DIR)
+
+def remove_empty_dir(path):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
 
-def extract_apk(apk_path, extract_dir):
-    """解压 APK 文件"""
+def load_base_index(apk_path, cache=None):
+    """
+    返回底包的中央目录索引 (apkzip.ZipIndex)，失败时返回 None
+    索引按底包哈希保存在构建缓存中，底包未变化时直接映射索引文件，不再解析中央目录
+    """
     try:
-        with zipfile.ZipFile(apk_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
+        if cache is None:
+            return apkzip.ZipIndex.parse(apkzip.map_readonly(apk_path))
+        index_path = os.path.join(cache.root, "zipindex", f"{cache.base_apk_hash(apk_path)}.idx")
+        try:
+            index = apkzip.ZipIndex.load(index_path)
+            cache.touch(index_path)
+            return index
+        except (OSError, ValueError):
+            pass
+        index = apkzip.ZipIndex.parse(apkzip.map_readonly(apk_path))
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        index.save(index_path)
+        return index
+    except Exception as e:
+        print(f"读取 APK 中央目录失败: {e}")
+        return None
+
+def extract_apk(apk_path, extract_dir, index=None):
+    """解压 APK 文件（使用中央目录索引，不再由 zipfile 重新解析）"""
+    try:
+        src = apkzip.map_readonly(apk_path)
+        if index is None:
+            index = apkzip.ZipIndex.parse(src)
+        root = os.path.abspath(extract_dir)
+        for i in range(len(index)):
+            name = index.name(i)
+            path = os.path.abspath(os.path.join(root, name))
+            if not path.startswith(root + os.sep):
+                raise ValueError(f"条目路径不安全: {name}")
+            if name.endswith("/"):
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(index.read_data(src, i))
         return True
     except Exception as e:
         print(f"解压 APK 失败: {e}")
         return False
 
 def repack_apk(extract_dir, output_apk):
-    """重新打包 APK 文件（确保 resources.arsc 不压缩）"""
+    """重新打包 APK 文件（按压缩策略并行压缩，确保 resources.arsc 不压缩）"""
     try:
-        with zipfile.ZipFile(output_apk, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, extract_dir)
-                    # 特别处理 resources.arsc
-                    if arcname == 'resources.arsc':
-                        zipf.write(file_path, arcname, compress_type=zipfile.ZIP_STORED)
-                    else:
-                        zipf.write(file_path, arcname)
+        with apkzip.ApkWriter(output_apk) as writer:
+            files = walk_pack_files(extract_dir, "")
+            for arcname, file_path, compressed in compress_pack_files(files):
+                writer.add_compressed(arcname, *compressed, timestamp=os.path.getmtime(file_path))
         return True
     except Exception as e:
         print(f"打包 APK 失败: {e}")
         return False
 
+def copy_base_entry(writer, src, index, i):
+    """
+    复制底包中的一个条目；压缩过的 resources.arsc 解压后改为存储模式写入
+    （Android 11+ 要求 resources.arsc 不压缩且 4 字节对齐），保留原来的修改时间
+    """
+    entry = index.entry(i)
+    if entry.name == "resources.arsc" and entry.method != apkzip.ZIP_STORED:
+        writer.add_bytes(entry.name, index.read_data(src, i), apkzip.ZIP_STORED,
+                         timestamp=apkzip.dos_timestamp(entry.dos_time, entry.dos_date))
+    else:
+        writer.copy_entry(src, entry)
+
 def zipalign_apk(input_apk, output_apk):
-    """对齐 APK 文件（针对 Android 11+ 的特别处理）"""
+    """对齐 APK 文件（进程内完成，4 字节对齐，.so 按 16KB 页对齐）"""
     try:
-        # 先进行一次标准对齐
-        subprocess.run([
-            ZIPALIGN_PATH,
-            "-v", "4",
-            input_apk,
-            output_apk
-        ], check=True)
-        
-        # 对资源表进行特殊处理（关键修复）
-        with zipfile.ZipFile(output_apk, 'a') as zf:
-            # 确保不压缩 resources.arsc
-            if 'resources.arsc' in zf.namelist():
-                zf.getinfo('resources.arsc').compress_type = zipfile.ZIP_STORED
-        
-        # 再次对齐确保4字节边界
-        temp_aligned = output_apk + "_temp"
-        shutil.move(output_apk, temp_aligned)
-        subprocess.run([
-            ZIPALIGN_PATH,
-            "-v", "4",
-            temp_aligned,
-            output_apk
-        ], check=True)
-        os.remove(temp_aligned)
-        
+        with open(input_apk, "rb") as src, apkzip.ApkWriter(output_apk) as writer:
+            index = apkzip.ZipIndex.parse(src)
+            for i in range(len(index)):
+                copy_base_entry(writer, src, index, i)
         return True
     except Exception as e:
         print(f"zipalign 对齐失败: {e}")
@@ -199,40 +374,136 @@ def sign_apk_with_pem_pk8(apk_path):
     """使用 .x509.pem 和 .pk8 文件签名 APK（针对 Android 11+ 优化）"""
     try:
         # 先检查资源对齐
-        with zipfile.ZipFile(apk_path, 'r') as zf:
-            arsc_info = zf.getinfo('resources.arsc')
-            if arsc_info.compress_type != zipfile.ZIP_STORED:
-                print("错误: resources.arsc 必须使用存储模式(不压缩)")
+        with open(apk_path, "rb") as f:
+            index = apkzip.ZipIndex.parse(f)
+        arsc = index.find("resources.arsc")
+        if arsc is None:
+            print("错误: APK 中没有 resources.arsc")
+            return False
+        if index.method[arsc] != apkzip.ZIP_STORED:
+            print("错误: resources.arsc 必须使用存储模式(不压缩)")
+            return False
+        
+        if SIGN_ENGINE == "python":
+            # 进程内签名：复制一遍条目并在写出时完成 v1 + v2 签名
+            temp_apk = apk_path + ".signing"
+            start = time.perf_counter()
+            with open(apk_path, "rb") as src, \
+                    apkzip.ApkWriter(temp_apk, signer=create_signer()) as writer:
+                for entry in index:
+                    writer.copy_entry(src, entry)
+            os.replace(temp_apk, apk_path)
+            print(f"签名耗时: {(time.perf_counter() - start) * 1000:.0f} ms (进程内签名)")
+            return True
+        
+        worker = apksign.get_worker(APKSIGNER_PATH, SIGN_SERVER_SOURCE) if USE_SIGN_SERVER else None
+        if worker is not None:
+            # 常驻 JVM 不能原地签名，先写到临时文件再替换
+            temp_apk = apk_path + ".signing"
+            ok, error, elapsed, jvm_elapsed = worker.sign(
+                apk_path, temp_apk, PK8_KEY, X509_CERT, V1_SIGNER_NAME, MIN_SDK_VERSION)
+            if not ok:
+                print(f"APK 签名失败: {error}")
+                if os.path.exists(temp_apk):
+                    os.remove(temp_apk)
                 return False
+            os.replace(temp_apk, apk_path)
+            print(f"签名耗时: {elapsed:.0f} ms (JVM 内 {jvm_elapsed} ms)")
+            return True
         
-        # 执行签名
-        result = subprocess.run([
+        # 执行签名（输出逐行转发，构建被取消时终止进程）
+        returncode = run_tool([
             "java", "-jar", APKSIGNER_PATH,
             "sign",
             "--key", PK8_KEY,
             "--cert", X509_CERT,
-            "--v1-signer-name", "C=US, O=Android, CN=Android",
+            "--v1-signer-name", V1_SIGNER_NAME,
             "--v2-signing-enabled", "true",
             "--v3-signing-enabled", "false",
-            "--min-sdk-version", "30",  # 明确指定最低SDK版本
+            "--min-sdk-version", str(MIN_SDK_VERSION),  # 明确指定最低SDK版本
             "--out", apk_path,
             apk_path
-        ], capture_output=True, text=True)
+        ], "apksigner", check=False)
         
-        if result.returncode != 0:
-            print(f"APK 签名失败: {result.stderr}")
+        if returncode != 0:
+            print(f"APK 签名失败: 退出码 {returncode}")
             return False
         return True
     except Exception as e:
         print(f"APK 签名过程中出现错误: {e}")
         return False
 
-def modify_packs_for_multiple_clients(extract_dir, selected_clients):
+def create_signer():
+    """
+    创建进程内签名会话，未启用进程内签名时返回 None
+    """
+    if SIGN_ENGINE != "python":
+        return None
+    return apksign.InProcessSigner(apksign.SigningKey(PK8_KEY, X509_CERT), V1_SIGNER_NAME)
+
+FICLONE = 0x40049409  # Linux ioctl，Btrfs/XFS 等文件系统上共享数据块
+
+def reflink_file(src_path, dst_path):
+    """
+    以 reflink 方式复制文件（新文件与源文件共享数据块，之后互不影响），返回是否成功
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(src_path, dst_path)
+        return True
+    except OSError:
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        return False
+
+def stage_file(src_path, dst_path):
+    """
+    把源文件放到暂存目录，返回使用的方式 ("link", "reflink", "copy")
+    暂存文件只会被读取（重新打包），硬链接不会影响 data 目录中的源文件
+    """
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    if STAGING_MODE != "copy":
+        try:
+            os.link(src_path, dst_path)
+            return "link"
+        except OSError:
+            pass
+        if reflink_file(src_path, dst_path):
+            return "reflink"
+    shutil.copy2(src_path, dst_path)
+    return "copy"
+
+def stage_tree(src_dir, dst_dir, skip=()):
+    """
+    代替 shutil.copytree 暂存资源包目录，skip 为不暂存的相对路径
+    """
+    counts = Counter()
+    for root, dirs, names in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        target_root = os.path.normpath(os.path.join(dst_dir, rel_root))
+        os.makedirs(target_root, exist_ok=True)
+        for name in names:
+            if os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/") in skip:
+                continue
+            counts[stage_file(os.path.join(root, name), os.path.join(target_root, name))] += 1
+    print(f"暂存 {sum(counts.values())} 个文件: 硬链接 {counts['link']} 个，"
+          f"reflink {counts['reflink']} 个，复制 {counts['copy']} 个")
+    return counts
+
+def arc_path(extract_dir, prefix):
+    """把 APK 中的目录前缀转换为解压目录中的路径"""
+    return os.path.join(extract_dir, *prefix.rstrip("/").split("/"))
+
+def modify_packs_for_multiple_clients(extract_dir, selected_clients, yant_prefix):
     """
     为多客户端构建修改资源包和行为包
     """
     try:
-        yant_path = os.path.join(extract_dir, "assets", "Yant")
+        yant_path = arc_path(extract_dir, yant_prefix)
         os.makedirs(yant_path, exist_ok=True)
         
         data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATA_DIR)
@@ -245,18 +516,14 @@ def modify_packs_for_multiple_clients(extract_dir, selected_clients):
                 # 目标路径：assets\Yant\客户端名称
                 client_dest = os.path.join(yant_path, client)
                 
-                # 复制vanilla_netease文件夹到目标路径
+                # 暂存vanilla_netease文件夹到目标路径（不含manifest.json）
                 if os.path.exists(client_dest):
                     shutil.rmtree(client_dest)
-                shutil.copytree(vanilla_netease_src, client_dest)
+                stage_tree(vanilla_netease_src, client_dest, skip=("manifest.json",))
+                if os.path.exists(os.path.join(vanilla_netease_src, "manifest.json")):
+                    print(f"已跳过 {client} 的 manifest.json")
                 
-                # 删除manifest.json文件
-                manifest_path = os.path.join(client_dest, "manifest.json")
-                if os.path.exists(manifest_path):
-                    os.remove(manifest_path)
-                    print(f"已删除 {client} 的 manifest.json")
-                
-                print(f"已为客户端 {client} 添加资源包到 assets\\Yant\\{client}")
+                print(f"已为客户端 {client} 添加资源包到 {yant_prefix}{client}")
             else:
                 print(f"警告: 客户端 {client} 中没有找到 vanilla_netease 文件夹")
         
@@ -265,73 +532,415 @@ def modify_packs_for_multiple_clients(extract_dir, selected_clients):
         print(f"多客户端构建过程中出现错误: {e}")
         return False
 
-def modify_packs(extract_dir, data_dir, selected_clients=None):
-    """修改资源包和行为包"""
+def modify_packs(extract_dir, data_dir, selected_clients, layout):
+    """
+    修改资源包和行为包，替换位置由 resolve_layout 根据底包中央目录确定
+    """
     try:
         # 如果是多客户端构建，使用特殊处理
         if isinstance(selected_clients, list) and len(selected_clients) > 1:
-            return modify_packs_for_multiple_clients(extract_dir, selected_clients)
+            return modify_packs_for_multiple_clients(extract_dir, selected_clients, layout["yant"])
         
-        # 单客户端构建的原有逻辑
+        # 单客户端构建
         # 获取客户端目录路径
         if selected_clients and isinstance(selected_clients, list) and len(selected_clients) == 1:
             client_dir = os.path.join(data_dir, selected_clients[0])
         else:
             client_dir = data_dir
         
-        possible_pack_paths = [
-            os.path.join(extract_dir, "assets", "resource_packs"),
-            os.path.join(extract_dir, "assets", "behavior_packs"),
-            os.path.join(extract_dir, "assets", "assets", "resource_packs"),
-            os.path.join(extract_dir, "assets", "assets", "behavior_packs"),
-            os.path.join(extract_dir, "resource_packs"),
-            os.path.join(extract_dir, "behavior_packs"),
-        ]
-
-        src_resource = os.path.join(client_dir, "resource_packs")
-        if os.path.exists(src_resource):
-            replaced = False
-            for path in possible_pack_paths:
-                if "resource" in path.lower() and os.path.exists(path):
-                    shutil.rmtree(path)
-                    shutil.copytree(src_resource, path)
-                    print(f"已替换资源包: {path}")
-                    replaced = True
-                    break
-            
-            if not replaced:
-                new_path = os.path.join(extract_dir, "assets", "assets", "resource_packs")
-                os.makedirs(new_path, exist_ok=True)
-                shutil.copytree(src_resource, new_path, dirs_exist_ok=True)
-                print(f"已创建新资源包目录: {new_path}")
-
-        src_behavior = os.path.join(client_dir, "behavior_packs")
-        if os.path.exists(src_behavior):
-            replaced = False
-            for path in possible_pack_paths:
-                if "behavior" in path.lower() and os.path.exists(path):
-                    shutil.rmtree(path)
-                    shutil.copytree(src_behavior, path)
-                    print(f"已替换行为包: {path}")
-                    replaced = True
-                    break
-            
-            if not replaced:
-                new_path = os.path.join(extract_dir, "assets", "assets", "behavior_packs")
-                os.makedirs(new_path, exist_ok=True)
-                shutil.copytree(src_behavior, new_path, dirs_exist_ok=True)
-                print(f"已创建新行为包目录: {new_path}")
+        for folder, label in (("resource_packs", "资源包"), ("behavior_packs", "行为包")):
+            src = os.path.join(client_dir, folder)
+            if not os.path.exists(src):
+                continue
+            path = arc_path(extract_dir, layout[folder])
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            stage_tree(src, path)
+            print(f"已替换{label}: {path}")
 
         return True
     except Exception as e:
         print(f"修改包内容失败: {e}")
         return False
 
+def probe_layout(index):
+    """
+    只读取中央目录探测底包布局，返回各位置的所有候选前缀：
+    {"resource_packs": [...], "behavior_packs": [...], "yant": [...]}
+    包根目录是名为 resource_packs / behavior_packs 且其中至少有一个包的目录，
+    包内部和 Yant 目录下的同名目录不计入
+    """
+    candidates = {"resource_packs": set(), "behavior_packs": set(), "yant": set()}
+    for name in index.names():
+        parts = name.split("/")
+        for depth, part in enumerate(parts[:-1]):
+            if part == "Yant":
+                candidates["yant"].add("/".join(parts[:depth + 1]) + "/")
+                break
+            if part in ("resource_packs", "behavior_packs"):
+                if depth + 2 < len(parts):
+                    candidates[part].add("/".join(parts[:depth + 1]) + "/")
+                break
+    return {key: sorted(prefixes) for key, prefixes in candidates.items()}
+
+def load_layout(apk_path, index, cache=None):
+    """
+    返回底包布局的探测结果，按底包哈希缓存，底包未变化时不再探测
+    缓存中只保留当前底包的结果，更换底包后旧的结果随之删除
+    """
+    if cache is None:
+        return probe_layout(index)
+    layouts_path = os.path.join(cache.root, LAYOUT_CACHE_NAME)
+    try:
+        with open(layouts_path, "r", encoding="utf-8") as f:
+            layouts = json.load(f)
+    except (OSError, ValueError):
+        layouts = {}
+    digest = cache.base_apk_hash(apk_path)
+    if digest not in layouts or len(layouts) > 1:
+        layouts = {digest: layouts[digest] if digest in layouts else probe_layout(index)}
+        temp_path = f"{layouts_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(layouts, f, ensure_ascii=False)
+        os.replace(temp_path, layouts_path)
+    return layouts[digest]
+
+def resolve_layout(candidates, data_dir, selected_clients):
+    """
+    根据探测结果确定本次构建的替换位置，返回 (布局, 错误列表)
+    候选位置缺失或不唯一时不再猜测（猜错会生成游戏无法加载的 APK），
+    报告错误，可用 PACK_LAYOUT 手动指定
+    """
+    layout = {key: None for key in candidates}
+    errors = []
+    
+    def pick(key, label):
+        if PACK_LAYOUT and PACK_LAYOUT.get(key):
+            layout[key] = PACK_LAYOUT[key].rstrip("/") + "/"
+        elif len(candidates[key]) == 1:
+            layout[key] = candidates[key][0]
+        elif not candidates[key]:
+            errors.append(f"底包中找不到{label}，请在配置中用 pack_layout 指定")
+        else:
+            errors.append(f"底包中有多个可能的{label}: {', '.join(candidates[key])}，请在配置中用 pack_layout 指定")
+    
+    if isinstance(selected_clients, list) and len(selected_clients) > 1:
+        pick("yant", " Yant 目录（多客户端构建只支持 Yant 底包）")
+        return layout, errors
+    if selected_clients and isinstance(selected_clients, list) and len(selected_clients) == 1:
+        client_dir = os.path.join(data_dir, selected_clients[0])
+    else:
+        client_dir = data_dir
+    for key, label in (("resource_packs", "资源包目录 (resource_packs)"), ("behavior_packs", "行为包目录 (behavior_packs)")):
+        if os.path.exists(os.path.join(client_dir, key)):
+            pick(key, label)
+    return layout, errors
+
+def describe_layout(candidates):
+    """布局探测结果的简短说明"""
+    def text(key):
+        return ", ".join(candidates[key]) if candidates[key] else "无"
+    return (f"资源包 {text('resource_packs')}；行为包 {text('behavior_packs')}；"
+            f"Yant 底包: {'是 (' + text('yant') + ')' if candidates['yant'] else '否'}")
+
+def walk_pack_files(src_dir, arc_prefix, skip=()):
+    """
+    列出源目录中的文件及其在 APK 中的条目名（按路径排序，保证输出稳定）
+    """
+    files = []
+    for root, dirs, names in os.walk(src_dir):
+        dirs.sort()
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            rel_path = os.path.relpath(file_path, src_dir).replace(os.sep, "/")
+            if rel_path in skip:
+                continue
+            files.append((arc_prefix + rel_path, file_path))
+    return files
+
+def plan_pack_entries(layout, data_dir, selected_clients):
+    """
+    根据 resolve_layout 确定的底包布局规划替换内容（不解压）
+    返回 (需要删除的条目前缀列表, [(条目名, 源文件路径), ...])
+    """
+    # 多客户端构建：assets/Yant/客户端名称 <- vanilla_netease（不含 manifest.json）
+    if isinstance(selected_clients, list) and len(selected_clients) > 1:
+        removed, added = [], []
+        for client in selected_clients:
+            vanilla_netease_src = os.path.join(data_dir, client, "resource_packs", "vanilla_netease")
+            if os.path.exists(vanilla_netease_src):
+                prefix = f"{layout['yant']}{client}/"
+                removed.append(prefix)
+                added.extend(walk_pack_files(vanilla_netease_src, prefix, skip=("manifest.json",)))
+                print(f"已为客户端 {client} 规划资源包到 {prefix}")
+            else:
+                print(f"警告: 客户端 {client} 中没有找到 vanilla_netease 文件夹")
+        return removed, added
+
+    if selected_clients and isinstance(selected_clients, list) and len(selected_clients) == 1:
+        client_dir = os.path.join(data_dir, selected_clients[0])
+    else:
+        client_dir = data_dir
+
+    removed, added = [], []
+    for folder, label in (("resource_packs", "资源包"), ("behavior_packs", "行为包")):
+        src = os.path.join(client_dir, folder)
+        if not os.path.exists(src):
+            continue
+        target = layout[folder]
+        removed.append(target)
+        print(f"将替换{label}: {target}")
+        added.extend(walk_pack_files(src, target))
+    return removed, added
+
+def transform_file(transform, src_path, out_path):
+    """
+    处理一个文件（在进程池中运行）：transform(原始数据) 返回处理后的数据，无法处理时返回 None 或抛出异常
+    结果写到 out_path；没有变小或处理失败时写入空文件，表示使用原文件
+    返回 (原始大小, 处理后大小, 错误信息)
+    """
+    with open(src_path, "rb") as f:
+        data = f.read()
+    error = None
+    try:
+        result = transform(data)
+    except Exception as e:
+        result = None
+        error = str(e)
+    if result is not None and len(result) >= len(data):
+        result = None
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    temp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        if result:
+            f.write(result)
+    os.replace(temp_path, out_path)
+    return len(data), len(result) if result else len(data), error
+
+def transform_pack_files(files, cache, extension, cache_subdir, transform, jobs=None):
+    """
+    在进程池中用 transform(原始数据) -> 处理后的数据 处理指定扩展名的文件（见 transform_file），
+    结果保存在构建缓存的 cache_subdir 目录中，按原文件哈希命名；空文件表示使用原文件
+    返回 (替换了源文件路径的 [(条目名, 源文件路径), ...], 匹配的文件数, 新处理的文件数, 原始大小, 处理后大小)
+    """
+    output_dir = os.path.join(cache.root, cache_subdir)
+    outputs = {}
+    pending = {}
+    for arcname, file_path in files:
+        if not arcname.lower().endswith(extension):
+            continue
+        digest = cache.file_hash(file_path)
+        out_path = os.path.join(output_dir, digest[:2], digest[2:] + extension)
+        outputs[arcname] = out_path
+        if os.path.exists(out_path):
+            cache.touch(out_path)
+        else:
+            pending.setdefault(out_path, file_path)
+
+    before = after = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs or TRANSFORM_PROCESSES) as executor:
+            for file_path, (size, new_size, error) in zip(
+                    pending.values(), executor.map(partial(transform_file, transform), pending.values(), pending.keys(),
+                                                  chunksize=16)):
+                before += size
+                after += new_size
+                if error:
+                    print(f"警告: 无法处理 {file_path}: {error}")
+
+    result = []
+    for arcname, file_path in files:
+        out_path = outputs.get(arcname)
+        if out_path and os.path.getsize(out_path):
+            file_path = out_path
+        result.append((arcname, file_path))
+    return result, len(outputs), len(pending), before, after
+
+def _report_transform(label, matched, processed, before, after):
+    print(f"{label}: {matched} 个文件，新处理 {processed} 个"
+          + (f"，减小 {(before - after) / 1024:.0f} KB ({1 - after / before:.1%})" if before else ""))
+
+def optimize_pack_images(files, cache, jobs=None):
+    """无损优化 PNG，返回替换了源文件路径的 [(条目名, 源文件路径), ...]"""
+    files, *stats = transform_pack_files(files, cache, ".png", "images", pngopt.optimize_png, jobs)
+    _report_transform("图片优化", *stats)
+    return files
+
+def minify_pack_json(files, cache, jobs=None):
+    """压缩 JSON（去掉注释和空白），返回替换了源文件路径的 [(条目名, 源文件路径), ...]"""
+    files, *stats = transform_pack_files(files, cache, ".json", "json", packcheck.minify_json_data, jobs)
+    _report_transform("JSON 压缩", *stats)
+    return files
+
+def prepare_pack_files(files, cache):
+    """按配置执行打包前的资源处理"""
+    if OPTIMIZE_IMAGES:
+        files = optimize_pack_images(files, cache)
+    if MINIFY_JSON:
+        files = minify_pack_json(files, cache)
+    return files
+
+def compression_for(arcname):
+    """
+    按压缩策略返回条目的 (压缩方式, 压缩级别)
+    """
+    name = arcname.lower()
+    if name.endswith(STORED_EXTENSIONS) or any(fnmatchcase(name, pattern) for pattern in STORED_PATTERNS):
+        return apkzip.ZIP_STORED, 0
+    for pattern, level in COMPRESSION_LEVELS:
+        if fnmatchcase(name, pattern):
+            return apkzip.ZIP_DEFLATED, level
+    return apkzip.ZIP_DEFLATED, -1
+
+def compress_pack_file(arcname, file_path, cache=None):
+    """
+    按压缩策略压缩一个文件，返回 (压缩方式, crc, 原始大小, 压缩数据)
+    提供缓存时复用之前压缩好的数据；存储模式的文件不进缓存，避免重复占用磁盘
+    """
+    method, level = compression_for(arcname)
+    if cache is not None and method != apkzip.ZIP_STORED:
+        return cache.compressed(file_path, method, level)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    method, crc, payload = apkzip.compress_bytes(data, method, level)
+    return method, crc, len(data), payload
+
+class SharedPayloads:
+    """
+    跨客户端去重：内容和压缩策略都相同的文件只压缩一次，
+    其它条目直接复用压缩结果；结果只保留到最后一个引用写出为止
+    内存中保留的结果总大小不超过 memory_limit，超出的结果用完即释放，
+    之后的引用再调用 compress_pack_file（命中构建缓存时直接读回压缩数据，没有缓存时重新压缩）
+    """
+
+    def __init__(self, files, cache=None, jobs=None, memory_limit=None):
+        def content_key(item):
+            arcname, file_path = item
+            digest = cache.file_hash(file_path) if cache is not None else hash_file(file_path)
+            return (digest,) + compression_for(arcname)
+
+        with ThreadPoolExecutor(max_workers=jobs or COMPRESS_THREADS) as executor:
+            keys = dict(zip((arcname for arcname, _ in files), executor.map(content_key, files)))
+        counts = Counter(keys.values())
+        # 只记录有重复的条目
+        self.keys = {arcname: key for arcname, key in keys.items() if counts[key] > 1}
+        self.refs = {key: count for key, count in counts.items() if count > 1}
+        self.results = {}  # 内容 -> 压缩结果的 Future；None 表示结果已释放
+        self.memory_limit = DEDUP_MEMORY_LIMIT if memory_limit is None else memory_limit
+        self.held = 0  # 内存中保留的压缩数据大小
+        self.lock = threading.Lock()
+        self.unique = len(self.refs)
+        self.reused_files = 0
+        self.reused_bytes = 0  # 复用的原始数据大小
+        self.reused_compressed = 0  # 复用的压缩数据大小
+        self.reloaded_files = 0  # 超出内存上限、重新读取的条目数
+
+    def compress(self, arcname, file_path, cache=None):
+        key = self.keys.get(arcname)
+        if key is None:
+            return compress_pack_file(arcname, file_path, cache)
+        with self.lock:
+            released = key in self.results and self.results[key] is None
+            future = self.results.get(key)
+            owner = future is None and not released
+            if owner:
+                future = self.results[key] = Future()
+        if released:
+            result = compress_pack_file(arcname, file_path, cache)
+        else:
+            if owner:
+                try:
+                    future.set_result(compress_pack_file(arcname, file_path, cache))
+                except Exception as e:
+                    future.set_exception(e)
+            # 压缩由第一个遇到该内容的线程完成，它已在运行中，这里等待不会死锁
+            result = future.result()
+        with self.lock:
+            size = len(result[3])
+            if released:
+                self.reloaded_files += 1
+            elif owner:
+                if self.held + size <= self.memory_limit:
+                    self.held += size
+                else:
+                    # 超出内存上限：不再保留，正在等待的线程仍能拿到结果
+                    self.results[key] = None
+            else:
+                self.reused_files += 1
+                self.reused_bytes += result[2]
+                self.reused_compressed += size
+            self.refs[key] -= 1
+            if not self.refs[key]:
+                if self.results.pop(key) is not None:
+                    self.held -= size
+        return result
+
+    def report(self):
+        print(f"跨客户端去重: {self.unique} 份重复内容，{self.reused_files} 个条目复用压缩数据，"
+              f"少压缩 {self.reused_bytes / 1024 ** 2:.1f} MB "
+              f"(压缩后 {self.reused_compressed / 1024 ** 2:.1f} MB)")
+        if self.reloaded_files:
+            print(f"跨客户端去重: {self.reloaded_files} 个条目超出内存上限，已重新读取或压缩")
+
+def compress_pack_files(files, cache=None, jobs=None, shared=None):
+    """
+    在线程池中并行压缩文件（zlib 压缩时会释放 GIL），按输入顺序逐个返回
+    (条目名, 源文件路径, 压缩结果)，保证写出顺序稳定
+    提供 shared (SharedPayloads) 时内容相同的文件只压缩一次
+    """
+    jobs = jobs or COMPRESS_THREADS
+    window = jobs * 4  # 限制在途任务数量，避免大包一次性读入内存
+    compress = shared.compress if shared is not None else compress_pack_file
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for arcname, file_path in files:
+            pending.append((arcname, file_path,
+                            executor.submit(compress, arcname, file_path, cache)))
+            if len(pending) >= window:
+                arcname, file_path, future = pending.popleft()
+                yield arcname, file_path, future.result()
+        while pending:
+            arcname, file_path, future = pending.popleft()
+            yield arcname, file_path, future.result()
+
+def rewrite_apk(apk_path, index, output_apk, removed_prefixes, added, cache=None, signer=None,
+                dedup=False):
+    """
+    流式重写 APK：未修改的条目直接复制压缩数据（压缩过的 resources.arsc 改为存储模式），
+    只压缩替换进来的文件，写出时即完成对齐
+    提供 signer 时同时完成 v1 + v2 签名，无需再单独读一遍 APK
+    dedup 为 True 时（多客户端构建）内容相同的文件只压缩一次
+    """
+    try:
+        shared = SharedPayloads(added, cache) if dedup else None
+        removed_prefixes = tuple(removed_prefixes)
+        added_names = {arcname for arcname, _ in added}
+        copied = 0
+        src = apkzip.map_readonly(apk_path)
+        with apkzip.ApkWriter(output_apk, signer=signer) as writer:
+            for i in range(len(index)):
+                name = index.name(i)
+                if name.startswith(removed_prefixes) or name in added_names:
+                    continue
+                copy_base_entry(writer, src, index, i)
+                copied += 1
+            for arcname, file_path, compressed in compress_pack_files(added, cache, shared=shared):
+                writer.add_compressed(arcname, *compressed, timestamp=os.path.getmtime(file_path))
+        print(f"已复制 {copied} 个未修改条目，写入 {len(added)} 个新条目")
+        if shared is not None:
+            shared.report()
+        if cache is not None:
+            print(f"构建缓存: 命中 {cache.hits} 个，重新压缩 {cache.misses} 个")
+        return True
+    except Exception as e:
+        print(f"流式重写 APK 失败: {e}")
+        return False
+
 def check_requirements():
     """检查必要的工具和文件是否存在"""
     missing = []
     
-    if not os.path.exists(APKSIGNER_PATH):
+    if SIGN_ENGINE != "python" and not os.path.exists(APKSIGNER_PATH):
         missing.append(f"apksigner.jar ({APKSIGNER_PATH})")
     
     if not os.path.exists(X509_CERT):
@@ -340,41 +949,173 @@ def check_requirements():
     if not os.path.exists(PK8_KEY):
         missing.append(f"pk8私钥文件 ({PK8_KEY})")
     
-    try:
-        subprocess.run(["java", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except:
+    # 只检查 java 是否在 PATH 中，避免为了检查单独启动一次 JVM
+    if SIGN_ENGINE != "python" and shutil.which("java") is None:
         missing.append("Java运行时环境")
     
+    return missing
+
+def preflight_check(data_dir, clients, cache):
+    """
+    构建前预检资源包和行为包，发现错误时返回 False
+    """
     try:
-        subprocess.run([ZIPALIGN_PATH, "-h"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except:
-        missing.append("zipalign工具")
+        errors, warnings = packcheck.validate_packs(data_dir, clients, cache)
+    except Exception as e:
+        print(f"预检过程中出现错误: {e}")
+        return False
     
-    return missing
+    for warning in warnings[:MAX_PRINTED_WARNINGS]:
+        print(f"警告: {warning}")
+    if len(warnings) > MAX_PRINTED_WARNINGS:
+        print(f"... 另有 {len(warnings) - MAX_PRINTED_WARNINGS} 条警告")
+    if errors:
+        print(f"错误: 资源包预检发现 {len(errors)} 个问题:")
+        for error in errors:
+            print(f" - {error}")
+        return False
+    return True
 
-def build_pc_version():
-    """构建PC平台可执行文件（优化版）"""
+def write_pc_payload(payload_path, data_dir, clients, cache=None):
+    """
+    把客户端的资源包和行为包写入 PC 安装程序的数据包：
+    每个文件单独压缩（复用构建缓存中的压缩结果），内容相同的文件只存一份，
+    安装程序只解压所选客户端的文件
+    """
+    files = []
+    os.makedirs(os.path.dirname(payload_path), exist_ok=True)
+    with payload.PayloadWriter(payload_path) as writer:
+        for client in clients:
+            for folder in packcheck.PACK_FOLDERS:
+                src_dir = os.path.join(data_dir, client, folder)
+                for root, dirs, _ in os.walk(src_dir):
+                    for name in dirs:
+                        rel_path = os.path.relpath(os.path.join(root, name), os.path.join(data_dir, client))
+                        writer.add_dir(client, rel_path.replace(os.sep, "/"))
+                files += walk_pack_files(src_dir, f"{client}/{folder}/")
+        for arcname, file_path, (method, crc, size, data) in compress_pack_files(files, cache):
+            client, rel_path = arcname.split("/", 1)
+            digest = cache.file_hash(file_path) if cache is not None else hash_file(file_path)
+            writer.add(client, rel_path, digest, method, crc, size, data, os.stat(file_path).st_mtime_ns)
+    print(f"数据包: {writer.files} 个文件，{os.path.getsize(payload_path) / 1024 ** 2:.1f} MB"
+          f"（去重 {writer.reused_files} 个文件，节省 {writer.reused_bytes / 1024 ** 2:.1f} MB）")
+    return writer.files
+
+@lru_cache(maxsize=None)
+def pyinstaller_version():
+    """返回 PATH 中 pyinstaller 的版本，无法获取时返回 None（每个进程只查询一次）"""
+    try:
+        result = subprocess.run(["pyinstaller", "--version"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 and result.stdout.strip() else None
+
+def pc_stub_key(cache, build_cmd):
+    """
+    PC 安装程序（不含数据包）的缓存键：install.py 和 payload.py 的哈希、Python 和 PyInstaller 版本、
+    完整的 PyInstaller 命令行、图标和平台
+    无法获取 PyInstaller 版本时返回 None（不使用缓存）
+    """
+    version = pyinstaller_version()
+    if version is None:
+        return None
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parts = [cache.file_hash(os.path.join(script_dir, name)) for name in ("install.py", "payload.py")]
+    parts += [sys.version, version, build_cmd,
+              cache.file_hash(ICON_PATH) if os.path.exists(ICON_PATH) else "", sys.platform]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def save_pc_stub(exe_path, stub_path):
+    """
+    把刚构建的安装程序（附加数据包之前）保存到缓存
+    stub_path 所在目录对应一个安装程序名，每个名称只保留最新的一份
+    """
+    stub_dir = os.path.dirname(stub_path)
+    os.makedirs(stub_dir, exist_ok=True)
+    temp_path = f"{stub_path}.{os.getpid()}.tmp"
+    shutil.copy2(exe_path, temp_path)
+    os.replace(temp_path, stub_path)
+    for name in os.listdir(stub_dir):
+        if name != os.path.basename(stub_path) and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(stub_dir, name))
+            except OSError:
+                pass
+
+def build_pc_version(client=None, cache=None):
+    """
+    构建PC平台可执行文件（优化版），指定客户端时只打包该客户端的数据
+    客户端数据写成带索引的压缩数据包附加在程序末尾，不再通过 --add-data 打包，
+    安装程序启动时无需把所有客户端解压到临时目录
+    程序本身按 install.py、Python 和 PyInstaller 版本、PyInstaller 命令行和图标缓存，
+    命中时跳过 PyInstaller，只重新附加数据包
+    """
     try:
         if not os.path.exists(ICON_PATH):
             print(f"警告: 找不到图标文件 {ICON_PATH}，将不使用图标")
             icon_option = ""
         else:
-            icon_option = f"--icon \"{ICON_PATH}\""
+            icon_option = f"--icon \"{os.path.abspath(ICON_PATH)}\""
         
-        script_name = os.path.basename(__file__)
-        build_cmd = (
-            f"pyinstaller --noconfirm --onefile --console "
-            f"{icon_option} "
-            f"--add-data \"./{DATA_DIR};{DATA_DIR}\" "
-            "\"./install.py\" "
-            f"--distpath ./ "
-            f"--name \"./{APK_NAME.replace('.Apk','')} PC Installer\""
-        )
+        dist_path = os.path.abspath(OUTPUT_DIR or ".")
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        data_dir = os.path.join(script_dir, DATA_DIR)
+        # 与 pc_stub_key 中计算哈希的是同一个文件
+        install_script = os.path.join(script_dir, "install.py")
+        if client:
+            # 并行构建时每个客户端使用独立的工作目录，避免互相覆盖
+            work_path = os.path.abspath(os.path.join("build", client))
+            exe_name = f"{os.path.basename(APK_NAME).replace('.Apk','')} {client} PC Installer"
+            build_cmd = (
+                f"pyinstaller --noconfirm --onefile --console "
+                f"{icon_option} "
+                f"\"{install_script}\" "
+                f"--distpath \"{dist_path}\" "
+                f"--workpath \"{work_path}\" "
+                f"--specpath \"{work_path}\" "
+                f"--name \"{exe_name}\""
+            )
+            clients = [client]
+        else:
+            work_path = os.path.abspath("build")
+            exe_name = f"{os.path.basename(APK_NAME).replace('.Apk','')} PC Installer"
+            build_cmd = (
+                f"pyinstaller --noconfirm --onefile --console "
+                f"{icon_option} "
+                f"\"{install_script}\" "
+                f"--distpath \"{dist_path}\" "
+                f"--name \"./{exe_name}\""
+            )
+            clients = get_available_clients()
+        
+        print("\n正在生成PC安装程序的数据包...")
+        payload_path = os.path.join(work_path, "data.pack")
+        write_pc_payload(payload_path, data_dir, clients, cache)
         
-        print("\n正在构建PC平台可执行文件...")
-        print(f"执行命令: {build_cmd}")
-        subprocess.run(build_cmd, shell=True, check=True)
+        exe_suffix = ".exe" if os.name == "nt" else ""
+        exe_path = os.path.join(dist_path, exe_name + exe_suffix)
+        stub_key = pc_stub_key(cache, build_cmd) if cache is not None else None
+        # 命令行中包含安装程序名，按名称分目录保存，多个客户端的安装程序互不淘汰
+        stub_path = os.path.join(cache.root, PC_STUB_DIR, hashlib.sha256(exe_name.encode("utf-8")).hexdigest()[:16],
+                                 stub_key + exe_suffix) if stub_key else None
+        if stub_path and os.path.exists(stub_path):
+            print(f"\n使用缓存的PC安装程序 ({stub_key[:16]})，跳过 PyInstaller")
+            cache.touch(stub_path)
+            os.makedirs(dist_path, exist_ok=True)
+            if os.path.exists(exe_path):
+                os.remove(exe_path)
+            if not reflink_file(stub_path, exe_path):
+                shutil.copy2(stub_path, exe_path)
+        else:
+            print("\n正在构建PC平台可执行文件...")
+            print(f"执行命令: {build_cmd}")
+            run_tool(build_cmd, "pyinstaller", shell=True)
+            if stub_path:
+                save_pc_stub(exe_path, stub_path)
         
+        payload.attach(exe_path, payload_path)
+        os.remove(payload_path)
+        print(f"数据包已附加到 {exe_path}")
         return True
     except subprocess.CalledProcessError as e:
         print(f"构建失败: {e}")
@@ -387,126 +1128,691 @@ def build_pc_version():
 def verify_alignment(apk_path):
     """验证APK资源对齐"""
     try:
-        # 使用zipalign验证
-        result = subprocess.run([
-            ZIPALIGN_PATH,
-            "-c", "4",
-            apk_path
-        ], capture_output=True, text=True)
+        with open(apk_path, "rb") as f:
+            index = apkzip.ZipIndex.parse(f)
+            misaligned = index.misaligned(f)
         
-        if result.returncode != 0:
-            print(f"对齐验证失败: {result.stderr}")
+        if misaligned:
+            print(f"对齐验证失败: {len(misaligned)} 个条目未对齐")
+            for name in misaligned[:10]:
+                print(f" - {name}")
             return False
         
         # 验证resources.arsc压缩方式
-        with zipfile.ZipFile(apk_path, 'r') as zf:
-            arsc_info = zf.getinfo('resources.arsc')
-            if arsc_info.compress_type != zipfile.ZIP_STORED:
-                print("错误: resources.arsc 未设置为存储模式")
-                return False
+        arsc = index.find("resources.arsc")
+        if arsc is None or index.method[arsc] != apkzip.ZIP_STORED:
+            print("错误: resources.arsc 未设置为存储模式")
+            return False
         
         return True
     except Exception as e:
         print(f"验证过程中出错: {e}")
         return False
 
-def main():
+def build_client_job(apk_path, index, layout, data_dir, client, cache_dir, output_dir, skip=(), origin=None):
+    """
+    批量构建中的单个客户端任务（在进程池中运行）
+    返回该客户端的结果、各阶段耗时和阶段统计
+    """
+    start = time.perf_counter()
+    profiler = BuildProfiler(PROFILE_DIR, PROFILE_STAGES, origin)
+    base_name = os.path.splitext(os.path.basename(apk_path))[0]
+    aligned_apk = os.path.join(output_dir, f"{base_name}_{client}_aligned.apk")
+    final_apk = os.path.join(output_dir, f"{base_name}_{client}_signed.Apk")
+    if "sign" in skip:
+        final_apk = os.path.join(output_dir, f"{base_name}_{client}_zipaligned.Apk")
+    result = {"client": client, "ok": False, "output": final_apk, "timings": {}, "hashes": {},
+              "stages": profiler.stages}
+    timings = result["timings"]
+    
+    try:
+        cache = BuildCache(cache_dir, BUILD_CACHE_MAX_BYTES)
+        with profiler.stage("rewrite_apk", client) as stage:
+            removed_prefixes, added = plan_pack_entries(layout, data_dir, [client])
+            added = prepare_pack_files(added, cache)
+            signer = create_signer() if "sign" not in skip else None
+            ok = rewrite_apk(apk_path, index, aligned_apk, removed_prefixes, added, cache, signer)
+            ok = ok and verify_alignment(aligned_apk)
+            stage["files"] = len(added)
+        timings["rewrite"] = stage["wall_time"]
+        result["hashes"] = cache.manifest["files"]
+        
+        if ok and signer is None and "sign" not in skip:
+            with profiler.stage("sign_apk_with_pem_pk8", client) as stage:
+                ok = sign_apk_with_pem_pk8(aligned_apk)
+            timings["sign"] = stage["wall_time"]
+        if ok:
+            os.replace(aligned_apk, final_apk)
+        if ok and "pc" not in skip:
+            with profiler.stage("build_pc_version", client) as stage:
+                ok = build_pc_version(client, cache)
+            timings["pc"] = stage["wall_time"]
+        result["ok"] = ok
+    except Exception as e:
+        print(f"客户端 {client} 构建过程中出现错误: {e}")
+    
+    timings["total"] = time.perf_counter() - start
+    return result
+
+def print_build_summary(results):
+    """打印每个客户端的耗时汇总"""
+    print("\n构建耗时汇总:")
+    print(f"{'客户端':<17}{'重写':>8}{'签名':>8}{'PC版':>9}{'总计':>8}  结果")
+    for result in results:
+        timings = result["timings"]
+        cells = "".join(
+            f"{timings[stage]:>9.1f}s" if stage in timings else f"{'-':>10}"
+            for stage in ("rewrite", "sign", "pc", "total")
+        )
+        status = "成功" if result["ok"] else "失败"
+        print(f"{result['client']:<20}{cells}  {status}")
+
+def build_clients_in_parallel(apk_path, data_dir, clients, cache, output_dir, skip=(), jobs=None,
+                              profiler=None):
+    """
+    批量构建：只解析一次底包，在进程池中为每个客户端单独生成签名 APK 和 PC 安装程序
+    返回每个客户端的结果列表，读取底包失败时返回空列表
+    """
+    index = load_base_index(apk_path, cache)
+    if index is None:
+        return []
+    candidates = load_layout(apk_path, index, cache)
+    layouts = {}
+    for client in clients:
+        layouts[client], errors = resolve_layout(candidates, data_dir, [client])
+        if errors:
+            print(f"客户端 {client}: {'；'.join(errors)}")
+            return []
+    
+    cache_dir = cache.root
+    jobs = jobs or BATCH_JOBS or min(len(clients), os.cpu_count() or 1)
+    print(f"\n开始批量构建 {len(clients)} 个客户端 (并行进程数: {jobs})...")
+    
+    start = time.perf_counter()
+    results = []
+    # 子进程中同样使用命令行和配置文件修改后的设置（Windows 下子进程会重新导入本模块）
+    with ProcessPoolExecutor(max_workers=jobs, initializer=apply_settings,
+                             initargs=(current_settings(),)) as executor:
+        futures = [
+            executor.submit(build_client_job, apk_path, index, layouts[client], data_dir, client, cache_dir,
+                            output_dir, tuple(skip), profiler.origin if profiler else None)
+            for client in clients
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            cache.manifest["files"].update(result["hashes"])
+            if profiler is not None:
+                profiler.merge(result["stages"], result["client"])
+            results.append(result)
+            print(f"\n客户端 {result['client']} 构建{'完成' if result['ok'] else '失败'}: {result['output']}")
+    
+    try:
+        cache.save()
+    except Exception as e:
+        print(f"保存构建缓存失败: {e}")
+    
+    results.sort(key=lambda result: clients.index(result["client"]))
+    print_build_summary(results)
+    print(f"总耗时: {time.perf_counter() - start:.1f}s")
+    return results
+
+class WatchBuild:
+    """
+    监视模式的构建状态：底包中保留的条目只写出一次，之后每写出一个资源包条目都记录检查点；
+    有变化时回到第一个变化的条目之前，只重新写出从它开始的条目，
+    前面条目的数据、v1 条目摘要和 v2 分块摘要都不再重新计算
+    """
+
+    def __init__(self, apk_path, data_dir, clients, cache, output_apk):
+        self.data_dir = data_dir
+        self.clients = clients
+        self.cache = cache
+        self.output_apk = output_apk
+        self.signer = create_signer()
+        # 进程内签名时直接写到输出文件；否则写到工作文件，每次复制一份再用 apksigner 签名
+        self.work_apk = output_apk if self.signer is not None else output_apk + ".watch"
+        src = apkzip.map_readonly(apk_path)
+        self.index = load_base_index(apk_path, cache)
+        if self.index is None:
+            raise ValueError("无法读取底包中央目录")
+        self.layout, errors = resolve_layout(load_layout(apk_path, self.index, cache), data_dir, clients)
+        if errors:
+            raise ValueError("；".join(errors))
+        removed_prefixes, added = plan_pack_entries(self.layout, data_dir, clients)
+        removed_prefixes = tuple(removed_prefixes)
+        added_names = {arcname for arcname, _ in added}
+        self.writer = apkzip.ApkWriter(self.work_apk, signer=self.signer)
+        for i in range(len(self.index)):
+            name = self.index.name(i)
+            if not name.startswith(removed_prefixes) and name not in added_names:
+                copy_base_entry(self.writer, src, self.index, i)
+        # checkpoints[i] 为写出第 i 个资源包条目之前的状态，emitted[i] 为该条目的 (条目名, 源文件, 大小, 修改时间)
+        self.checkpoints = [self.writer.checkpoint()]
+        self.emitted = []
+        self.ok = False
+
+    def first_changed(self, planned, changed):
+        """返回第一个需要重新写出的条目序号；changed 为 None 或包含 None 时从头写出"""
+        if changed is None or None in changed or not self.ok:
+            return 0
+        for i, (old, new) in enumerate(zip(self.emitted, planned)):
+            if old != new or new[1] in changed:
+                return i
+        return min(len(self.emitted), len(planned))
+
+    def rebuild(self, changed=None):
+        """
+        重新写出发生变化的资源包条目并签名，返回是否成功
+        changed 为监视到的变化路径集合，None 表示全部重新写出
+        """
+        try:
+            _, added = plan_pack_entries(self.layout, self.data_dir, self.clients)
+            planned = []
+            for arcname, file_path in added:
+                stat = os.stat(file_path)
+                planned.append((arcname, file_path, stat.st_size, stat.st_mtime_ns))
+            first = self.first_changed(planned, changed)
+            if self.ok and first == len(self.emitted) == len(planned):
+                print("资源包条目没有变化")
+                return True
+            
+            self.ok = False
+            self.writer.rewind(self.checkpoints[first])
+            del self.checkpoints[first + 1:]
+            del self.emitted[first:]
+            tail = prepare_pack_files(added[first:], self.cache)
+            shared = SharedPayloads(tail, self.cache) if DEDUP_ASSETS and len(self.clients) > 1 else None
+            for (arcname, file_path, compressed), state in zip(
+                    compress_pack_files(tail, self.cache, shared=shared), planned[first:]):
+                self.writer.add_compressed(arcname, *compressed, timestamp=os.path.getmtime(file_path))
+                self.emitted.append(state)
+                self.checkpoints.append(self.writer.checkpoint())
+            self.writer.finish()
+            print(f"重新写出 {len(tail)}/{len(planned)} 个资源包条目，构建缓存: 命中 {self.cache.hits} 个，"
+                  f"重新压缩 {self.cache.misses} 个")
+            self.cache.hits = self.cache.misses = 0
+            if self.signer is None:
+                shutil.copyfile(self.work_apk, self.output_apk)
+                self.ok = sign_apk_with_pem_pk8(self.output_apk)
+            else:
+                self.ok = True
+            return self.ok
+        except Exception as e:
+            print(f"重新构建失败: {e}")
+            return False
+
+    def close(self):
+        self.writer.fp.close()
+        if self.work_apk != self.output_apk and os.path.exists(self.work_apk):
+            os.remove(self.work_apk)
+
+def watch_build(profiler, apk_path, data_dir, clients, cache, output_apk):
+    """
+    --watch 模式：先完整构建一次，之后监视客户端目录，有变化时增量重新构建，按 Ctrl+C 退出
+    """
+    with profiler.stage("watch_initial_build"):
+        build = WatchBuild(apk_path, data_dir, clients, cache, output_apk)
+        ok = build.rebuild()
+    if not ok:
+        build.close()
+        return EXIT_BUILD_FAILED
+    print(f"\n已生成: {output_apk}")
+    
+    watcher = create_watcher([os.path.join(data_dir, client) for client in clients], WATCH_POLL_INTERVAL)
+    print(f"正在监视 {', '.join(clients)} 的资源包和行为包 ({type(watcher).__name__})，按 Ctrl+C 退出")
+    try:
+        while True:
+            changed = wait_for_changes(watcher, WATCH_DEBOUNCE)
+            print(f"\n检测到 {len(changed)} 处变化，正在重新构建...")
+            if VALIDATE_PACKS and not preflight_check(data_dir, clients, cache):
+                print("预检未通过，修改后将再次构建")
+                continue
+            with profiler.stage("watch_rebuild") as stage:
+                ok = build.rebuild(changed)
+            if ok:
+                print(f"已更新 {output_apk} (耗时 {stage['wall_time']:.1f}s)")
+    except KeyboardInterrupt:
+        print("\n已停止监视")
+    finally:
+        watcher.close()
+        build.close()
+        try:
+            cache.save()
+        except Exception as e:
+            print(f"保存构建缓存失败: {e}")
+    return EXIT_OK
+
+def pause():
+    """交互模式下等待用户确认后退出"""
+    if INTERACTIVE:
+        input("按回车键退出...")
+
+def set_key(name):
+    """使用 keys 目录中的一组密钥，如 platform、testkey"""
+    global X509_CERT, PK8_KEY
+    X509_CERT = os.path.join(KEY_DIR, f"{name}.x509.pem")
+    PK8_KEY = os.path.join(KEY_DIR, f"{name}.pk8")
+
+def current_settings():
+    """返回当前的配置常量（传给批量构建的子进程）"""
+    names = set(CONFIG_KEYS.values()) | {"X509_CERT", "PK8_KEY", "INTERACTIVE"}
+    return {name: globals()[name] for name in names}
+
+def apply_settings(settings):
+    globals().update(settings)
+
+def load_config(path):
+    """读取 TOML 或 JSON 配置文件"""
+    with open(path, "rb") as f:
+        if path.lower().endswith(".json"):
+            return json.load(f)
+        if tomllib is None:
+            raise ValueError("当前 Python 版本不支持 TOML 配置文件，请使用 JSON")
+        return tomllib.load(f)
+
+def apply_config(config, base_dir="."):
+    """
+    把配置文件中的设置应用到配置常量上，返回构建选项 (clients, batch, skip, key)
+    路径类配置相对 base_dir（配置文件所在目录）解析为绝对路径
+    密钥名称只记录下来，等 key_dir 和命令行参数都应用后再由 resolve_options 选择密钥文件
+    """
+    options = {}
+    for key, value in config.items():
+        if key in PATH_CONFIG_KEYS and value is not None:
+            value = os.path.abspath(os.path.join(base_dir, value))
+        if key in ("clients", "batch", "skip", "key"):
+            options[key] = value
+        elif key == "compression_levels":
+            # TOML 表按书写顺序匹配，也可以写成 [[模式, 级别], ...]
+            items = value.items() if isinstance(value, dict) else value
+            globals()["COMPRESSION_LEVELS"] = [(pattern, int(level)) for pattern, level in items]
+        elif key in CONFIG_KEYS:
+            if isinstance(value, list):
+                value = tuple(value)
+            globals()[CONFIG_KEYS[key]] = value
+        else:
+            raise ValueError(f"未知的配置项: {key}")
+    return options
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="网易 MCBE 客户端快速构建。不带参数运行时使用交互菜单",
+        epilog="退出码: 0 成功，1 构建失败，2 参数错误，3 缺少输入文件或工具，4 资源包预检失败")
+    parser.add_argument("-c", "--config", help="TOML 或 JSON 配置文件，命令行参数优先")
+    parser.add_argument("--apk", help="底包路径")
+    parser.add_argument("--client", action="append", dest="clients", metavar="NAME",
+                        help="要构建的客户端，可重复或用逗号分隔；多个客户端时为多客户端构建")
+    parser.add_argument("--all-clients", action="store_true", help="选择 data 目录中的全部客户端")
+    parser.add_argument("--batch", action="store_true", default=None, help="每个客户端单独生成 APK")
+    parser.add_argument("--data-dir", help="客户端数据目录")
+    parser.add_argument("-o", "--output-dir", help="输出目录")
+    parser.add_argument("--key", help="keys 目录中的密钥名称，如 platform、testkey")
+    parser.add_argument("--sign-engine", choices=("apksigner", "python"), help="签名方式")
+    parser.add_argument("--store", action="append", default=[], metavar="PATTERN",
+                        help="不压缩的条目模式，如 '*.ogg'（可重复）")
+    parser.add_argument("--level", action="append", default=[], metavar="PATTERN=LEVEL",
+                        help="按模式设置压缩级别，如 '*.json=9'（可重复，优先于默认策略）")
+    parser.add_argument("-j", "--jobs", type=int, help="并行压缩、处理资源和批量构建的进程/线程数")
+    parser.add_argument("--skip", action="append", default=[], choices=SKIPPABLE_STAGES,
+                        help="跳过的阶段（可重复）")
+    parser.add_argument("--watch", action="store_true",
+                        help="构建后监视客户端目录，文件变化时增量重新构建（跳过备份、PC 版和清理）")
+    parser.add_argument("--json", action="store_true", help="在标准输出打印 JSON 格式的构建结果，日志改为输出到标准错误")
+    return parser.parse_args(argv)
+
+def resolve_options(args):
+    """
+    合并配置文件和命令行参数，返回 (clients, batch, skip)；clients 为 None 时使用交互菜单
+    """
+    global STORED_PATTERNS, COMPRESSION_LEVELS, COMPRESS_THREADS, TRANSFORM_PROCESSES, BATCH_JOBS, SIGN_ENGINE
+    global SIGN_SERVER_SOURCE
+    options = {}
+    if args.config:
+        options = apply_config(load_config(args.config), os.path.dirname(os.path.abspath(args.config)))
+    for name, value in (("APK_NAME", args.apk), ("DATA_DIR", args.data_dir), ("OUTPUT_DIR", args.output_dir)):
+        if value is not None:
+            globals()[name] = os.path.abspath(value)
+    if args.sign_engine is not None:
+        SIGN_ENGINE = args.sign_engine
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    for key in PATH_CONFIG_KEYS:
+        name = CONFIG_KEYS[key]
+        if globals()[name] is not None and not os.path.isabs(globals()[name]):
+            globals()[name] = os.path.join(script_dir, globals()[name])
+    SIGN_SERVER_SOURCE = os.path.join(script_dir, SIGN_SERVER_SOURCE)
+    # 密钥文件依赖 KEY_DIR，放在所有设置都应用之后，与配置文件中键的顺序无关
+    set_key(args.key or options.get("key") or "platform")
+    STORED_PATTERNS = tuple(STORED_PATTERNS) + tuple(args.store)
+    levels = []
+    for item in args.level:
+        pattern, _, level = item.rpartition("=")
+        if not pattern or not level.lstrip("-").isdigit():
+            raise ValueError(f"无效的压缩级别: {item}")
+        levels.append((pattern, int(level)))
+    COMPRESSION_LEVELS = levels + list(COMPRESSION_LEVELS)
+    if args.jobs:
+        COMPRESS_THREADS = TRANSFORM_PROCESSES = BATCH_JOBS = args.jobs
+
+    clients = options.get("clients")
+    if args.clients:
+        clients = [name.strip() for item in args.clients for name in item.split(",") if name.strip()]
+    if args.all_clients:
+        clients = get_available_clients()
+    if isinstance(clients, str):
+        clients = [clients]
+    batch = args.batch if args.batch is not None else bool(options.get("batch", False))
+    skip = set(options.get("skip", ())) | set(args.skip)
+    if args.watch:
+        if batch or not STREAM_REWRITE:
+            raise ValueError("--watch 不支持批量构建，且需要启用 STREAM_REWRITE")
+        skip |= {"backup", "pc", "clean"}
+    unknown = skip - set(SKIPPABLE_STAGES)
+    if unknown:
+        raise ValueError(f"未知的阶段: {', '.join(sorted(unknown))}")
+    return clients, batch, skip
+
+def run_build(profiler, clients=None, batch=False, skip=(), summary=None, watch=False):
+    """
+    构建流程，每个阶段的统计记录到 profiler 中，结果写入 summary，返回退出码
+    clients 为 None 时显示交互菜单；watch 为 True 时进入监视模式
+    """
+    summary = {} if summary is None else summary
     print("网易 MCBE 客户端快速构建")
     print("=" * 60)
     
     # 获取可用客户端列表
-    clients = get_available_clients()
-    if not clients:
+    available_clients = get_available_clients()
+    if not available_clients:
         print(f"错误: 在 {DATA_DIR} 目录中没有找到任何客户端配置")
-        input("按回车键退出...")
-        return
+        pause()
+        return EXIT_MISSING_INPUT
     
-    # 显示客户端选择菜单
-    selected_clients = display_client_menu(clients)
+    if clients is None:
+        # 显示客户端选择菜单
+        selected_clients, batch = display_client_menu(available_clients)
+    else:
+        selected_clients = list(clients)
+        unknown = [client for client in selected_clients if client not in available_clients]
+        if unknown:
+            print(f"错误: 找不到客户端: {', '.join(unknown)}")
+            return EXIT_MISSING_INPUT
     if not selected_clients:
         print("错误: 没有选择任何客户端")
-        input("按回车键退出...")
-        return
+        pause()
+        return EXIT_USAGE
+    summary.update(clients=selected_clients, mode="batch" if batch else
+                   "multi" if len(selected_clients) > 1 else "single")
     
     print(f"\n已选择客户端: {', '.join(selected_clients)}")
+    if batch:
+        print("构建模式: 批量构建 (每个客户端单独生成 APK)")
     
     apk_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), APK_NAME)
     
     if not os.path.exists(apk_path):
         print(f"错误: 找不到底包文件 {APK_NAME}")
         print("请确保底包文件与脚本在同一目录下")
-        input("按回车键退出...")
-        return
-    
-    missing = check_requirements()
-    if missing:
-        print("错误: 缺少必要的工具或文件:")
-        for item in missing:
-            print(f" - {item}")
-        input("按回车键退出...")
-        return
-    
-    # 创建备份
-    print("\n正在创建原始APK备份...")
-    backup_path = create_backup(apk_path)
-    if not backup_path:
-        confirm = input("备份失败，是否继续? (y/n): ").lower()
-        if confirm != 'y':
-            return
+        pause()
+        return EXIT_MISSING_INPUT
     
     data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATA_DIR)
     if not os.path.exists(data_dir):
         print(f"错误: 找不到 {DATA_DIR} 目录")
-        input("按回车键退出...")
-        return
+        pause()
+        return EXIT_MISSING_INPUT
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        print("\n步骤 1/5: 解压 APK...")
-        if not extract_apk(apk_path, temp_dir):
-            input("按回车键退出...")
-            return
-        
-        print("\n步骤 2/5: 修改资源包和行为包...")
-        if not modify_packs(temp_dir, data_dir, selected_clients):
-            input("按回车键退出...")
-            return
-        
-        output_dir = os.path.dirname(apk_path)
-        base_name = os.path.splitext(os.path.basename(apk_path))[0]
-        unsigned_apk = os.path.join(output_dir, f"{base_name}_unsigned.apk")
-        aligned_apk = os.path.join(output_dir, f"{base_name}_aligned.apk")
-        final_apk = os.path.join(output_dir, f"{base_name}_signed.Apk")
-        
-        print("\n步骤 3/5: 重新打包 APK...")
-        if not repack_apk(temp_dir, unsigned_apk):
-            input("按回车键退出...")
-            return
-
-        print("\n步骤 4/5: 对齐 APK...")
-        if not zipalign_apk(unsigned_apk, aligned_apk):
-            input("按回车键退出...")
-            return
-
-        print("\n步骤 5/5: V1+V2签名 APK...")
-        if not sign_apk_with_pem_pk8(aligned_apk):
-            input("按回车键退出...")
-            return
-        
-        os.rename(aligned_apk, final_apk)
-        os.remove(unsigned_apk)
+    cache = BuildCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), BUILD_CACHE_DIR),
+                       BUILD_CACHE_MAX_BYTES)
+    output_dir = os.path.abspath(OUTPUT_DIR) if OUTPUT_DIR else os.path.dirname(apk_path)
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(apk_path))[0]
+    unsigned_apk = os.path.join(output_dir, f"{base_name}_unsigned.apk")
+    aligned_apk = os.path.join(output_dir, f"{base_name}_aligned.apk")
+    final_apk = os.path.join(output_dir, f"{base_name}_signed.Apk")
+    if "sign" in skip:
+        final_apk = os.path.join(output_dir, f"{base_name}_zipaligned.Apk")
+    
+    # 各阶段按依赖关系并行执行：检查工具、预检、记录底包状态和读取中央目录同时进行，
+    # PC 安装程序与 APK 同时构建；任一阶段失败时取消其余阶段
+    pipeline = Pipeline(profiler, PIPELINE_JOBS)
+    state = {"backup": None, "index": None, "layout": None, "results": []}
+    exit_codes = {"check_requirements": EXIT_MISSING_INPUT, "preflight_check": EXIT_VALIDATION,
+                  "probe_layout": EXIT_VALIDATION}
+    
+    def requirements(record):
+        missing = check_requirements()
+        if missing:
+            print("错误: 缺少必要的工具或文件:")
+            for item in missing:
+                print(f" - {item}")
+        return not missing
+    
+    def preflight(record):
+        return preflight_check(data_dir, selected_clients, cache)
+    
+    def base_apk(record):
+        # 构建过程中只读取底包，不再复制备份；交互模式下记录失败时只提示，不中断其它阶段
+        state["backup"] = check_base_apk(apk_path, cache)
+        if state["backup"] is None and INTERACTIVE:
+            print("警告: 无法记录底包状态，构建后不再确认底包未被修改")
+            return True
+        return state["backup"] is not None
+    
+    def base_index(record):
+        state["index"] = load_base_index(apk_path, cache)
+        if state["index"] is None:
+            return False
+        record["files"] = len(state["index"])
+        return True
+    
+    def layout(record):
+        # 只根据中央目录探测底包布局（按底包哈希缓存），位置无法确定时直接报错，不再猜测
+        candidates = load_layout(apk_path, state["index"], cache)
+        print(f"底包布局: {describe_layout(candidates)}")
+        groups = [[client] for client in selected_clients] if batch else [selected_clients]
+        layout_errors = []
+        for group in groups:
+            state["layout"], errors = resolve_layout(candidates, data_dir, group)
+            layout_errors += [f"{group[0]}: {error}" if batch else error for error in errors]
+        if layout_errors:
+            print("错误: 无法确定资源包的替换位置:")
+            for error in dict.fromkeys(layout_errors):
+                print(f" - {error}")
+        return not layout_errors
+    
+    checks = [pipeline.add("check_requirements", requirements, title="检查工具和密钥")]
+    if VALIDATE_PACKS and "preflight" not in skip:
+        checks.append(pipeline.add("preflight_check", preflight, lane="preflight", title="预检: 检查资源包和行为包"))
+    if "backup" not in skip:
+        checks.append(pipeline.add("check_base_apk", base_apk, lane="backup", title="记录底包状态"))
+    pipeline.add("load_base_index", base_index, title="读取 APK 中央目录")
+    checks.append(pipeline.add("probe_layout", layout, ["load_base_index"], title="探测底包布局"))
+    
+    if watch:
+        ok = pipeline.run()
+        if not ok:
+            pause()
+            return exit_codes.get(pipeline.failed, EXIT_BUILD_FAILED)
+        summary["outputs"] = [final_apk]
+        return watch_build(profiler, apk_path, data_dir, selected_clients, cache, final_apk)
+    
+    if batch:
+        def build_batch(record):
+            state["results"] = build_clients_in_parallel(apk_path, data_dir, selected_clients, cache,
+                                                         output_dir, skip, profiler=profiler)
+            return bool(state["results"]) and all(result["ok"] for result in state["results"])
         
-        print(f"\n处理完成! 已签名的 APK 保存在: {final_apk}")
+        pipeline.add("build_clients_in_parallel", build_batch, checks)
+    else:
+        # 进程内签名在流式重写时一并完成，解压模式下仍单独签名
+        in_process_sign = STREAM_REWRITE and SIGN_ENGINE == "python" and "sign" not in skip
+        if STREAM_REWRITE:
+            def plan(record):
+                state["removed"], state["added"] = plan_pack_entries(state["layout"], data_dir, selected_clients)
+                record["files"] = len(state["added"])
+                return True
+            
+            def prepare(record):
+                state["added"] = prepare_pack_files(state["added"], cache)
+                record["files"] = len(state["added"])
+                return True
+            
+            def rewrite(record):
+                signer = create_signer() if in_process_sign else None
+                record["files"] = len(state["index"]) + len(state["added"])
+                return rewrite_apk(apk_path, state["index"], aligned_apk, state["removed"], state["added"],
+                                   cache, signer, dedup=DEDUP_ASSETS and len(selected_clients) > 1)
+            
+            last = pipeline.add("plan_pack_entries", plan, ["probe_layout"], title="规划资源包和行为包替换")
+            if OPTIMIZE_IMAGES or MINIFY_JSON:
+                last = pipeline.add("prepare_pack_files", prepare, [last])
+            # 进程内签名需要先确认密钥存在
+            last = pipeline.add("rewrite_apk", rewrite, [last] + (["check_requirements"] if in_process_sign else []),
+                                title=f"流式重写{'、对齐并签名' if in_process_sign else '并对齐'} APK")
+            last = pipeline.add("verify_alignment", lambda record: verify_alignment(aligned_apk), [last],
+                                title="验证 APK 对齐")
+        else:
+            # 临时目录放在脚本目录下，与 data 在同一个分区，才能使用硬链接暂存资源包
+            temp_dir = tempfile.mkdtemp(prefix=".staging_", dir=os.path.dirname(os.path.abspath(__file__)))
+            
+            def prepare(record):
+                # 用处理后的文件替换暂存的资源包文件（stage_file 会先删除原链接，不会改动 data 目录）
+                staged = [(arcname, file_path) for arcname, file_path in walk_pack_files(temp_dir, "")
+                          if "_packs/" in arcname or arcname.startswith("assets/Yant/")]
+                for (_, staged_path), (_, file_path) in zip(staged, prepare_pack_files(staged, cache)):
+                    if file_path != staged_path:
+                        stage_file(file_path, staged_path)
+                return True
+            
+            def repack(record):
+                ok = repack_apk(temp_dir, unsigned_apk)
+                record["files"] = sum(len(names) for _, _, names in os.walk(temp_dir))
+                return ok
+            
+            def zipalign(record):
+                ok = zipalign_apk(unsigned_apk, aligned_apk)
+                if ok:
+                    os.remove(unsigned_apk)
+                return ok
+            
+            last = pipeline.add("extract_apk", lambda record: extract_apk(apk_path, temp_dir, state["index"]),
+                                ["load_base_index"], title="解压 APK")
+            last = pipeline.add("modify_packs",
+                                lambda record: modify_packs(temp_dir, data_dir, selected_clients, state["layout"]),
+                                [last, "probe_layout"], title="修改资源包和行为包")
+            if OPTIMIZE_IMAGES or MINIFY_JSON:
+                last = pipeline.add("prepare_pack_files", prepare, [last])
+            last = pipeline.add("repack_apk", repack, [last], title="重新打包 APK")
+            last = pipeline.add("zipalign_apk", zipalign, [last], title="对齐 APK")
         
-        # 自动还原备份到当前目录
-        print("\n正在还原原始APK备份...")
-        restore_backup(backup_path, apk_path)
+        if "sign" not in skip and not in_process_sign:
+            last = pipeline.add("sign_apk_with_pem_pk8", lambda record: sign_apk_with_pem_pk8(aligned_apk),
+                                [last, "check_requirements"], title="V1+V2签名 APK")
         
-        # 构建PC版本
-        build_pc_version()
+        def finish(record):
+            os.replace(aligned_apk, final_apk)
+            summary["outputs"] = [final_apk]
+            print(f"\n处理完成! {'已签名的 ' if 'sign' not in skip else ''}APK 保存在: {final_apk}")
+            return True
         
-        # 清理临时文件
-        clean_up()
-        input("按回车键退出...")
+        # 所有检查通过后才写出最终文件
+        pipeline.add("finish_apk", finish, [last] + checks)
+        if "pc" not in skip:
+            # PC 安装程序失败不影响 APK，结果单独报告
+            pipeline.add("build_pc_version", lambda record: build_pc_version(cache=cache), ["preflight_check"],
+                         lane="pc", title="构建PC安装程序", optional=True)
+    
+    try:
+        ok = pipeline.run()
+    finally:
+        if not batch and not STREAM_REWRITE:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    if not ok and not batch:
+        # 检查与构建同时进行，检查失败时删除已经生成的中间文件
+        for path in (unsigned_apk, aligned_apk):
+            if os.path.isfile(path):
+                os.remove(path)
+    
+    pc_failed = "build_pc_version" in pipeline.failed_optional
+    if ok and "build_pc_version" in pipeline.stages:
+        summary["pc_ok"] = not pc_failed
+        if pc_failed:
+            print("\n错误: PC安装程序构建失败（APK 已生成）")
+    
+    if batch:
+        summary["results"] = [{key: result[key] for key in ("client", "ok", "output", "timings")}
+                              for result in state["results"]]
+        summary["outputs"] = [result["output"] for result in state["results"] if result["ok"]]
+    else:
+        # 批量构建时各子进程的缓存记录已合并保存
+        try:
+            evicted = cache.save()
+            if evicted:
+                print(f"构建缓存已淘汰 {evicted} 个旧条目")
+        except Exception as e:
+            print(f"保存构建缓存失败: {e}")
+    
+    # 确认底包未被修改
+    if state["backup"]:
+        print("\n正在确认底包未被修改...")
+        with profiler.stage("verify_base_apk"):
+            verify_base_apk(state["backup"])
+    
+    # 清理临时文件
+    if ok and "clean" not in skip:
+        with profiler.stage("clean_up"):
+            clean_up()
+    profiler.summary()
+    pause()
+    if not ok:
+        return exit_codes.get(pipeline.failed, EXIT_BUILD_FAILED)
+    return EXIT_BUILD_FAILED if pc_failed else EXIT_OK
+
+def main(argv=None):
+    global INTERACTIVE
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    INTERACTIVE = not argv
+    
+    json_out = None
+    if args.json:
+        # 标准输出只留给 JSON 结果，日志（包括子进程的输出）改到标准错误
+        sys.stdout.flush()
+        json_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    summary = {}
+    profiler = BuildProfiler(PROFILE_DIR, PROFILE_STAGES)
+    start = time.perf_counter()
+    try:
+        try:
+            clients, batch, skip = resolve_options(args)
+            profiler.output_dir = PROFILE_DIR
+        except (OSError, ValueError) as e:
+            print(f"错误: 配置无效: {e}")
+            exit_code = EXIT_USAGE
+        else:
+            if clients is None and not INTERACTIVE:
+                print("错误: 请使用 --client、--all-clients 或配置文件中的 clients 指定客户端")
+                exit_code = EXIT_USAGE
+            else:
+                exit_code = run_build(profiler, clients, batch, skip, summary, args.watch)
+    finally:
+        if profiler.stages:
+            try:
+                report_path, trace_path = profiler.save()
+                print(f"阶段统计已保存: {report_path}, {trace_path}")
+            except Exception as e:
+                print(f"保存阶段统计失败: {e}")
+    
+    if json_out is not None:
+        sys.stdout.flush()
+        summary.update(ok=exit_code == EXIT_OK, exit_code=exit_code,
+                       elapsed=time.perf_counter() - start, stages=profiler.stages)
+        json.dump(summary, json_out, ensure_ascii=False, indent=2)
+        json_out.write("\n")
+        json_out.close()
+    return exit_code
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,11 +1,58 @@
+import hashlib
+import json
 import os
 import shutil
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import payload
+
+SYNC_THREADS = 8  # 同步文件时的并行线程数
+HASH_BUFFER_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 16 * 1024 * 1024  # 复制文件时每次交给内核的大小
+STAGING_SUFFIX = ".installing"  # 暂存目录：与目标在同一目录下，完成后改名替换
+OLD_SUFFIX = ".old"  # 替换时旧目录的临时名称
+JOURNAL_SUFFIX = ".installing.journal"  # 记录已完成的文件，中断后可以继续
+JOURNAL_COMPLETE = "__complete__"
+PAYLOAD_NAME = "data.pack"  # 未附加到安装程序末尾时，与程序放在同一目录的数据包
+PACK_FOLDERS = ("resource_packs", "behavior_packs")
+INSTALL_STATE_SUFFIX = ".installed.json"  # 记录上次安装的来源以及每个文件安装前后的大小和修改时间
+SEARCH_MAX_DEPTH = 6  # 查找 packs 文件夹时的最大目录深度
+SEARCH_PRUNE_DIRS = {  # 查找时跳过的目录（小写）
+    ".git", "__pycache__", "node_modules", "cache", "caches", "shadercache",
+    "log", "logs", "crash", "crashes", "temp", "tmp", "screenshots",
+    "$recycle.bin", "system volume information", "windows",
+}
+LOCATOR_CACHE_PATH = os.path.join(  # 记录已找到的客户端路径，下次直接使用
+    os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "netease_pack_locator.json")
+
+def open_data_source(script_dir):
+    """
+    查找客户端数据：优先使用附加在安装程序末尾的数据包，其次是程序旁边的 data.pack，
+    最后是 data 文件夹（直接运行脚本时）
+    返回 payload.PayloadReader 或 data 文件夹路径，都没有时返回 None
+    """
+    candidates = []
+    if getattr(sys, "frozen", False):
+        candidates.append(sys.executable)
+        candidates.append(os.path.join(os.path.dirname(sys.executable), PAYLOAD_NAME))
+    candidates.append(os.path.join(script_dir, PAYLOAD_NAME))
+    for path in candidates:
+        start = payload.find_payload(path)
+        if start is not None:
+            return payload.PayloadReader(path, start)
+    data_folder = os.path.join(script_dir, "data")
+    return data_folder if os.path.exists(data_folder) else None
 
 def get_available_clients(data_folder):
     """
-    获取data文件夹中可用的客户端列表
+    获取data文件夹（或数据包）中可用的客户端列表
     """
+    if isinstance(data_folder, payload.PayloadReader):
+        return data_folder.client_names()
     clients = []
     if not os.path.exists(data_folder):
         return clients
@@ -21,62 +68,423 @@ def get_available_clients(data_folder):
     
     return sorted(clients)
 
-def find_minecraft_packs_folders(client_path):
+def load_locator_cache():
+    """读取已找到的客户端路径缓存"""
+    try:
+        with open(LOCATOR_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_locator_cache(cache):
+    """保存客户端路径缓存，先写临时文件再替换，中断时不会留下不完整的缓存；失败时忽略"""
+    temp_path = f"{LOCATOR_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, LOCATOR_CACHE_PATH)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+def search_packs_folders(root, max_depth=SEARCH_MAX_DEPTH):
     """
-    在 Minecraft 客户端路径中查找 resource_packs 和 behavior_packs 文件夹
+    从 root 开始按广度优先查找 resource_packs 和 behavior_packs 文件夹
+    限制深度并跳过无关目录，两个都找到后立即停止
     """
     resource_packs_path = None
     behavior_packs_path = None
+    queue = deque([(root, 0)])
+    while queue and not (resource_packs_path and behavior_packs_path):
+        path, depth = queue.popleft()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            name = entry.name.lower()
+            if name == "resource_packs":
+                resource_packs_path = resource_packs_path or entry.path
+            elif name == "behavior_packs":
+                behavior_packs_path = behavior_packs_path or entry.path
+            elif depth + 1 < max_depth and name not in SEARCH_PRUNE_DIRS:
+                # 不进入 packs 文件夹内部，其中可能有成千上万个文件
+                queue.append((entry.path, depth + 1))
+    return resource_packs_path, behavior_packs_path
+
+def find_minecraft_packs_folders(client_path):
+    """
+    在 Minecraft 客户端路径中查找 resource_packs 和 behavior_packs 文件夹
+    client_path 可以是一个路径、用分号分隔的多个路径或路径列表，多个路径会并行查找
+    """
+    if isinstance(client_path, str):
+        roots = [path.strip() for path in client_path.split(";") if path.strip()]
+    else:
+        roots = list(client_path)
+    roots = [os.path.abspath(root) for root in roots if os.path.isdir(root)]
     
-    # 检查常见的位置
-    common_paths = [
-        os.path.join(client_path, "resource_packs"),
-        os.path.join(client_path, "behavior_packs"),
-    ]
-    
-    # 遍历常见路径
-    for path in common_paths:
-        if os.path.exists(path):
-            if "resource" in path.lower():
-                resource_packs_path = path
-            elif "behavior" in path.lower():
-                behavior_packs_path = path
-    
-    # 如果没找到，尝试递归搜索
-    if not resource_packs_path or not behavior_packs_path:
-        for root, dirs, files in os.walk(client_path):
-            if "resource_packs" in dirs and not resource_packs_path:
-                resource_packs_path = os.path.join(root, "resource_packs")
-            if "behavior_packs" in dirs and not behavior_packs_path:
-                behavior_packs_path = os.path.join(root, "behavior_packs")
-            if resource_packs_path and behavior_packs_path:
+    # 优先使用之前找到的结果（只缓存两个文件夹都找到的结果）
+    cache = load_locator_cache()
+    for root in roots:
+        cached = cache.get(os.path.normcase(root))
+        if cached and all(path and os.path.isdir(path) for path in cached):
+            return tuple(cached)
+    
+    def locate(root):
+        # 检查常见的位置
+        resource_packs_path = os.path.join(root, "resource_packs")
+        behavior_packs_path = os.path.join(root, "behavior_packs")
+        found = (resource_packs_path if os.path.isdir(resource_packs_path) else None,
+                 behavior_packs_path if os.path.isdir(behavior_packs_path) else None)
+        if all(found):
+            return found
+        # 如果没找到，按广度优先有限深度搜索
+        searched = search_packs_folders(root)
+        return found[0] or searched[0], found[1] or searched[1]
+    
+    with ThreadPoolExecutor(max_workers=max(1, len(roots))) as executor:
+        results = list(executor.map(locate, roots))
+    
+    # 优先选择两个文件夹都找到的路径，其次是找到任意一个的路径
+    # 只找到一个时不缓存，缺少的文件夹创建后下次还能找到
+    for root, found in sorted(zip(roots, results), key=lambda item: not all(item[1])):
+        if all(found):
+            cache[os.path.normcase(root)] = list(found)
+            save_locator_cache(cache)
+        if any(found):
+            return found
+    return None, None
+
+def file_hash(path):
+    """计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def list_files(folder):
+    """
+    列出目录中的所有文件，返回 {相对路径: os.stat_result}
+    """
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, folder)] = os.stat(path)
+    return files
+
+def load_install_state(dst_folder):
+    """读取上次安装的记录，没有记录时返回空字典"""
+    try:
+        with open(dst_folder + INSTALL_STATE_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_install_state(dst_folder, source, files):
+    state_path = dst_folder + INSTALL_STATE_SUFFIX
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": str(source), "files": files}, f, ensure_ascii=False)
+    os.replace(temp_path, state_path)
+
+def is_same_file(source, rel_path, dst_path, src_stat, dst_stat, record=None):
+    """
+    record 为上次从同一来源安装该文件时记录的 [源大小, 源修改时间, 目标大小, 目标修改时间]；
+    源文件和目标文件都与记录完全一致时直接视为未变化，其它情况都比较哈希
+    （不同客户端的同名文件常常大小相同、修改时间只差几毫秒，不能只凭大小和时间判断）
+    """
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if record == [src_stat.st_size, src_stat.st_mtime_ns, dst_stat.st_size, dst_stat.st_mtime_ns]:
+        return True
+    if source.hash(rel_path) != file_hash(dst_path):
+        return False
+    # 内容相同，同步修改时间，下次无需再计算哈希
+    os.utime(dst_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    return True
+
+class SyncProgress:
+    """按文件数和字节数显示同步进度"""
+
+    def __init__(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.last_print = 0
+
+    def update(self, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            now = time.monotonic()
+            if now - self.last_print < 0.2 and self.files != self.total_files:
+                return
+            self.last_print = now
+            print(f"\r  已复制 {self.files}/{self.total_files} 个文件, "
+                  f"{self.bytes / 1024 ** 2:.1f}/{self.total_bytes / 1024 ** 2:.1f} MB",
+                  end="", flush=True)
+
+def copy_file(src_path, dst_path):
+    """
+    复制文件并保留修改时间，支持时使用 copy_file_range / sendfile 在内核中完成，
+    否则使用大缓冲区复制
+    """
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        copied = 0
+        kernel_copies = [getattr(os, "copy_file_range", None)]
+        if sys.platform.startswith("linux"):
+            kernel_copies.append(lambda src_fd, dst_fd, count: os.sendfile(dst_fd, src_fd, None, count))
+        for kernel_copy in kernel_copies:
+            if kernel_copy is None:
+                continue
+            try:
+                while copied < size:
+                    count = kernel_copy(src.fileno(), dst.fileno(), min(COPY_CHUNK_SIZE, size - copied))
+                    if not count:
+                        break
+                    copied += count
                 break
+            except OSError:
+                # 文件系统不支持，从当前位置继续用下一种方式复制
+                continue
+        if copied < size:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    shutil.copystat(src_path, dst_path)
+
+def link_or_copy(src_path, dst_path):
+    """硬链接目标中未变化的文件，失败时复制"""
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        copy_file(src_path, dst_path)
+
+class DirectorySource:
+    """
+    文件夹中的文件来源；数据包中的文件来源见 payload.PayloadSource
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def __str__(self):
+        return self.folder
+
+    def list_files(self):
+        return list_files(self.folder)
+
+    def list_dirs(self):
+        return [os.path.relpath(os.path.join(root, name), self.folder)
+                for root, dirs, _ in os.walk(self.folder) for name in dirs]
+
+    def hash(self, rel_path):
+        return file_hash(os.path.join(self.folder, rel_path))
+
+    def copy_to(self, rel_path, dst_path):
+        copy_file(os.path.join(self.folder, rel_path), dst_path)
+
+def open_client_sources(data_source, client):
+    """
+    返回客户端的 {"resource_packs": 文件来源, "behavior_packs": 文件来源}，不存在的文件夹为 None
+    """
+    if isinstance(data_source, payload.PayloadReader):
+        return {folder: data_source.source(client, folder) for folder in PACK_FOLDERS}
+    sources = {}
+    for folder in PACK_FOLDERS:
+        path = os.path.join(data_source, client, folder)
+        sources[folder] = DirectorySource(path) if os.path.exists(path) else None
+    return sources
+
+def read_journal(journal_path):
+    """
+    读取安装日志，返回 ({相对路径: [大小, 修改时间]}, 是否已完成暂存)
+    日志逐行追加，中断时最后一行可能不完整，直接忽略
+    """
+    done = {}
+    complete = False
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record == JOURNAL_COMPLETE:
+                    complete = True
+                else:
+                    done[record[0]] = record[1:]
+    except OSError:
+        pass
+    return done, complete
+
+def recover_install(dst_folder):
+    """
+    处理上次在替换目录时中断留下的状态：
+    - 目标不存在、旧目录存在：暂存已完成则继续替换，否则还原旧目录
+    - 目标和旧目录都存在：替换已完成，删除旧目录
+    """
+    staging_folder = dst_folder + STAGING_SUFFIX
+    old_folder = dst_folder + OLD_SUFFIX
+    journal_path = dst_folder + JOURNAL_SUFFIX
+    if not os.path.isdir(old_folder):
+        return
+    if os.path.isdir(dst_folder):
+        shutil.rmtree(old_folder)
+        return
+    _, complete = read_journal(journal_path)
+    if complete and os.path.isdir(staging_folder):
+        os.rename(staging_folder, dst_folder)
+        os.remove(journal_path)
+        shutil.rmtree(old_folder)
+        print(f"  已完成上次中断的替换: {dst_folder}")
+    else:
+        os.rename(old_folder, dst_folder)
+        print(f"  已还原上次中断前的文件夹: {dst_folder}")
+
+def install_folder(source, dst_folder):
+    """
+    先在目标旁边的暂存目录中生成完整的新文件夹，再改名替换：
+    - source 为文件夹路径、DirectorySource 或数据包中的 PayloadSource
+    - 目标中未变化的文件直接硬链接，只复制有变化的文件
+    - 每完成一个文件就写入日志，中断后再次运行会跳过已完成的文件
+    - 替换前目标文件夹保持不变，任何时候中断都不会留下不完整的资源包
+    """
+    dst_folder = os.path.normpath(dst_folder)
+    staging_folder = dst_folder + STAGING_SUFFIX
+    old_folder = dst_folder + OLD_SUFFIX
+    journal_path = dst_folder + JOURNAL_SUFFIX
+    recover_install(dst_folder)
+    if isinstance(source, str):
+        source = DirectorySource(source)
     
-    return resource_packs_path, behavior_packs_path
+    src_files = source.list_files()
+    dst_files = list_files(dst_folder) if os.path.isdir(dst_folder) else {}
+    state = load_install_state(dst_folder)
+    records = state.get("files", {}) if state.get("source") == str(source) else {}
+    done, complete = read_journal(journal_path)
+    if not os.path.isdir(staging_folder):
+        done, complete = {}, False
+    
+    # 日志中记录的源文件大小和修改时间未变，且暂存文件存在时视为已完成
+    def is_done(rel_path):
+        src_stat = src_files[rel_path]
+        record = done.get(rel_path)
+        return (record == [src_stat.st_size, src_stat.st_mtime_ns]
+                and os.path.exists(os.path.join(staging_folder, rel_path)))
+    
+    pending = [rel_path for rel_path in src_files if not is_done(rel_path)]
+    resumed = len(src_files) - len(pending)
+    if resumed:
+        print(f"  继续上次中断的安装，已跳过 {resumed} 个已完成的文件")
+    # 暂存目录中多余的文件（上次安装后源文件已删除）
+    if os.path.isdir(staging_folder):
+        for rel_path in list_files(staging_folder):
+            if rel_path not in src_files:
+                os.remove(os.path.join(staging_folder, rel_path))
+    
+    # 比较文件（可能需要计算哈希，放到线程池中并行执行）
+    def unchanged(rel_path):
+        dst_stat = dst_files.get(rel_path)
+        return dst_stat is not None and is_same_file(
+            source, rel_path, os.path.join(dst_folder, rel_path), src_files[rel_path], dst_stat,
+            records.get(rel_path))
+    
+    with ThreadPoolExecutor(max_workers=SYNC_THREADS) as executor:
+        reuse = set(rel_path for rel_path, same in zip(pending, executor.map(unchanged, pending)) if same)
+    changed = [rel_path for rel_path in pending if rel_path not in reuse]
+    print(f"  需要复制 {len(changed)} 个文件，{len(reuse)} 个文件未变化，"
+          f"删除 {len([rel_path for rel_path in dst_files if rel_path not in src_files])} 个文件")
+    
+    progress = SyncProgress(len(changed), sum(src_files[rel_path].st_size for rel_path in changed))
+    journal_lock = threading.Lock()
+    with open(journal_path, "a" if done else "w", encoding="utf-8") as journal:
+        def stage(rel_path):
+            staged_path = os.path.join(staging_folder, rel_path)
+            os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+            if os.path.lexists(staged_path):
+                os.remove(staged_path)
+            if rel_path in reuse:
+                link_or_copy(os.path.join(dst_folder, rel_path), staged_path)
+            else:
+                source.copy_to(rel_path, staged_path)
+                progress.update(src_files[rel_path].st_size)
+            src_stat = src_files[rel_path]
+            with journal_lock:
+                journal.write(json.dumps([rel_path, src_stat.st_size, src_stat.st_mtime_ns],
+                                         ensure_ascii=False) + "\n")
+                journal.flush()
+        
+        os.makedirs(staging_folder, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=SYNC_THREADS) as executor:
+            list(executor.map(stage, pending))
+        if changed:
+            print()
+        
+        # 源目录中的空目录也保持一致
+        for rel_path in source.list_dirs():
+            os.makedirs(os.path.join(staging_folder, rel_path), exist_ok=True)
+        journal.write(json.dumps(JOURNAL_COMPLETE) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+    
+    installed = {}
+    for rel_path, src_stat in src_files.items():
+        staged_stat = os.stat(os.path.join(staging_folder, rel_path))
+        installed[rel_path] = [src_stat.st_size, src_stat.st_mtime_ns, staged_stat.st_size, staged_stat.st_mtime_ns]
+    
+    # 改名替换（Windows 不能直接覆盖目录，先把旧目录改名）；替换完成前删除旧的安装记录
+    if os.path.exists(dst_folder + INSTALL_STATE_SUFFIX):
+        os.remove(dst_folder + INSTALL_STATE_SUFFIX)
+    try:
+        if os.path.isdir(dst_folder):
+            os.rename(dst_folder, old_folder)
+    except OSError:
+        print(f"  无法替换 {dst_folder}，请关闭游戏后重新运行（已完成的文件不会重复复制）")
+        raise
+    os.rename(staging_folder, dst_folder)
+    save_install_state(dst_folder, source, installed)
+    os.remove(journal_path)
+    if os.path.isdir(old_folder):
+        shutil.rmtree(old_folder)
 
 def replace_packs_folders(resource_packs_path, behavior_packs_path, selected_client_folder):
     """
     替换资源包和行为包文件夹
+    selected_client_folder 为客户端文件夹路径，或 open_client_sources 返回的文件来源
     """
+    sources = selected_client_folder
+    if isinstance(sources, str):
+        sources = open_client_sources(os.path.dirname(os.path.abspath(sources)),
+                                      os.path.basename(os.path.abspath(sources)))
     try:
         # 替换 resource_packs
         if resource_packs_path:
-            src_resource = os.path.join(selected_client_folder, "resource_packs")
-            if os.path.exists(src_resource):
+            src_resource = sources["resource_packs"]
+            if src_resource is not None:
                 print(f"找到 resource_packs 文件夹: {resource_packs_path}")
-                shutil.rmtree(resource_packs_path)
-                shutil.copytree(src_resource, resource_packs_path)
+                install_folder(src_resource, resource_packs_path)
                 print("resource_packs 文件夹已替换")
             else:
                 print("警告: 选择的客户端中没有 resource_packs 文件夹，跳过替换")
         
         # 替换 behavior_packs
         if behavior_packs_path:
-            src_behavior = os.path.join(selected_client_folder, "behavior_packs")
-            if os.path.exists(src_behavior):
+            src_behavior = sources["behavior_packs"]
+            if src_behavior is not None:
                 print(f"找到 behavior_packs 文件夹: {behavior_packs_path}")
-                shutil.rmtree(behavior_packs_path)
-                shutil.copytree(src_behavior, behavior_packs_path)
+                install_folder(src_behavior, behavior_packs_path)
                 print("behavior_packs 文件夹已替换")
             else:
                 print("警告: 选择的客户端中没有 behavior_packs 文件夹，跳过替换")
@@ -87,13 +495,18 @@ def replace_packs_folders(resource_packs_path, behavior_packs_path, selected_cli
         return False
 
 def main():
-    # 获取脚本所在目录的 data 文件夹路径
+    # 查找数据包或脚本所在目录的 data 文件夹
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    data_folder = os.path.join(script_dir, "data")
+    try:
+        data_folder = open_data_source(script_dir)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取数据包: {e}")
+        input("按回车键退出...")
+        sys.exit(1)
     
     # 检查 data 文件夹是否存在
-    if not os.path.exists(data_folder):
-        print("错误: 脚本所在目录下没有找到 data 文件夹")
+    if data_folder is None:
+        print("错误: 没有找到数据包，脚本所在目录下也没有 data 文件夹")
         input("按回车键退出...")
         sys.exit(1)
     
@@ -119,7 +532,7 @@ def main():
             
             if 0 <= choice_index < len(available_clients):
                 selected_client = available_clients[choice_index]
-                selected_client_folder = os.path.join(data_folder, selected_client)
+                selected_client_folder = open_client_sources(data_folder, selected_client)
                 break
             else:
                 print("错误: 选择超出范围，请重新输入")
@@ -127,11 +540,12 @@ def main():
             print("错误: 请输入有效的数字")
     
     print(f"\n已选择客户端: {selected_client}")
-    print(f"将从以下位置获取新的包文件: {selected_client_folder}")
+    print("将从以下位置获取新的包文件: "
+          + ", ".join(str(source) for source in selected_client_folder.values() if source is not None))
     
     # 检查选择的客户端文件夹中是否有需要的子文件夹
-    has_resource = os.path.exists(os.path.join(selected_client_folder, "resource_packs"))
-    has_behavior = os.path.exists(os.path.join(selected_client_folder, "behavior_packs"))
+    has_resource = selected_client_folder["resource_packs"] is not None
+    has_behavior = selected_client_folder["behavior_packs"] is not None
     
     if not has_resource and not has_behavior:
         print("错误: 选择的客户端文件夹中没有找到 resource_packs 或 behavior_packs 文件夹")
@@ -141,9 +555,9 @@ def main():
     # 获取用户输入的 Minecraft 客户端路径
     print("\n")
     while True:
-        client_path = input("请输入 Minecraft 客户端路径: ").strip()
+        client_path = input("请输入 Minecraft 客户端路径 (多个路径用分号分隔): ").strip()
         
-        if not os.path.exists(client_path):
+        if not any(os.path.exists(path.strip()) for path in client_path.split(";") if path.strip()):
             print("错误: 指定的路径不存在，请重新输入")
             continue
         
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+PACK_FOLDERS = ("resource_packs", "behavior_packs")
+RESULT_CACHE_NAME = "validation.json"  # 按文件哈希缓存的检查结果（只保留最近一次预检用到的文件）
+PACK_INDEX_NAME = "pack_index.json"  # 包 UUID 与版本索引
+
+# 字符串、行注释、块注释（Bedrock 的 JSON 允许注释）
+JSON_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.S)
+# 压缩时额外匹配空白，字符串原样保留
+MINIFY_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/|\s+', re.S)
+
+
+def strip_json_comments(text):
+    """去掉 JSON 中的注释，保留换行使错误行号不变"""
+    def replace(match):
+        token = match.group(0)
+        if token.startswith('"'):
+            return token
+        return "\n" * token.count("\n")
+    return JSON_TOKEN_PATTERN.sub(replace, text)
+
+
+def minify_json(text):
+    """
+    去掉 JSON 中的注释和字符串之外的空白，数字等字面量保持原样
+    结果与原文解析后不一致时抛出 ValueError
+    """
+    def replace(match):
+        token = match.group(0)
+        return token if token.startswith('"') else ""
+    minified = MINIFY_TOKEN_PATTERN.sub(replace, text)
+    if json.loads(minified) != json.loads(strip_json_comments(text)):
+        raise ValueError("压缩后的内容与原文不一致")
+    return minified
+
+
+def minify_json_data(data):
+    """压缩 UTF-8 编码的 JSON 文件内容，返回压缩后的字节"""
+    return minify_json(data.decode("utf-8-sig")).encode("utf-8")
+
+
+def _manifest_info(data):
+    """从 manifest.json 中提取包信息"""
+    header = data.get("header") if isinstance(data, dict) else None
+    if not isinstance(header, dict) or not header.get("uuid"):
+        raise ValueError("manifest.json 缺少 header.uuid")
+    modules = data.get("modules") or []
+    return {
+        "name": header.get("name", ""),
+        "uuid": str(header["uuid"]).lower(),
+        "version": header.get("version"),
+        "modules": [str(module.get("uuid")).lower() for module in modules
+                    if isinstance(module, dict) and module.get("uuid")],
+    }
+
+
+def check_json_file(path):
+    """
+    解析一个 JSON 文件，返回 {"error": 错误信息或 None, "manifest": 包信息或 None}
+    """
+    result = {"error": None, "manifest": None}
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            data = json.loads(strip_json_comments(f.read()))
+        if os.path.basename(path).lower() == "manifest.json":
+            result["manifest"] = _manifest_info(data)
+    except json.JSONDecodeError as e:
+        result["error"] = f"第 {e.lineno} 行第 {e.colno} 列: {e.msg}"
+    except UnicodeDecodeError:
+        result["error"] = "不是有效的 UTF-8 编码"
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+    return result
+
+
+def list_json_files(data_dir, clients):
+    """列出客户端资源包和行为包中的所有 JSON 文件 [(客户端, 路径), ...]"""
+    files = []
+    for client in clients:
+        for folder in PACK_FOLDERS:
+            for root, dirs, names in os.walk(os.path.join(data_dir, client, folder)):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(".json"):
+                        files.append((client, os.path.join(root, name)))
+    return files
+
+
+def _load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def validate_packs(data_dir, clients, cache, jobs=None):
+    """
+    预检客户端的资源包和行为包：
+    - 并行解析所有 JSON，报告每个错误的文件和行号
+    - 根据 manifest.json 建立包 UUID/版本索引，检查重复的 UUID
+    检查结果按文件哈希缓存，未修改的文件不再重复解析；保存时去掉本次没有用到的结果，缓存不会无限增长
+    返回 (错误列表, 警告列表)
+    """
+    results_path = os.path.join(cache.root, RESULT_CACHE_NAME)
+    cached_results = _load_json(results_path)
+    files = list_json_files(data_dir, clients)
+    # manifest.json 会额外检查包信息，相同内容的普通 JSON 不能共用结果
+    hashes = [cache.file_hash(path) + (":manifest" if os.path.basename(path).lower() == "manifest.json" else "")
+              for _, path in files]
+
+    pending = {digest: path for (_, path), digest in zip(files, hashes) if digest not in cached_results}
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for digest, result in zip(pending, executor.map(check_json_file, pending.values(), chunksize=32)):
+                cached_results[digest] = result
+    print(f"已检查 {len(files)} 个 JSON 文件 (新解析 {len(pending)} 个)")
+
+    errors = []
+    warnings = []
+    index = []
+    for (client, path), digest in zip(files, hashes):
+        result = cached_results[digest]
+        rel_path = os.path.relpath(path, data_dir)
+        if result["error"]:
+            errors.append(f"{rel_path}: {result['error']}")
+        if result["manifest"]:
+            index.append(dict(result["manifest"], client=client, path=rel_path))
+
+    # 同一客户端内 UUID 重复会导致游戏只加载其中一个包；不同客户端之间重复只作提示
+    seen = {}
+    for pack in index:
+        for uuid in dict.fromkeys([pack["uuid"]] + pack["modules"]):
+            for other in seen.get(uuid, []):
+                message = f"UUID {uuid} 重复: {other['path']} 与 {pack['path']}"
+                if other["client"] == pack["client"]:
+                    errors.append(message)
+                else:
+                    warnings.append(message)
+            seen.setdefault(uuid, []).append(pack)
+
+    _save_json(results_path, {digest: cached_results[digest] for digest in hashes})
+    _save_json(os.path.join(cache.root, PACK_INDEX_NAME), index)
+    print(f"已索引 {len(index)} 个包")
+    return errors, warnings
@@ -0,0 +1,201 @@
+import json
+import os
+import struct
+import zlib
+
+# 数据包格式：
+#   头部 | 文件数据（每个文件单独压缩，内容相同的文件只存一份） | 目录 (zlib 压缩的 JSON)
+# 目录按客户端和相对路径索引，安装时只需读取所选客户端的条目
+# 数据包附加在安装程序末尾时，文件最后是尾部记录，指向数据包的起始位置
+MAGIC = b"NEPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHQQ")  # 标识, 版本, 目录偏移, 目录大小
+TRAILER = struct.Struct("<Q4s")  # 数据包起始位置, 标识
+STORED = 0
+DEFLATED = 8  # 与 ZIP 相同的原始 deflate 数据
+READ_SIZE = 1024 * 1024
+PACK_FOLDERS = ("resource_packs", "behavior_packs")
+
+
+class PayloadWriter:
+    """
+    顺序写出数据包：add() 接收已压缩的数据（可直接使用构建缓存中的压缩结果）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, "wb")
+        self.fp.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        self.offset = HEADER.size
+        self.clients = {}
+        self.blobs = {}  # 内容哈希 -> (偏移, 压缩大小, 压缩方式, crc)
+        self.files = 0
+        self.reused_files = 0
+        self.reused_bytes = 0
+
+    def _client(self, client):
+        return self.clients.setdefault(client, {"files": [], "dirs": []})
+
+    def add(self, client, rel_path, digest, method, crc, size, data, mtime_ns):
+        """
+        添加一个文件，rel_path 使用 / 分隔，digest 为内容的 sha256
+        """
+        blob = self.blobs.get(digest)
+        if blob is None:
+            blob = self.blobs[digest] = (self.offset, len(data), method, crc)
+            self.fp.write(data)
+            self.offset += len(data)
+        else:
+            self.reused_files += 1
+            self.reused_bytes += len(data)
+        self._client(client)["files"].append([rel_path, *blob, size, mtime_ns, digest])
+        self.files += 1
+
+    def add_dir(self, client, rel_path):
+        """记录目录（使空目录在安装后保持不变）"""
+        self._client(client)["dirs"].append(rel_path)
+
+    def close(self):
+        toc = zlib.compress(json.dumps({"clients": self.clients}, ensure_ascii=False).encode("utf-8"), 9)
+        self.fp.write(toc)
+        self.fp.seek(0)
+        self.fp.write(HEADER.pack(MAGIC, VERSION, self.offset, len(toc)))
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fp.close()
+
+
+def attach(exe_path, payload_path):
+    """把数据包附加到可执行文件末尾"""
+    with open(exe_path, "ab") as out, open(payload_path, "rb") as f:
+        start = out.seek(0, os.SEEK_END)
+        for chunk in iter(lambda: f.read(READ_SIZE), b""):
+            out.write(chunk)
+        out.write(TRAILER.pack(start, MAGIC))
+
+
+def find_payload(path):
+    """
+    返回文件中数据包的起始位置：独立的数据包为 0，附加在程序末尾时读取尾部记录
+    没有数据包时返回 None
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                return 0
+            size = f.seek(0, os.SEEK_END)
+            if size < TRAILER.size + HEADER.size:
+                return None
+            f.seek(size - TRAILER.size)
+            start, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC or start + HEADER.size > size - TRAILER.size:
+                return None
+            f.seek(start)
+            return start if f.read(len(MAGIC)) == MAGIC else None
+    except OSError:
+        return None
+
+
+class PayloadStat:
+    """数据包中文件的大小和修改时间，字段与 os.stat_result 一致"""
+
+    def __init__(self, size, mtime_ns):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_atime_ns = mtime_ns
+        self.st_mtime = mtime_ns / 1e9
+
+
+class PayloadReader:
+    """读取数据包目录，按客户端提供文件来源"""
+
+    def __init__(self, path, start=None):
+        self.path = path
+        self.start = find_payload(path) if start is None else start
+        if self.start is None:
+            raise ValueError(f"{path} 中没有数据包")
+        with open(path, "rb") as f:
+            f.seek(self.start)
+            magic, version, toc_offset, toc_size = HEADER.unpack(f.read(HEADER.size))
+            if version != VERSION:
+                raise ValueError(f"不支持的数据包版本 {version}")
+            f.seek(self.start + toc_offset)
+            self.clients = json.loads(zlib.decompress(f.read(toc_size)).decode("utf-8"))["clients"]
+
+    def client_names(self):
+        """包含 resource_packs 或 behavior_packs 的客户端"""
+        return sorted(client for client in self.clients
+                      if any(self.source(client, folder) for folder in PACK_FOLDERS))
+
+    def source(self, client, folder):
+        """返回客户端中某个文件夹的文件来源，文件夹不存在时返回 None"""
+        prefix = folder + "/"
+        entries = {rel_path[len(prefix):]: entry
+                   for rel_path, *entry in self.clients.get(client, {}).get("files", [])
+                   if rel_path.startswith(prefix)}
+        dirs = [rel_path[len(prefix):] for rel_path in self.clients.get(client, {}).get("dirs", [])
+                if rel_path.startswith(prefix)]
+        if not entries and not dirs:
+            return None
+        return PayloadSource(self, f"{client}/{folder}", entries, dirs)
+
+
+class PayloadSource:
+    """
+    数据包中一个文件夹的文件来源（接口与 install.DirectorySource 相同）
+    每次复制单独打开文件，可在多个线程中同时使用
+    """
+
+    def __init__(self, reader, name, entries, dirs):
+        self.reader = reader
+        self.name = name
+        self.entries = entries
+        self.dirs = dirs
+
+    def __str__(self):
+        return f"{self.reader.path}:{self.name}"
+
+    def list_files(self):
+        return {rel_path.replace("/", os.sep): PayloadStat(entry[4], entry[5])
+                for rel_path, entry in self.entries.items()}
+
+    def list_dirs(self):
+        return [rel_path.replace("/", os.sep) for rel_path in self.dirs]
+
+    def hash(self, rel_path):
+        return bytes.fromhex(self.entries[rel_path.replace(os.sep, "/")][6])
+
+    def copy_to(self, rel_path, dst_path):
+        """边读取边解压到目标文件，并校验 crc"""
+        offset, compressed_size, method, crc, size, mtime_ns, _ = self.entries[rel_path.replace(os.sep, "/")]
+        decompressor = zlib.decompressobj(-15) if method == DEFLATED else None
+        actual_crc = 0
+        written = 0
+        with open(self.reader.path, "rb") as f, open(dst_path, "wb") as out:
+            f.seek(self.reader.start + offset)
+            remaining = compressed_size
+            while remaining:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f"数据包不完整: {rel_path}")
+                remaining -= len(chunk)
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                actual_crc = zlib.crc32(chunk, actual_crc)
+                written += len(chunk)
+                out.write(chunk)
+            if decompressor is not None:
+                chunk = decompressor.flush()
+                actual_crc = zlib.crc32(chunk, actual_crc)
+                written += len(chunk)
+                out.write(chunk)
+        if actual_crc != crc or written != size:
+            raise ValueError(f"数据包中的文件已损坏: {rel_path}")
+        os.utime(dst_path, ns=(mtime_ns, mtime_ns))
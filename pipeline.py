@@ -0,0 +1,162 @@
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_running_tools = set()
+_tools_lock = threading.Lock()
+_cancelled = threading.Event()
+
+
+class Cancelled(Exception):
+    """构建已被取消（其它阶段失败）"""
+
+
+class StageFailed(Exception):
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+def run_tool(args, label, shell=False, check=True):
+    """
+    运行外部工具（java、pyinstaller 等），输出逐行转发并加上 [label] 前缀
+    构建被取消时终止进程；check 为 True 时退出码非 0 抛出 CalledProcessError
+    返回退出码
+    """
+    with _tools_lock:
+        if _cancelled.is_set():
+            raise Cancelled("构建已取消")
+        # 放在单独的进程组中，取消时连同 shell 启动的子进程一起终止
+        process = subprocess.Popen(args, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors="replace", bufsize=1, start_new_session=os.name != "nt",
+                                   creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0)
+        _running_tools.add(process)
+    try:
+        for line in process.stdout:
+            print(f"[{label}] {line.rstrip()}", flush=True)
+        returncode = process.wait()
+    finally:
+        with _tools_lock:
+            _running_tools.discard(process)
+    if _cancelled.is_set() and returncode:
+        raise Cancelled("构建已取消")
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, args)
+    return returncode
+
+
+def _kill_tree(process):
+    """终止进程及其启动的子进程"""
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        process.kill()
+
+
+def cancel_tools():
+    """取消构建：终止正在运行的外部工具，之后不再启动新的工具"""
+    with _tools_lock:
+        _cancelled.set()
+        for process in _running_tools:
+            _kill_tree(process)
+
+
+class Pipeline:
+    """
+    按依赖关系并行执行构建阶段：asyncio 负责调度，阶段函数在线程池中执行
+    - 同时执行的阶段不超过 jobs 个
+    - 某个阶段失败（返回 False 或抛出异常）后，不再启动新的阶段，并终止正在运行的外部工具；
+      已在执行的 Python 阶段无法中断，会等待其结束
+    - 可选阶段（optional=True）失败时只记录在 failed_optional 中，不影响其它阶段
+    总耗时约等于依赖链中最长的一条路径
+    """
+
+    def __init__(self, profiler, jobs=3):
+        self.profiler = profiler
+        self.jobs = jobs
+        self.stages = {}
+        self.failed = None  # 第一个失败的阶段名
+        self.failed_optional = []  # 失败的可选阶段
+
+    def add(self, name, func, deps=(), lane=None, title=None, optional=False):
+        """
+        添加阶段：func(record) 返回是否成功，record 为 profiler 的阶段记录
+        deps 中不存在的阶段（被跳过的阶段）会被忽略
+        """
+        self.stages[name] = (func, tuple(deps), lane, title, optional)
+        return name
+
+    def _call(self, name, func, lane, title):
+        if _cancelled.is_set():
+            return False
+        if title:
+            print(f"\n==> {title}")
+        try:
+            with self.profiler.stage(name, lane) as record:
+                return bool(func(record))
+        except Cancelled:
+            return False
+        except Exception as e:
+            print(f"{name} 失败: {e}")
+            return False
+
+    async def _run_stage(self, name, tasks, semaphore, executor):
+        func, deps, lane, title, optional = self.stages[name]
+        for dep in deps:
+            if dep in tasks:
+                await tasks[dep]
+        async with semaphore:
+            future = asyncio.get_running_loop().run_in_executor(executor, self._call, name, func, lane, title)
+            try:
+                ok = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 线程无法中断，等它结束再退出，避免留下写了一半的文件
+                await asyncio.wait([future])
+                raise
+        if not ok and optional:
+            print(f"\n阶段 {name} 失败（不影响其它阶段）")
+            self.failed_optional.append(name)
+        elif not ok:
+            raise StageFailed(name)
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.jobs)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            tasks = {}
+            for name in self.stages:
+                tasks[name] = asyncio.ensure_future(self._run_stage(name, tasks, semaphore, executor))
+            pending = set(tasks.values())
+            try:
+                await self._wait(pending)
+            except asyncio.CancelledError:
+                # Ctrl+C：终止外部工具，再等待正在执行的阶段结束
+                cancel_tools()
+                raise
+
+    async def _wait(self, pending):
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.cancelled() or task.exception() is None:
+                    continue
+                if self.failed is None:
+                    error = task.exception()
+                    self.failed = error.name if isinstance(error, StageFailed) else str(error)
+                    print(f"\n阶段 {self.failed} 失败，取消其余阶段")
+                    cancel_tools()
+                    for other in pending:
+                        other.cancel()
+
+    def run(self):
+        """执行所有阶段，全部成功返回 True"""
+        _cancelled.clear()
+        self.failed = None
+        self.failed_optional = []
+        asyncio.run(self._run())
+        return self.failed is None
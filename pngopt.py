@@ -0,0 +1,166 @@
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 只保留显示像素必需的块，tEXt/tIME/pHYs/iCCP 等元数据全部去掉（游戏不读取这些块）
+KEEP_CHUNKS = (b"IHDR", b"PLTE", b"tRNS", b"IDAT", b"IEND")
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # 颜色类型 -> 通道数
+MAX_PIXELS = 2048 * 2048  # 超过该尺寸只去掉元数据并重新压缩，不再重新选择滤波器
+
+
+def read_chunks(data):
+    """解析 PNG，返回 [(类型, 数据), ...]"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("不是 PNG 文件")
+    chunks = []
+    pos = len(PNG_SIGNATURE)
+    while pos < len(data):
+        length, kind = struct.unpack_from(">L4s", data, pos)
+        body = data[pos + 8:pos + 8 + length]
+        if len(body) != length:
+            raise ValueError("PNG 文件不完整")
+        chunks.append((kind, body))
+        pos += 12 + length
+        if kind == b"IEND":
+            break
+    return chunks
+
+
+def write_chunk(kind, body):
+    return struct.pack(">L", len(body)) + kind + body + struct.pack(">L", zlib.crc32(kind + body))
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def unfilter(raw, height, stride, bpp):
+    """还原滤波后的扫描行，返回每行的原始字节"""
+    rows = []
+    prior = bytearray(stride)
+    pos = 0
+    for _ in range(height):
+        filter_type = raw[pos]
+        row = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if filter_type == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif filter_type == 2:
+            row = bytearray((x + b) & 0xFF for x, b in zip(row, prior))
+        elif filter_type == 3:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prior[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                upper_left = prior[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + _paeth(left, prior[i], upper_left)) & 0xFF
+        elif filter_type != 0:
+            raise ValueError(f"未知的滤波类型 {filter_type}")
+        if len(row) != stride:
+            raise ValueError("图像数据不完整")
+        rows.append(row)
+        prior = row
+    return rows
+
+
+def filter_rows(rows, bpp, adaptive):
+    """
+    对扫描行滤波，adaptive 为 False 时全部不滤波；
+    否则每行选择绝对值之和最小的滤波方式（libpng 使用的启发式）
+    """
+    if not adaptive:
+        return b"".join(b"\x00" + row for row in rows)
+    out = bytearray()
+    prior = bytes(len(rows[0])) if rows else b""
+    for row in rows:
+        left = bytes(bpp) + row[:-bpp]
+        upper_left = bytes(bpp) + prior[:-bpp]
+        candidates = (
+            row,
+            bytes((x - a) & 0xFF for x, a in zip(row, left)),
+            bytes((x - b) & 0xFF for x, b in zip(row, prior)),
+            bytes((x - ((a + b) >> 1)) & 0xFF for x, a, b in zip(row, left, prior)),
+            bytes((x - _paeth(a, b, c)) & 0xFF for x, a, b, c in zip(row, left, prior, upper_left)),
+        )
+        # 按有符号字节计算代价
+        costs = [sum(v if v < 128 else 256 - v for v in candidate) for candidate in candidates]
+        best = costs.index(min(costs))
+        out.append(best)
+        out += candidates[best]
+        prior = row
+    return bytes(out)
+
+
+def drop_opaque_alpha(rows, color_type, sample_size):
+    """
+    alpha 通道全部不透明时去掉 alpha 通道，返回 (新的行, 新的颜色类型)
+    """
+    if color_type not in (4, 6):
+        return rows, color_type
+    channels = CHANNELS[color_type]
+    pixel_size = channels * sample_size
+    color_size = (channels - 1) * sample_size
+    for row in rows:
+        for offset in range(color_size, pixel_size):
+            if row[offset::pixel_size].strip(b"\xff"):
+                return rows, color_type
+    new_rows = []
+    for row in rows:
+        new_row = bytearray(len(row) // pixel_size * color_size)
+        for offset in range(color_size):
+            new_row[offset::color_size] = row[offset::pixel_size]
+        new_rows.append(new_row)
+    return new_rows, 2 if color_type == 6 else 0
+
+
+def optimize_png(data):
+    """
+    无损优化 PNG：去掉元数据块、去掉全不透明的 alpha 通道、重新选择滤波器并以最高级别压缩
+    返回优化后的数据；无法变小时返回 None
+    """
+    chunks = read_chunks(data)
+    if not chunks or chunks[0][0] != b"IHDR":
+        raise ValueError("缺少 IHDR")
+    width, height, bit_depth, color_type, compression, filter_method, interlace = \
+        struct.unpack(">LLBBBBB", chunks[0][1])
+    if color_type not in CHANNELS:
+        raise ValueError(f"未知的颜色类型 {color_type}")
+    raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+
+    if interlace or width * height > MAX_PIXELS:
+        # 隔行扫描或超大图片：保持扫描行不变，只重新压缩
+        candidates = [raw]
+    else:
+        bits_per_pixel = CHANNELS[color_type] * bit_depth
+        stride = (width * bits_per_pixel + 7) // 8
+        rows = unfilter(raw, height, stride, max(1, bits_per_pixel // 8))
+        if bit_depth >= 8:
+            rows, color_type = drop_opaque_alpha(rows, color_type, bit_depth // 8)
+        bpp = max(1, CHANNELS[color_type] * bit_depth // 8)
+        candidates = [filter_rows(rows, bpp, False), filter_rows(rows, bpp, True)]
+
+    compressor_args = (9, zlib.DEFLATED, 15, 9)
+    best = None
+    for candidate in candidates:
+        for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+            compressor = zlib.compressobj(*compressor_args, strategy)
+            payload = compressor.compress(candidate) + compressor.flush()
+            if best is None or len(payload) < len(best):
+                best = payload
+
+    header = struct.pack(">LLBBBBB", width, height, bit_depth, color_type, compression, filter_method, interlace)
+    out = [PNG_SIGNATURE, write_chunk(b"IHDR", header)]
+    for kind, body in chunks[1:]:
+        if kind in (b"PLTE", b"tRNS"):
+            out.append(write_chunk(kind, body))
+    out.append(write_chunk(b"IDAT", best))
+    out.append(write_chunk(b"IEND", b""))
+    result = b"".join(out)
+    return result if len(result) < len(data) else None
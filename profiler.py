@@ -0,0 +1,186 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _io_counters():
+    """
+    返回累计读写的字节数 (读, 写)，无法获取时返回 (0, 0)
+    Linux 上只统计当前线程（多个阶段在不同线程中同时执行），Windows 上为整个进程
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            counters = {}
+            # /proc/thread-self 需要 Linux 3.17+
+            path = "/proc/thread-self/io" if os.path.exists("/proc/thread-self/io") else "/proc/self/io"
+            with open(path, "r") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    counters[key] = int(value)
+            return counters.get("rchar", 0), counters.get("wchar", 0)
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class IO_COUNTERS(ctypes.Structure):
+                _fields_ = [(name, ctypes.c_ulonglong) for name in (
+                    "ReadOperationCount", "WriteOperationCount", "OtherOperationCount",
+                    "ReadTransferCount", "WriteTransferCount", "OtherTransferCount")]
+
+            counters = IO_COUNTERS()
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            if kernel32.GetProcessIoCounters(kernel32.GetCurrentProcess(), ctypes.byref(counters)):
+                return counters.ReadTransferCount, counters.WriteTransferCount
+    except (OSError, ValueError, AttributeError):
+        pass
+    return 0, 0
+
+
+def _peak_rss():
+    """返回本进程启动以来的内存峰值（字节），无法获取时返回 0"""
+    try:
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux 单位为 KB，macOS 为字节
+            return peak if sys.platform == "darwin" else peak * 1024
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                        "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                        "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            if ctypes.windll.psapi.GetProcessMemoryInfo(
+                    kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+    except (OSError, ValueError, AttributeError):
+        pass
+    return 0
+
+
+def _children_cpu_time():
+    """已结束子进程（java、pyinstaller 等）的累计 CPU 时间"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class BuildProfiler:
+    """
+    记录构建流程中每个阶段的耗时、CPU 时间、读写字节数、文件数和内存峰值的增长；
+    进程的内存峰值只在报告中记录一次
+    可导出 JSON 报告和 Chrome trace（chrome://tracing 或 Perfetto 打开）
+    """
+
+    def __init__(self, output_dir="profile", cprofile_stages=(), origin=None):
+        self.output_dir = output_dir
+        self.cprofile_stages = set(cprofile_stages)
+        # 子进程传入父进程的起点，使合并后的时间线对齐（perf_counter 使用系统单调时钟）
+        self.origin = time.perf_counter() if origin is None else origin
+        self.stages = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, lane=None):
+        """
+        统计一个阶段，yield 的字典中可以补充 files 等计数
+        lane 用于在 trace 中区分并行执行的任务（例如批量构建的客户端）
+        阶段可能与其它阶段同时执行：cpu_time 和读写字节数只统计执行该阶段的线程
+        （阶段内部线程池中的工作不计入），child_cpu_time 为整个进程
+        peak_rss_growth 为阶段执行期间进程内存峰值的增长：峰值只增不减，之前已达到的峰值不再计入，
+        同时执行的阶段引起的增长会计入所有这些阶段
+        """
+        record = {"name": name, "lane": lane or "main", "files": 0}
+        read_before, written_before = _io_counters()
+        children_before = _children_cpu_time()
+        peak_before = _peak_rss()
+        cpu_before = time.thread_time()
+        start = time.perf_counter()
+        profile = None
+        if name in self.cprofile_stages or "*" in self.cprofile_stages:
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                os.makedirs(self.output_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+            end = time.perf_counter()
+            read_after, written_after = _io_counters()
+            record.update(
+                start=start - self.origin,
+                wall_time=end - start,
+                cpu_time=time.thread_time() - cpu_before,
+                child_cpu_time=_children_cpu_time() - children_before,
+                bytes_read=read_after - read_before,
+                bytes_written=written_after - written_before,
+                peak_rss_growth=_peak_rss() - peak_before,
+            )
+            with self.lock:
+                self.stages.append(record)
+
+    def merge(self, stages, lane):
+        """合并其它进程记录的阶段"""
+        with self.lock:
+            for record in stages:
+                self.stages.append(dict(record, lane=lane))
+
+    def summary(self):
+        """打印各阶段的统计"""
+        print("\n阶段统计:")
+        print(f"{'阶段':<26}{'耗时':>8}{'CPU':>10}{'读取MB':>10}{'写入MB':>10}{'文件数':>7}{'峰值增长MB':>10}")
+        for record in self.stages:
+            name = record["name"] if record["lane"] == "main" else f"{record['lane']}/{record['name']}"
+            print(f"{name:<28}{record['wall_time']:>9.2f}s"
+                  f"{record['cpu_time'] + record['child_cpu_time']:>9.2f}s"
+                  f"{record['bytes_read'] / 1024 ** 2:>12.1f}"
+                  f"{record['bytes_written'] / 1024 ** 2:>12.1f}"
+                  f"{record['files']:>10}"
+                  f"{record['peak_rss_growth'] / 1024 ** 2:>14.1f}")
+        print(f"进程内存峰值: {_peak_rss() / 1024 ** 2:.1f} MB")
+
+    def save(self):
+        """写出 JSON 报告和 Chrome trace，返回两个文件的路径"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, "build_profile.json")
+        trace_path = os.path.join(self.output_dir, "build_trace.json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"peak_rss": _peak_rss(), "stages": self.stages}, f, ensure_ascii=False, indent=2)
+
+        lanes = {}
+        events = []
+        for record in self.stages:
+            tid = lanes.setdefault(record["lane"], len(lanes))
+            events.append({
+                "name": record["name"], "ph": "X", "pid": 0, "tid": tid,
+                "ts": record["start"] * 1e6, "dur": record["wall_time"] * 1e6,
+                "args": {key: value for key, value in record.items()
+                         if key not in ("name", "lane", "start", "wall_time")},
+            })
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid,
+                           "args": {"name": lane}})
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return report_path, trace_path
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import apksign  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def signing_key():
+    """仓库中自带的 AOSP testkey"""
+    key_dir = os.path.join(ROOT, "keys")
+    return apksign.SigningKey(os.path.join(key_dir, "testkey.pk8"), os.path.join(key_dir, "testkey.x509.pem"))
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    """固定新条目（包括 v1 签名文件）的时间戳，使两次写出的结果可以逐字节比较"""
+    import apkzip
+    monkeypatch.setattr(apkzip.time, "time", lambda: 1700000000)
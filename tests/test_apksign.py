@@ -0,0 +1,194 @@
+import base64
+import hashlib
+import random
+import struct
+import zipfile
+
+import pytest
+
+import apksign
+import apkzip
+
+LONG_NAME = "assets/" + "a_rather_long_directory_name/" * 3 + "file_with_a_long_name.json"
+
+
+def der_read(data, pos):
+    """读取一个 DER TLV，返回 (tag, 内容起始, 结束位置)"""
+    tag, length = data[pos], data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[pos:pos + size], "big")
+        pos += size
+    return tag, pos, pos + length
+
+
+def der_children(data, pos):
+    """列出 pos 处 DER 结构的子元素 (tag, TLV起始, 内容起始, 结束)"""
+    _, start, end = der_read(data, pos)
+    children = []
+    while start < end:
+        tag, content, next_pos = der_read(data, start)
+        children.append((tag, start, content, next_pos))
+        start = next_pos
+    return children
+
+
+def certificate_public_key(cert):
+    """从 DER 证书中取出 SubjectPublicKeyInfo"""
+    tbs = der_children(cert, 0)[0]
+    fields = der_children(cert, tbs[1])
+    if fields[0][0] == 0xA0:
+        fields = fields[1:]
+    return cert[fields[5][1]:fields[5][3]]
+
+
+def rsa_verify(public_key, data, signature):
+    """按 RSASSA-PKCS1-v1_5 + SHA-256 验证签名"""
+    bit_string = der_children(public_key, 0)[1]
+    # BIT STRING 的第一个字节是未使用的位数
+    n, e = (int.from_bytes(public_key[content:end], "big")
+            for _, _, content, end in der_children(public_key, bit_string[2] + 1))
+    size = (n.bit_length() + 7) // 8
+    decoded = pow(int.from_bytes(signature, "big"), e, n).to_bytes(size, "big")
+    digest_info = apksign.SHA256_DIGEST_INFO + hashlib.sha256(data).digest()
+    return decoded == b"\x00\x01" + b"\xff" * (size - len(digest_info) - 3) + b"\x00" + digest_info
+
+
+def lp(data, pos):
+    """读取 uint32 长度前缀的数据，返回 (数据, 下一个位置)"""
+    size = struct.unpack_from("<I", data, pos)[0]
+    return data[pos + 4:pos + 4 + size], pos + 4 + size
+
+
+@pytest.fixture
+def signed_apk(tmp_path, signing_key):
+    rng = random.Random(0)
+    contents = {
+        "AndroidManifest.xml": (b"<manifest/>" * 100, apkzip.ZIP_DEFLATED),
+        "resources.arsc": (rng.randbytes(5000), apkzip.ZIP_STORED),
+        "lib/arm64-v8a/libgame.so": (rng.randbytes(3000), apkzip.ZIP_STORED),
+        # 跨过 1MB 分块边界
+        "assets/big.bin": (rng.randbytes(1536 * 1024), apkzip.ZIP_STORED),
+        "assets/中文.json": ('{"名称": 1}'.encode("utf-8") * 50, apkzip.ZIP_DEFLATED),
+        LONG_NAME: (b"{}" * 300, apkzip.ZIP_DEFLATED),
+    }
+    # 底包中的条目原样复制，其中旧的签名文件不应出现在输出中
+    base = str(tmp_path / "base.apk")
+    copied = {"classes.dex": rng.randbytes(2000), "res/layout/main.xml": b"<layout/>" * 40}
+    with zipfile.ZipFile(base, "w", zipfile.ZIP_DEFLATED) as z:
+        for name in ("META-INF/MANIFEST.MF", "META-INF/CERT.SF", "META-INF/CERT.RSA"):
+            z.writestr(name, b"stale")
+        for name, data in copied.items():
+            z.writestr(name, data)
+    path = str(tmp_path / "signed.apk")
+    signer = apksign.InProcessSigner(signing_key, "C=US, O=Android, CN=Android")
+    with open(base, "rb") as src, apkzip.ApkWriter(path, signer=signer) as writer:
+        for entry in apkzip.ZipIndex.parse(src):
+            writer.copy_entry(src, entry)
+        for name, data in contents.items():
+            writer.add_bytes(name, *data)
+    copied.update((name, data) for name, (data, _) in contents.items())
+    return path, copied
+
+
+def manifest_sections(manifest):
+    """把清单拆成 (原始字节, {属性: 值}) 列表，第一个为主属性"""
+    sections = []
+    for raw in manifest.split(b"\r\n\r\n")[:-1]:
+        raw += b"\r\n\r\n"
+        lines = raw.decode("utf-8").replace("\r\n ", "").split("\r\n")
+        sections.append((raw, dict(line.split(": ", 1) for line in lines if line)))
+    return sections
+
+
+def test_signature_files_replace_old_ones(signed_apk):
+    path, _ = signed_apk
+    names = zipfile.ZipFile(path).namelist()
+    assert [name for name in names if name.startswith("META-INF/")] == [
+        "META-INF/MANIFEST.MF", "META-INF/C_US__O_.SF", "META-INF/C_US__O_.RSA"]
+
+
+def test_manifest_digests(signed_apk):
+    path, contents = signed_apk
+    with zipfile.ZipFile(path) as apk:
+        assert apk.testzip() is None
+        manifest = apk.read("META-INF/MANIFEST.MF")
+        signature_file = apk.read("META-INF/C_US__O_.SF")
+        for name, data in contents.items():
+            assert apk.read(name) == data
+
+    sections = manifest_sections(manifest)
+    entries = {attrs["Name"]: attrs["SHA-256-Digest"] for _, attrs in sections[1:]}
+    assert set(entries) == set(contents)
+    for name, data in contents.items():
+        assert base64.b64decode(entries[name]) == hashlib.sha256(data).digest()
+
+    signed = manifest_sections(signature_file)
+    assert signed[0][1]["X-Android-APK-Signed"] == "2"
+    assert base64.b64decode(signed[0][1]["SHA-256-Digest-Manifest"]) == hashlib.sha256(manifest).digest()
+    section_digests = {attrs["Name"]: attrs["SHA-256-Digest"] for _, attrs in signed[1:]}
+    for raw, attrs in sections[1:]:
+        assert base64.b64decode(section_digests[attrs["Name"]]) == hashlib.sha256(raw).digest()
+
+
+def test_pkcs7_signature_verifies(signed_apk, signing_key):
+    path, _ = signed_apk
+    with zipfile.ZipFile(path) as apk:
+        signature_file = apk.read("META-INF/C_US__O_.SF")
+        block = apk.read("META-INF/C_US__O_.RSA")
+    # ContentInfo { contentType, [0] SignedData { version, digestAlgorithms, contentInfo, [0] certificates, signerInfos } }
+    content = der_children(block, 0)[1]
+    signed_data = der_children(block, content[1])[0]
+    fields = der_children(block, signed_data[1])
+    certificates, signer_infos = fields[3], fields[4]
+    assert block[certificates[2]:certificates[3]] == signing_key.cert
+    signer_info = der_children(block, signer_infos[1])[0]
+    signature = der_children(block, signer_info[1])[-1]
+    assert rsa_verify(certificate_public_key(signing_key.cert), signature_file,
+                      block[signature[2]:signature[3]])
+
+
+def test_v2_signature_verifies(signed_apk, signing_key):
+    path, _ = signed_apk
+    with open(path, "rb") as f:
+        data = f.read()
+    eocd = data.rfind(apkzip.END_SIGNATURE)
+    cd_size, cd_offset = struct.unpack_from("<LL", data, eocd + 12)
+    assert data[cd_offset - 16:cd_offset] == apksign.APK_SIG_BLOCK_MAGIC
+    block_size = struct.unpack_from("<Q", data, cd_offset - 24)[0]
+    block_start = cd_offset - block_size - 8
+    assert struct.unpack_from("<Q", data, block_start)[0] == block_size
+
+    pairs = {}
+    pos = block_start + 8
+    while pos < cd_offset - 24:
+        size, pair_id = struct.unpack_from("<QI", data, pos)
+        pairs[pair_id] = data[pos + 12:pos + 8 + size]
+        pos += 8 + size
+    signers, _ = lp(pairs[apksign.APK_SIGNATURE_SCHEME_V2_ID], 0)
+    signer, _ = lp(signers, 0)
+    signed_data, pos = lp(signer, 0)
+    signatures, pos = lp(signer, pos)
+    public_key, _ = lp(signer, pos)
+    digests, pos = lp(signed_data, 0)
+    certificates, _ = lp(signed_data, pos)
+    digest, _ = lp(digests, 0)
+    signature, _ = lp(signatures, 0)
+
+    assert public_key == certificate_public_key(signing_key.cert)
+    assert lp(certificates, 0)[0] == signing_key.cert
+    assert struct.unpack_from("<I", signature)[0] == apksign.SIGNATURE_ALGORITHM_RSA_PKCS1_SHA256
+    assert rsa_verify(public_key, signed_data, lp(signature, 4)[0])
+
+    # 按 v2 规范重新计算内容摘要：条目区、中央目录、EOCD（中央目录偏移改为签名块的位置）
+    end_record = bytearray(data[eocd:])
+    struct.pack_into("<L", end_record, 16, block_start)
+    chunks = []
+    for section in (data[:block_start], data[cd_offset:cd_offset + cd_size], bytes(end_record)):
+        for pos in range(0, len(section), apksign.CHUNK_SIZE):
+            chunk = section[pos:pos + apksign.CHUNK_SIZE]
+            chunks.append(hashlib.sha256(b"\xa5" + struct.pack("<I", len(chunk)) + chunk).digest())
+    expected = hashlib.sha256(b"\x5a" + struct.pack("<I", len(chunks)) + b"".join(chunks)).digest()
+    assert struct.unpack_from("<I", digest)[0] == apksign.SIGNATURE_ALGORITHM_RSA_PKCS1_SHA256
+    assert lp(digest, 4)[0] == expected
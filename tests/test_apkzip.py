@@ -0,0 +1,137 @@
+import random
+import struct
+import zipfile
+
+import pytest
+
+import apksign
+import apkzip
+
+
+def data_offsets(path):
+    """用 zipfile 读出每个条目的数据起始位置，与 apkzip 的实现互相独立"""
+    offsets = {}
+    with open(path, "rb") as f, zipfile.ZipFile(path) as apk:
+        for info in apk.infolist():
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack_from("<HH", header, 26)
+            offsets[info.filename] = (info.compress_type, info.header_offset + 30 + name_length + extra_length)
+    return offsets
+
+
+def assert_aligned(path):
+    for name, (method, offset) in data_offsets(path).items():
+        if method != zipfile.ZIP_STORED:
+            continue
+        alignment = 16384 if name.endswith(".so") else 4
+        assert offset % alignment == 0, name
+    with open(path, "rb") as f:
+        assert apkzip.ZipIndex.parse(f).misaligned(f) == []
+
+
+def test_new_entries_aligned(tmp_path):
+    rng = random.Random(0)
+    path = str(tmp_path / "out.apk")
+    contents = {}
+    with apkzip.ApkWriter(path) as writer:
+        # 名称长度和数据大小各不相同，压缩条目和存储条目交替出现
+        for i in range(1, 12):
+            name = "assets/" + "x" * i + ".bin"
+            contents[name] = rng.randbytes(rng.randrange(1, 5000))
+            writer.add_bytes(name, contents[name], apkzip.ZIP_STORED)
+            contents[name + ".json"] = b"{}" * i
+            writer.add_bytes(name + ".json", contents[name + ".json"])
+            so_name = f"lib/arm64-v8a/lib{'y' * i}.so"
+            contents[so_name] = rng.randbytes(rng.randrange(1, 20000))
+            writer.add_bytes(so_name, contents[so_name], apkzip.ZIP_STORED)
+    assert_aligned(path)
+    with zipfile.ZipFile(path) as apk:
+        assert apk.testzip() is None
+        assert {name: apk.read(name) for name in apk.namelist()} == contents
+
+
+def test_copied_entries_realigned(tmp_path):
+    rng = random.Random(1)
+    base = str(tmp_path / "base.apk")
+    contents = {}
+    # zipfile 写出的存储条目不做对齐
+    with zipfile.ZipFile(base, "w") as z:
+        for i in range(1, 8):
+            for name in (f"assets/{'a' * i}.png", f"lib/x86_64/lib{'b' * i}.so", "resources.arsc" * (i == 1)):
+                if name:
+                    contents[name] = rng.randbytes(rng.randrange(100, 3000))
+                    z.writestr(name, contents[name])
+            contents[f"assets/{i}.json"] = b"[1, 2, 3]" * 30
+            z.writestr(f"assets/{i}.json", contents[f"assets/{i}.json"], zipfile.ZIP_DEFLATED)
+    path = str(tmp_path / "out.apk")
+    with open(base, "rb") as src, apkzip.ApkWriter(path) as writer:
+        for entry in apkzip.ZipIndex.parse(src):
+            writer.copy_entry(src, entry)
+    assert_aligned(path)
+    with zipfile.ZipFile(path) as apk:
+        assert apk.testzip() is None
+        assert {name: apk.read(name) for name in apk.namelist()} == contents
+
+
+def test_alignment_extra_replaces_old_padding():
+    old = apkzip.alignment_extra(b"", 30 + 10, 4096)
+    extra = apkzip.alignment_extra(apkzip.strip_alignment_extra(old), 30 + 10, 4)
+    assert (30 + 10 + len(extra)) % 4 == 0
+    assert apkzip.strip_alignment_extra(old + b"\x01\x00\x02\x00ab") == b"\x01\x00\x02\x00ab"
+
+
+def entries(version):
+    """监视模式下的条目序列：version 改变中间一个条目的内容，后面的条目不变"""
+    rng = random.Random(2)
+    items = [
+        ("resources.arsc", rng.randbytes(3000), apkzip.ZIP_STORED),
+        # 检查点落在 1MB 分块的中间，回退后需要读回未满一块的数据
+        ("assets/big.bin", rng.randbytes(1300 * 1024), apkzip.ZIP_STORED),
+        ("assets/a.json", b'{"a": 1}' * 500, apkzip.ZIP_DEFLATED),
+        ("assets/changed.json", f'{{"version": {version}}}'.encode() * 200, apkzip.ZIP_DEFLATED),
+        ("lib/arm64-v8a/libgame.so", rng.randbytes(5000), apkzip.ZIP_STORED),
+        ("assets/tail.bin", rng.randbytes(900 * 1024), apkzip.ZIP_STORED),
+    ]
+    return items
+
+
+def write_fresh(path, items, signer):
+    with apkzip.ApkWriter(path, signer=signer) as writer:
+        for name, data, method in items:
+            writer.add_bytes(name, data, method)
+
+
+@pytest.mark.parametrize("signed", [False, True])
+def test_rewind_matches_fresh_write(tmp_path, signing_key, fixed_time, signed):
+    def new_signer():
+        return apksign.InProcessSigner(signing_key, "CERT") if signed else None
+
+    expected = {}
+    for version in (1, 2, 3):
+        path = str(tmp_path / f"fresh{version}.apk")
+        write_fresh(path, entries(version), new_signer())
+        with open(path, "rb") as f:
+            expected[version] = f.read()
+
+    path = str(tmp_path / "watch.apk")
+    writer = apkzip.ApkWriter(path, signer=new_signer())
+    checkpoints = [writer.checkpoint()]
+    for name, data, method in entries(1):
+        writer.add_bytes(name, data, method)
+        checkpoints.append(writer.checkpoint())
+    writer.finish()
+    with open(path, "rb") as f:
+        assert f.read() == expected[1]
+
+    # 只从修改的条目开始重新写出，之后再回退到更早的检查点
+    for version, first in ((2, 3), (3, 1)):
+        writer.rewind(checkpoints[first])
+        del checkpoints[first + 1:]
+        for name, data, method in entries(version)[first:]:
+            writer.add_bytes(name, data, method)
+            checkpoints.append(writer.checkpoint())
+        writer.finish()
+        with open(path, "rb") as f:
+            assert f.read() == expected[version]
+    writer.fp.close()
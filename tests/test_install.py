@@ -0,0 +1,176 @@
+import json
+import os
+
+import pytest
+
+import install
+
+
+def write_files(folder, files, mtime_ns=None):
+    for rel_path, data in files.items():
+        path = os.path.join(folder, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def read_files(folder):
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, folder).replace(os.sep, "/")] = f.read()
+    return files
+
+
+def leftovers(dst):
+    suffixes = (install.STAGING_SUFFIX, install.OLD_SUFFIX, install.JOURNAL_SUFFIX)
+    return [dst + suffix for suffix in suffixes if os.path.exists(dst + suffix)]
+
+
+@pytest.fixture
+def copies(monkeypatch):
+    """记录实际复制的文件；单线程执行，使中断的位置固定"""
+    monkeypatch.setattr(install, "SYNC_THREADS", 1)
+    copied = []
+    copy_to = install.DirectorySource.copy_to
+
+    def record(self, rel_path, dst_path):
+        copied.append(rel_path.replace(os.sep, "/"))
+        copy_to(self, rel_path, dst_path)
+
+    monkeypatch.setattr(install.DirectorySource, "copy_to", record)
+    return copied
+
+
+OLD_FILES = {"pack/manifest.json": b"old manifest", "pack/old.png": b"old"}
+NEW_FILES = {f"pack/textures/t{i}.png": bytes([i]) * (100 + i) for i in range(6)}
+NEW_FILES["pack/manifest.json"] = b"new manifest"
+
+
+def test_resume_after_partial_journal(tmp_path, copies, monkeypatch):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "resource_packs")
+    write_files(src, NEW_FILES)
+    write_files(dst, OLD_FILES)
+    order = sorted(install.list_files(src))
+
+    copy_to = install.DirectorySource.copy_to
+
+    def interrupted(self, rel_path, dst_path):
+        if len(copies) == 3:
+            raise KeyboardInterrupt
+        copy_to(self, rel_path, dst_path)
+
+    monkeypatch.setattr(install.DirectorySource, "copy_to", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        install.install_folder(src, dst)
+    monkeypatch.setattr(install.DirectorySource, "copy_to", copy_to)
+    # 中断时目标保持不变
+    assert read_files(dst) == OLD_FILES
+    done, complete = install.read_journal(dst + install.JOURNAL_SUFFIX)
+    assert not complete and len(done) == 3
+    # 最后一行写到一半；已完成的文件中有一个在中断后被修改
+    with open(dst + install.JOURNAL_SUFFIX, "a", encoding="utf-8") as f:
+        f.write('["pack/tex')
+    modified = sorted(done)[0]
+    write_files(src, {modified: b"modified after the interruption"})
+
+    del copies[:]
+    install.install_folder(src, dst)
+    expected = dict(NEW_FILES, **{modified.replace(os.sep, "/"): b"modified after the interruption"})
+    assert read_files(dst) == expected
+    assert sorted(copies) == sorted(rel.replace(os.sep, "/") for rel in order
+                                    if rel not in done or rel == modified)
+    assert leftovers(dst) == []
+
+
+def interrupt_before_staging_rename(monkeypatch, src, dst):
+    """在旧目录改名之后、暂存目录改名之前中断"""
+    rename = os.rename
+
+    def failing_rename(a, b):
+        if a.endswith(install.STAGING_SUFFIX):
+            raise KeyboardInterrupt
+        rename(a, b)
+
+    monkeypatch.setattr(install.os, "rename", failing_rename)
+    with pytest.raises(KeyboardInterrupt):
+        install.install_folder(src, dst)
+    monkeypatch.setattr(install.os, "rename", rename)
+    assert not os.path.exists(dst)
+    assert os.path.isdir(dst + install.OLD_SUFFIX)
+
+
+def test_recover_completes_staged_replacement(tmp_path, copies, monkeypatch):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "resource_packs")
+    write_files(src, NEW_FILES)
+    write_files(dst, OLD_FILES)
+    interrupt_before_staging_rename(monkeypatch, src, dst)
+
+    install.recover_install(dst)
+    assert read_files(dst) == NEW_FILES
+    assert leftovers(dst) == []
+    # 再次安装时不需要复制任何文件
+    del copies[:]
+    install.install_folder(src, dst)
+    assert copies == []
+    assert read_files(dst) == NEW_FILES
+
+
+def test_recover_restores_old_folder_when_staging_incomplete(tmp_path, copies, monkeypatch):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "resource_packs")
+    write_files(src, NEW_FILES)
+    write_files(dst, OLD_FILES)
+    interrupt_before_staging_rename(monkeypatch, src, dst)
+    # 日志中没有完成标记时不能使用暂存目录
+    journal_path = dst + install.JOURNAL_SUFFIX
+    with open(journal_path, "r", encoding="utf-8") as f:
+        lines = [line for line in f if json.loads(line) != install.JOURNAL_COMPLETE]
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    install.recover_install(dst)
+    assert read_files(dst) == OLD_FILES
+    assert not os.path.exists(dst + install.OLD_SUFFIX)
+    # 之后的安装继续使用暂存目录中已完成的文件
+    del copies[:]
+    install.install_folder(src, dst)
+    assert copies == []
+    assert read_files(dst) == NEW_FILES
+    assert leftovers(dst) == []
+
+
+def test_recover_removes_old_folder_after_replacement(tmp_path):
+    dst = str(tmp_path / "resource_packs")
+    write_files(dst, NEW_FILES)
+    write_files(dst + install.OLD_SUFFIX, OLD_FILES)
+    install.recover_install(dst)
+    assert read_files(dst) == NEW_FILES
+    assert leftovers(dst) == []
+
+
+def test_client_switch_with_same_size_files(tmp_path, copies):
+    # 两个客户端的同名文件大小和修改时间都相同，只有内容不同
+    mtime_ns = 1700000000123456789
+    clients = {}
+    for name, fill in (("a", b"A"), ("b", b"B")):
+        clients[name] = {f"pack/f{i}.json": fill * (50 + i) for i in range(5)}
+        clients[name]["pack/shared.json"] = b"same in both clients"
+        write_files(str(tmp_path / name), clients[name], mtime_ns)
+    dst = str(tmp_path / "behavior_packs")
+
+    for i, name in enumerate(("a", "b", "a", "b")):
+        del copies[:]
+        install.install_folder(str(tmp_path / name), dst)
+        assert read_files(dst) == clients[name]
+        # 切换客户端时只有内容相同的文件不复制
+        assert sorted(copies) == sorted(rel_path for rel_path in clients[name]
+                                        if i == 0 or rel_path != "pack/shared.json")
+    # 同一客户端再次安装时不复制任何文件
+    del copies[:]
+    install.install_folder(str(tmp_path / "b"), dst)
+    assert copies == []
+    assert leftovers(dst) == []
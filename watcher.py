@@ -0,0 +1,152 @@
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify 事件（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    """使用 Linux inotify 监视目录树（新建的子目录会自动加入监视）"""
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.watches = {}
+        try:
+            for root in roots:
+                self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, root):
+        for dir_path, _, _ in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "inotify 监视数量达到上限 (fs.inotify.max_user_watches)")
+                continue  # 目录已被删除
+            self.watches[wd] = dir_path
+
+    def read(self, timeout):
+        """
+        等待最多 timeout 秒，返回发生变化的路径集合；
+        事件队列溢出时返回 {None}，表示需要当作全部变化处理
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+                name = data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b"\0")
+                pos += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(None)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                dir_path = self.watches.get(wd)
+                if dir_path is None:
+                    continue
+                path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+                changed.add(path)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录：加入监视，并把其中已有的文件当作变化
+                    self._add_tree(path)
+                    for root, _, names in os.walk(path):
+                        changed.update(os.path.join(root, file_name) for file_name in names)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """定时扫描目录树，比较文件大小和修改时间（不支持 inotify 的平台使用）"""
+
+    def __init__(self, roots, interval=1.0):
+        self.roots = list(roots)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root in self.roots:
+            for dir_path, _, names in os.walk(root):
+                for name in names:
+                    path = os.path.join(dir_path, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        snapshot = self._scan()
+        changed = {path for path, state in snapshot.items() if self.snapshot.get(path) != state}
+        changed.update(path for path in self.snapshot if path not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots, poll_interval=1.0):
+    """Linux 上优先使用 inotify，失败时退回轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用，改用轮询: {e}")
+    return PollingWatcher(roots, poll_interval)
+
+
+def wait_for_changes(watcher, debounce=0.5):
+    """
+    阻塞直到有文件变化，并继续收集直到 debounce 秒内没有新的变化
+    （编辑器保存文件时通常会产生一连串事件）
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.read(None)
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed |= more